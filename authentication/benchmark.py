@@ -0,0 +1,119 @@
+"""
+Login throughput benchmark.
+
+Users sharing one precomputed password hash sign in from concurrent
+threads by posting the login form through the test client, so every
+login goes through the middleware, the login view and one password
+check on the hashing pool. The run reports logins per second, latency
+percentiles and the attempts answered with 429 because the hashing
+queue was full.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from authentication import hashing
+from chat.benchmarking import summarize
+
+User = get_user_model()
+
+
+@dataclass
+class LoginBenchmarkConfig:
+    """Shape of a login benchmark run."""
+    users: int = 200
+    concurrency: int = 32
+    duration: float = 10.0
+    password: str = 'bench-login-password'
+
+
+def create_users(count, prefix, password):
+    """Create users that share one password hash."""
+    encoded = hashing.make_password(password)
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', password=encoded)
+        for i in range(count)
+    ])
+    return [f'{prefix}{i}' for i in range(count)]
+
+
+def delete_users(prefix):
+    User.objects.filter(username__startswith=prefix).delete()
+
+
+def run_login_benchmark(config, usernames):
+    """
+    Log the users in round-robin from `concurrency` threads for
+    `duration` seconds and return a JSON-serializable result dict.
+    """
+    latencies = []
+    rejected = []
+    failed = []
+    lock = threading.Lock()
+    url = reverse('login')
+    deadline = perf_counter() + config.duration
+
+    def worker(offset):
+        client = Client()
+        index = offset
+        try:
+            while perf_counter() < deadline:
+                username = usernames[index % len(usernames)]
+                index += config.concurrency
+                # Every attempt starts a new session, like a new visitor.
+                client.cookies.clear()
+                start = perf_counter()
+                response = client.post(url, {
+                    'username': username,
+                    'password': config.password,
+                })
+                elapsed = perf_counter() - start
+                with lock:
+                    if response.status_code == 302:
+                        latencies.append(elapsed)
+                    elif response.status_code == 429:
+                        rejected.append(elapsed)
+                    else:
+                        failed.append(username)
+        finally:
+            connections.close_all()
+
+    start = perf_counter()
+    # The test client sends requests for the host 'testserver'.
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        with ThreadPoolExecutor(max_workers=config.concurrency) as pool:
+            list(pool.map(worker, range(config.concurrency)))
+    elapsed = perf_counter() - start
+
+    return {
+        'config': {**asdict(config), 'password': None},
+        'hashing': {
+            key: value for key, value in hashing.config().items()
+            if key in ('workers', 'queue_limit')
+        },
+        'logins': len(latencies),
+        'rejected': len(rejected),
+        'failed': len(failed),
+        'logins_per_second': round(len(latencies) / elapsed, 2),
+        'latency': summarize(latencies),
+        'rejected_latency': summarize(rejected),
+    }
+
+
+def prepare_and_run(config, keep_data=False):
+    """Create the users, run the benchmark and clean up."""
+    prefix = f'login{int(time.time())}_'
+    usernames = create_users(config.users, prefix, config.password)
+    try:
+        return run_login_benchmark(config, usernames)
+    finally:
+        if not keep_data:
+            delete_users(prefix)
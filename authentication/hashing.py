@@ -0,0 +1,108 @@
+"""
+Password hashing on a dedicated, bounded thread pool.
+
+Hashing a password is deliberately slow, and a burst of logins or
+registrations would otherwise occupy every thread that serves requests.
+`User.set_password` and `User.check_password` run the hasher on a pool
+of `CHAT_HASHING['workers']` threads instead; at most
+`CHAT_HASHING['queue_limit']` more calls may wait for a thread, and
+calls beyond that raise `HashingBusy`, which `HashingBusyMiddleware`
+answers with 429. The hashers release the GIL while hashing, so threads
+hash in parallel.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from chat import metrics
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def config():
+    return {
+        'workers': os.cpu_count() or 2,
+        'queue_limit': 32,
+        'retry_after': 1,
+        **getattr(settings, 'CHAT_HASHING', {}),
+    }
+
+
+class HashingExecutor:
+    """
+    Thread pool that rejects work once `workers + queue_limit` calls
+    are pending.
+    """
+
+    def __init__(self, workers=None, queue_limit=None):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pool = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def limits(self):
+        options = config()
+        return (
+            self.workers or options['workers'],
+            options['queue_limit'] if self.queue_limit is None else self.queue_limit,
+        )
+
+    def queue_depth(self):
+        """Return the number of calls waiting for a hashing thread."""
+        workers, _ = self.limits()
+        return max(0, self.pending - workers)
+
+    def submit(self, fn, *args):
+        """Schedule a call and return its future, or raise HashingBusy."""
+        workers, queue_limit = self.limits()
+        with self.lock:
+            if self.pending >= workers + queue_limit:
+                metrics.HASHING_REJECTED.inc()
+                raise HashingBusy
+            self.pending += 1
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='password-hashing')
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def run(self, fn, *args):
+        """Run a call on the pool and wait for its result."""
+        return self.submit(fn, *args).result()
+
+
+executor = HashingExecutor()
+
+
+def make_password(password):
+    """Hash a password on the hashing pool."""
+    if password is None:
+        return hashers.make_password(None)
+    return executor.run(hashers.make_password, password)
+
+
+def verify_password(password, encoded):
+    """
+    Check a password on the hashing pool. Return `(valid, must_update)`,
+    where `must_update` tells that the hash uses an outdated hasher or
+    parameters.
+    """
+    return executor.run(hashers.verify_password, password, encoded)
+
+
+metrics.HASHING_QUEUE_DEPTH.set_function(executor.queue_depth)
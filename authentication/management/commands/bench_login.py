@@ -0,0 +1,48 @@
+"""
+Command for benchmarking login throughput.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from authentication.benchmark import LoginBenchmarkConfig, prepare_and_run
+
+
+class Command(BaseCommand):
+    """
+    Log users in through the login view from concurrent threads and
+    report login throughput, latency and rejections by the hashing pool.
+    """
+    help = 'Benchmark login throughput under concurrency.'
+
+    def add_arguments(self, parser):
+        defaults = LoginBenchmarkConfig()
+        parser.add_argument(
+            '--users', type=int, default=defaults.users,
+            help='Users created for the run.')
+        parser.add_argument(
+            '--concurrency', type=int, default=defaults.concurrency,
+            help='Threads logging in at the same time.')
+        parser.add_argument(
+            '--duration', type=float, default=defaults.duration,
+            help='Seconds to keep logging in.')
+        parser.add_argument(
+            '--output',
+            help='Write the JSON results to this file.')
+        parser.add_argument(
+            '--keep-data', action='store_true',
+            help="Don't delete the users created for the run.")
+
+    def handle(self, *args, **options):
+        config = LoginBenchmarkConfig(
+            users=options['users'],
+            concurrency=options['concurrency'],
+            duration=options['duration'],
+        )
+        results = prepare_and_run(config, keep_data=options['keep_data'])
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
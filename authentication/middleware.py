@@ -0,0 +1,25 @@
+"""
+Middleware for authentication.
+"""
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from authentication.hashing import HashingBusy, config
+
+
+class HashingBusyMiddleware(MiddlewareMixin):
+    """
+    Answer requests that found the password hashing queue full with
+    429 Too Many Requests instead of an error page.
+    """
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        response = HttpResponse(
+            'Too many sign-ins in progress, please try again shortly.',
+            status=429,
+            content_type='text/plain; charset=utf-8',
+        )
+        response['Retry-After'] = str(config()['retry_after'])
+        return response
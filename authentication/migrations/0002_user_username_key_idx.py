@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-19 10:56
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking sign-ups on large user tables.
+    atomic = False
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('username', models.TextField())), 'C'), name='user_username_key_idx'),
+        ),
+    ]
@@ -4,11 +4,15 @@ Models for user.
 from django.core import validators
 from django.utils.deconstruct import deconstructible
 from django.db import models
+from django.db.models.functions import Cast, Collate, Upper
 from django.contrib.auth.models import (
     BaseUserManager,
     AbstractBaseUser,
+    PermissionsMixin,
 )
 
+from authentication import hashing
+
 
 @deconstructible
 class UnicodeUsernameValidator(validators.RegexValidator):
@@ -17,6 +21,15 @@ class UnicodeUsernameValidator(validators.RegexValidator):
     flags = 0
 
 
+def username_key():
+    """
+    Case-insensitive sort and search key of usernames. It is indexed
+    with the C collation, so prefix ranges and ordering by the key are
+    both served by the index.
+    """
+    return Collate(Upper(Cast('username', models.TextField())), 'C')
+
+
 class CustomUserManager(BaseUserManager):
     """Custom manager for user model."""
 
@@ -42,12 +55,18 @@ class CustomUserManager(BaseUserManager):
 
         return user
 
+    def create_superuser(self, username, password, **extra_fields):
+        """Create and return a user with every permission."""
+        extra_fields.setdefault('is_staff', True)
+        extra_fields.setdefault('is_superuser', True)
+        return self.create_user(username, password, **extra_fields)
+
     def create(self, username, password, **extra_fields):
         return self.create_user(username, password, **extra_fields)
 
 
-class User(AbstractBaseUser):
-    """User Model."""
+class User(AbstractBaseUser, PermissionsMixin):
+    """User Model. Admin access follows its groups and permissions."""
 
     username_validator = UnicodeUsernameValidator()
 
@@ -75,5 +94,28 @@ class User(AbstractBaseUser):
     USERNAME_FIELD = "username"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            models.Index(username_key(), name='user_username_key_idx'),
+        ]
+
     def __str__(self):
         return self.username
+
+    def set_password(self, raw_password):
+        """Hash the password on the bounded hashing pool."""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Check the password on the bounded hashing pool and rehash it
+        when the stored hash uses an outdated hasher or parameters.
+        """
+        valid, must_update = hashing.verify_password(
+            raw_password, self.password)
+        if valid and must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        return valid
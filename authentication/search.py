@@ -0,0 +1,158 @@
+"""
+Case-insensitive username lookup and prefix search.
+
+Searches are range scans on the indexed `username_key()` expression,
+ordered by the same key, so the database reads at most `limit + 1`
+index entries whatever the number of users. Results are kept in a
+per-process LRU cache of hot prefixes; a cached result that holds every
+match of a prefix also answers all longer prefixes without a query,
+which covers most keystrokes of a user typing a name.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from authentication.models import username_key
+
+
+def config():
+    return {
+        'limit': 10,
+        'cache_size': 10000,
+        'cache_ttl': 30,
+        'debounce_ms': 150,
+        **getattr(settings, 'CHAT_USER_SEARCH', {}),
+    }
+
+
+def normalize(prefix):
+    """Return the search key of a prefix, matching `username_key()`."""
+    return prefix.strip().upper()
+
+
+def _next_key(key):
+    """
+    Return the smallest key greater than every key starting with `key`,
+    or None if there is none because `key` only holds the last code point.
+    """
+    key = key.rstrip(chr(sys.maxunicode))
+    if not key:
+        return None
+    return key[:-1] + chr(ord(key[-1]) + 1)
+
+
+class PrefixCache:
+    """
+    LRU cache of `prefix -> (usernames, complete)`, where `complete`
+    tells that the usernames are every match of the prefix.
+    """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def limits(self):
+        options = config()
+        return self.size or options['cache_size'], self.ttl or options['cache_ttl']
+
+    def get(self, key):
+        """
+        Return the cached result of a key, deriving it from a complete
+        result of a shorter prefix when possible, or None.
+        """
+        _, ttl = self.limits()
+        now = time.monotonic()
+        with self.lock:
+            for length in range(len(key), 0, -1):
+                entry = self.entries.get(key[:length])
+                if entry is None:
+                    continue
+                usernames, complete, stored = entry
+                if now - stored > ttl:
+                    del self.entries[key[:length]]
+                    continue
+                if length == len(key):
+                    self.entries.move_to_end(key)
+                    return usernames, complete
+                if complete:
+                    self.entries.move_to_end(key[:length])
+                    return [
+                        username for username in usernames
+                        if normalize(username).startswith(key)
+                    ], True
+        return None
+
+    def set(self, key, usernames, complete):
+        size, _ = self.limits()
+        with self.lock:
+            self.entries[key] = (usernames, complete, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, username):
+        """Drop the cached prefixes of a new or renamed username."""
+        key = normalize(username)
+        with self.lock:
+            for length in range(1, len(key) + 1):
+                self.entries.pop(key[:length], None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+prefix_cache = PrefixCache()
+
+
+def search_usernames(prefix, limit=None):
+    """
+    Return up to `limit` usernames starting with `prefix`, ignoring
+    case, in case-insensitive order.
+    """
+    limit = limit or config()['limit']
+    key = normalize(prefix)
+    if not key:
+        return []
+
+    cached = prefix_cache.get(key)
+    if cached is not None and (cached[1] or len(cached[0]) >= limit):
+        return cached[0][:limit]
+
+    users = get_user_model().objects.annotate(key=username_key()).filter(
+        key__gte=key, is_active=True)
+    upper = _next_key(key)
+    if upper is not None:
+        users = users.filter(key__lt=upper)
+    usernames = list(
+        users.order_by('key')
+        .values_list('username', flat=True)[:limit + 1]
+    )
+    complete = len(usernames) <= limit
+    prefix_cache.set(key, usernames[:limit], complete)
+    return usernames[:limit]
+
+
+def find_user(username):
+    """
+    Return the user with a username, ignoring case, or None. An exact
+    match wins over users whose names only differ in case.
+    """
+    key = normalize(username or '')
+    if not key:
+        return None
+    candidates = list(
+        get_user_model().objects.annotate(key=username_key())
+        .filter(key=key)
+        .order_by('id')
+    )
+    for user in candidates:
+        if user.username == username:
+            return user
+    return candidates[0] if candidates else None
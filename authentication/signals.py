@@ -0,0 +1,25 @@
+"""
+Signal handlers keeping the username search cache in sync, and reads
+after signing in on the primary database.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from authentication.search import prefix_cache
+from chat import routers
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    """Drop the cached prefixes a new or renamed user now matches."""
+    if created or update_fields is None or 'username' in update_fields:
+        prefix_cache.invalidate(instance.username)
+
+
+@receiver(user_logged_in)
+def user_signed_in(sender, user, **kwargs):
+    """Read the new session's user from the primary for a while."""
+    if routers.replica_configured():
+        routers.pin_user(user.id)
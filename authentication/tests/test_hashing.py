@@ -0,0 +1,129 @@
+"""Tests for the bounded password hashing pool."""
+import threading
+import unittest
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from authentication import hashing
+from authentication.benchmark import (
+    LoginBenchmarkConfig,
+    create_users,
+    prepare_and_run,
+    run_login_benchmark,
+)
+from chat import metrics
+
+try:
+    import argon2
+except ImportError:  # pragma: no cover
+    argon2 = None
+
+User = get_user_model()
+
+
+class HashingExecutorTestCase(SimpleTestCase):
+    """Tests for the hashing executor."""
+
+    def test_rejects_when_queue_is_full(self):
+        """Test that calls beyond workers plus queue limit are rejected."""
+        executor = hashing.HashingExecutor(workers=1, queue_limit=1)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: 'done')
+        rejected = metrics.HASHING_REJECTED.labels().value
+
+        self.assertEqual(executor.queue_depth(), 1)
+        with self.assertRaises(hashing.HashingBusy):
+            executor.submit(lambda: 'rejected')
+        self.assertEqual(metrics.HASHING_REJECTED.labels().value, rejected + 1)
+
+        release.set()
+        running.result()
+        self.assertEqual(queued.result(), 'done')
+        self.assertEqual(executor.pending, 0)
+
+
+class PasswordHashingTestCase(TestCase):
+    """Tests for hashing user passwords on the pool."""
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def _create_md5_user(self):
+        return User.objects.create_user(
+            username='md5user', password='testpassword')
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_outdated_hash_is_upgraded_on_login(self):
+        """Test that logging in rehashes with the preferred hasher."""
+        user = self._create_md5_user()
+        self.assertTrue(user.password.startswith('md5$'))
+
+        self.assertFalse(user.check_password('wrongpassword'))
+        self.assertTrue(user.password.startswith('md5$'))
+        self.assertTrue(user.check_password('testpassword'))
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('testpassword'))
+
+    @unittest.skipIf(argon2 is None, 'argon2-cffi is not installed')
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_argon2_hasher(self):
+        """Test upgrading to Argon2 when it is the preferred hasher."""
+        user = self._create_md5_user()
+
+        self.assertTrue(user.check_password('testpassword'))
+        self.assertTrue(user.password.startswith('argon2$'))
+
+    def test_full_queue_answers_429(self):
+        """Test that a login finding the queue full gets 429."""
+        User.objects.create_user(username='busyuser', password='testpassword')
+
+        with mock.patch.object(
+                hashing.executor, 'submit', side_effect=hashing.HashingBusy):
+            response = self.client.post(reverse('login'), {
+                'username': 'busyuser',
+                'password': 'testpassword',
+            })
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class LoginBenchmarkTestCase(TransactionTestCase):
+    """Tests for the login throughput benchmark."""
+
+    def test_small_run(self):
+        """Test that a short run logs users in and cleans up."""
+        config = LoginBenchmarkConfig(users=4, concurrency=2, duration=0.5)
+
+        results = prepare_and_run(config)
+
+        self.assertGreater(results['logins'], 0)
+        self.assertEqual(results['failed'], 0)
+        self.assertEqual(results['rejected'], 0)
+        self.assertIsNotNone(results['latency']['p99_ms'])
+        self.assertFalse(User.objects.filter(username__startswith='login').exists())
+
+    def test_rejections_are_counted(self):
+        """Test that logins answered with 429 are reported as rejected."""
+        config = LoginBenchmarkConfig(users=2, concurrency=1, duration=0.2)
+        usernames = create_users(config.users, 'busy', config.password)
+
+        with mock.patch.object(
+                hashing.executor, 'submit', side_effect=hashing.HashingBusy):
+            results = run_login_benchmark(config, usernames)
+
+        self.assertEqual(results['logins'], 0)
+        self.assertGreater(results['rejected'], 0)
@@ -0,0 +1,128 @@
+"""Tests for the username search."""
+import asyncio
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import username_key
+from authentication.search import find_user, prefix_cache, search_usernames
+from rooms.models import PersonalChatRoom
+
+User = get_user_model()
+
+
+class UsernameSearchTestCase(TestCase):
+    """Tests for the prefix search and its cache."""
+
+    def setUp(self):
+        prefix_cache.clear()
+        self.addCleanup(prefix_cache.clear)
+        for username in ('alice', 'Alfred', 'albert', 'bob', 'ALINA'):
+            User.objects.create_user(username=username, password='testpassword')
+
+    def test_case_insensitive_prefix(self):
+        """Test that matches ignore case and come in key order."""
+        self.assertEqual(
+            search_usernames('al'), ['albert', 'Alfred', 'alice', 'ALINA'])
+        self.assertEqual(search_usernames('ALI'), ['alice', 'ALINA'])
+        self.assertEqual(search_usernames('  '), [])
+
+    def test_last_code_point(self):
+        """Test that prefixes ending with the last code point are searchable."""
+        self.assertEqual(search_usernames('al\U0010ffff'), [])
+        self.assertEqual(search_usernames('\U0010ffff'), [])
+
+    def test_limit(self):
+        """Test that results are capped at the limit."""
+        self.assertEqual(search_usernames('a', limit=2), ['albert', 'Alfred'])
+
+    def test_longer_prefix_served_from_cache(self):
+        """Test that a complete result answers longer prefixes without a query."""
+        search_usernames('a')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(search_usernames('ali'), ['alice', 'ALINA'])
+            self.assertEqual(search_usernames('alf'), ['Alfred'])
+
+    def test_new_user_invalidates_cache(self):
+        """Test that creating a user drops the prefixes it matches."""
+        search_usernames('ali')
+        User.objects.create_user(username='alison', password='testpassword')
+
+        self.assertEqual(search_usernames('ali'), ['alice', 'ALINA', 'alison'])
+
+    def test_find_user(self):
+        """Test the case-insensitive lookup preferring an exact match."""
+        self.assertEqual(find_user('ALICE').username, 'alice')
+        self.assertIsNone(find_user('carol'))
+
+        User.objects.create_user(username='Alice', password='testpassword')
+        self.assertEqual(find_user('Alice').username, 'Alice')
+
+    def test_search_uses_index(self):
+        """Test that the prefix query is a range scan on the key index."""
+        query = (
+            User.objects.annotate(key=username_key())
+            .filter(key__gte='AL', key__lt='AM').order_by('key')
+            .values_list('username', flat=True)[:11]
+        )
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('user_username_key_idx', plan)
+
+
+class UserSearchViewTestCase(TestCase):
+    """Tests for the autocomplete endpoint and the friend form."""
+
+    def setUp(self):
+        prefix_cache.clear()
+        self.addCleanup(prefix_cache.clear)
+        self.user = User.objects.create_user(
+            username='alex', password='testpassword')
+        self.friend = User.objects.create_user(
+            username='Alexandra', password='testpassword')
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('user-search'), {'q': 'al'})
+
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(CHAT_USER_SEARCH={'debounce_ms': 0})
+    def test_excludes_own_username(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('user-search'), {'q': 'AL'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'query': 'AL', 'results': ['Alexandra']})
+
+    @override_settings(CHAT_USER_SEARCH={'debounce_ms': 50})
+    async def test_superseded_request_is_dropped(self):
+        """Test that only the latest of overlapping requests is answered."""
+        await self.async_client.aforce_login(self.user)
+        url = reverse('user-search')
+
+        first = asyncio.ensure_future(self.async_client.get(url, {'q': 'a'}))
+        await asyncio.sleep(0.01)
+        second = await self.async_client.get(url, {'q': 'ale'})
+
+        self.assertEqual((await first).status_code, 204)
+        self.assertEqual(second.json()['results'], ['Alexandra'])
+
+    def test_start_chat_ignores_case(self):
+        """Test that a friend can be found with a different case."""
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('index'), {'friend': 'ALEXANDRA'})
+
+        chat = PersonalChatRoom.objects.get(participants=self.user)
+        self.assertRedirects(
+            response, reverse('personal-chat', args=[chat.id]),
+            fetch_redirect_response=False)
+        self.assertTrue(chat.participants.filter(id=self.friend.id).exists())
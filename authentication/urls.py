@@ -7,11 +7,13 @@ from django.urls import path
 from authentication.views import (
     CustomLoginView,
     CustomLogOutView,
-    RegisterView
+    RegisterView,
+    UserSearchView,
 )
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', CustomLoginView.as_view(), name='login'),
     path('logout/', CustomLogOutView.as_view(), name='logout'),
+    path('users/search/', UserSearchView.as_view(), name='user-search'),
 ]
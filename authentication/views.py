@@ -1,10 +1,17 @@
 """
 Views for authentication.
 """
+import asyncio
+import uuid
 
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
 from django.urls import reverse_lazy
 from django.views.generic import (
-    CreateView
+    CreateView,
+    View,
 )
 from django.contrib.auth.views import (
     LoginView,
@@ -15,6 +22,7 @@ from authentication.forms import (
     CustomAuthenticationForm,
     CustomUserCreationForm
 )
+from authentication.search import config, search_usernames
 
 
 class RegisterView(CreateView):
@@ -38,3 +46,39 @@ class CustomLoginView(LoginView):
 class CustomLogOutView(LogoutView):
     """Log out url for users.."""
     next_page = reverse_lazy('index')
+
+
+class UserSearchView(View):
+    """
+    Username autocomplete for signed-in users.
+
+    Each request waits `debounce_ms` before searching. A request
+    superseded by a newer one of the same user in that time is answered
+    with 204 and never reaches the database, so clients can send one
+    request per keystroke. The user's latest request is kept in the
+    cache, so this holds across workers too.
+    """
+
+    async def get(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=403)
+
+        options = config()
+        query = request.GET.get('q', '')[:30]
+        if options['debounce_ms']:
+            key = f'user-search:{user.id}'
+            token = uuid.uuid4().hex
+            await cache.aset(key, token, timeout=60)
+            await asyncio.sleep(options['debounce_ms'] / 1000)
+            if await cache.aget(key) != token:
+                return HttpResponse(status=204)
+        # One extra result makes up for leaving out the user's own name.
+        usernames = await sync_to_async(search_usernames)(
+            query, options['limit'] + 1)
+
+        results = [name for name in usernames if name != user.username]
+        return JsonResponse({
+            'query': query,
+            'results': results[:options['limit']],
+        })
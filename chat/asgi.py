@@ -3,26 +3,30 @@ Asgi configuration for project using websockets.
 """
 import os
 
-from channels.routing import (
-    ProtocolTypeRouter,
-    URLRouter,
-)
-from channels.auth import AuthMiddlewareStack
-from channels.security.websocket import AllowedHostsOriginValidator
-
 from django.core.asgi import get_asgi_application
 
-from rooms.routing import websocket_urlpatterns
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat.settings')
 
+# Set up Django before importing anything that loads models, like the
+# auth middleware and the consumers.
 django_asgi_application = get_asgi_application()
 
+from channels.routing import ProtocolTypeRouter  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+
+from chat import compression  # noqa: E402
+from chat.metrics import MetricsMiddleware  # noqa: E402
+from chat.staticfiles import StaticFilesMiddleware  # noqa: E402
+from rooms.routing import websocket_application  # noqa: E402
+
+compression.install()
+
 application = ProtocolTypeRouter({
-    'http': django_asgi_application,
-    'websocket': AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)
-        ),
-    )
+    'http': MetricsMiddleware(
+        StaticFilesMiddleware(django_asgi_application),
+        path=settings.METRICS_PATH,
+        allowed_networks=settings.METRICS_ALLOWED_NETWORKS,
+    ),
+    'websocket': websocket_application(),
 })
@@ -0,0 +1,23 @@
+"""
+Helpers shared by the benchmark commands.
+"""
+
+
+def percentile(values, q):
+    """
+    Return the q-th percentile (0-100) of values using the nearest rank.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    """Return p50/p95/p99/max of a list of seconds, in milliseconds."""
+    result = {'count': len(values)}
+    for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+        value = percentile(values, q)
+        result[f'{name}_ms'] = round(value * 1000, 3) if value is not None else None
+    return result
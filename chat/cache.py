@@ -0,0 +1,307 @@
+"""
+Two-tier cache backend: a bounded in-process LRU in front of Redis.
+
+`TwoTierCache` is Django's Redis backend with reads served from a
+per-process `LocalTier` when it holds the key. Django makes a backend
+per thread; the local tier is shared by all of them. It keeps the raw
+Redis values, so every hit unpickles a fresh copy, and evicts the least
+recently used entries above `local_max_entries` or `local_max_bytes`.
+A local copy expires with the Redis key or after `local_timeout`
+seconds, whichever comes first.
+
+Every write (set, add, delete, incr, touch, clear) publishes the written
+keys on the `channel` pub/sub channel after writing them to Redis. Each
+process subscribes from a daemon thread and drops those keys from its
+tier. A value read from Redis is only kept locally if no invalidation
+arrived while it was read, so a read racing a write can't leave a stale
+copy behind. While the subscription is down the local tier is emptied
+and bypassed, and every read goes to Redis.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+import redis
+
+from chat import metrics
+
+LOCAL_DEFAULTS = {
+    'local_max_entries': 10000,
+    'local_max_bytes': 64 * 1024 * 1024,
+    'local_timeout': 60,
+    'channel': 'chat-cache:invalidate',
+}
+RETRY_INTERVAL = 1.0
+_MISSING = object()
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """
+    Per-process LRU of raw cached values, kept coherent with the other
+    processes by a subscription to the invalidation channel.
+    """
+
+    def __init__(self, max_entries, max_bytes, timeout):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.origin = uuid.uuid4().hex
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.listening = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self, key):
+        """Return the raw value of a key, or None."""
+        if not self.listening.is_set():
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                metrics.CACHE_LOOKUPS.labels('local', 'miss').inc()
+                return None
+            expires, data = entry
+            if expires <= time.monotonic():
+                self._remove(key, 'expired')
+                metrics.CACHE_LOOKUPS.labels('local', 'miss').inc()
+                return None
+            self.entries.move_to_end(key)
+        metrics.CACHE_LOOKUPS.labels('local', 'hit').inc()
+        return data
+
+    def put(self, key, data, ttl, generation):
+        """
+        Keep the raw value of a key read from Redis, with `ttl` seconds
+        left there or None, unless keys were invalidated since
+        `generation`.
+        """
+        if not isinstance(data, bytes) or len(data) > self.max_bytes:
+            return
+        timeout = self.timeout if ttl is None else min(self.timeout, ttl)
+        if timeout <= 0:
+            return
+        with self.lock:
+            if generation != self.generation or not self.listening.is_set():
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + timeout, data)
+            self.size += len(data)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)), 'capacity')
+        metrics.CACHE_LOCAL_BYTES.set(self.size)
+
+    def invalidate(self, keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                if key in self.entries:
+                    self._remove(key, 'invalidated')
+        metrics.CACHE_LOCAL_BYTES.set(self.size)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            if self.entries:
+                metrics.CACHE_EVICTIONS.labels('invalidated').inc(len(self.entries))
+            self.entries.clear()
+            self.size = 0
+        metrics.CACHE_LOCAL_BYTES.set(0)
+
+    def _remove(self, key, reason=None):
+        _, data = self.entries.pop(key)
+        self.size -= len(data)
+        if reason is not None:
+            metrics.CACHE_EVICTIONS.labels(reason).inc()
+
+    def message(self, keys):
+        """Return the invalidation of `keys`, or of every key for None."""
+        return json.dumps({'origin': self.origin, 'keys': keys})
+
+    def receive(self, data):
+        message = json.loads(data)
+        if message['origin'] == self.origin:
+            return
+        if message['keys'] is None:
+            self.clear()
+        else:
+            self.invalidate(message['keys'])
+
+    def start(self, client, channel):
+        """Subscribe to the invalidations of `channel` from a thread."""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self._listen, args=(client, channel),
+                name='cache-invalidation', daemon=True)
+        self.thread.start()
+
+    def _listen(self, client, channel):
+        while True:
+            pubsub = client.pubsub()
+            try:
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # Only invalidations from now on are received.
+                        self.listening.set()
+                    elif message['type'] == 'message':
+                        self.receive(message['data'])
+            except (redis.RedisError, ValueError, KeyError):
+                pass
+            finally:
+                self.listening.clear()
+                self.clear()
+                pubsub.close()
+            time.sleep(RETRY_INTERVAL)
+
+
+def shared_tier(servers, channel, max_entries, max_bytes, timeout):
+    """Return the local tier of the process for a Redis channel."""
+    key = (tuple(servers), channel)
+    with _tiers_lock:
+        tier = _tiers.get(key)
+        if tier is None:
+            tier = _tiers[key] = LocalTier(max_entries, max_bytes, timeout)
+        return tier
+
+
+class TwoTierCacheClient(RedisCacheClient):
+    """Redis cache client reading through a `LocalTier`."""
+
+    def __init__(self, servers, local_max_entries=None, local_max_bytes=None,
+                 local_timeout=None, channel=None, **options):
+        super().__init__(servers, **options)
+        self.channel = channel or LOCAL_DEFAULTS['channel']
+        self.local = shared_tier(
+            servers, self.channel,
+            local_max_entries or LOCAL_DEFAULTS['local_max_entries'],
+            local_max_bytes or LOCAL_DEFAULTS['local_max_bytes'],
+            LOCAL_DEFAULTS['local_timeout'] if local_timeout is None else local_timeout,
+        )
+        self.local.start(self.get_client(write=True), self.channel)
+
+    def get_local(self, key, default):
+        data = self.local.get(key)
+        return default if data is None else self._serializer.loads(data)
+
+    def get(self, key, default):
+        value = self.get_local(key, _MISSING)
+        if value is _MISSING:
+            return self.get_remote(key, default)
+        return value
+
+    def get_remote(self, key, default):
+        generation = self.local.generation
+        pipeline = self.get_client(key).pipeline(transaction=False)
+        data, ttl = pipeline.get(key).pttl(key).execute()
+        if data is None:
+            metrics.CACHE_LOOKUPS.labels('redis', 'miss').inc()
+            return default
+        metrics.CACHE_LOOKUPS.labels('redis', 'hit').inc()
+        self.local.put(key, data, ttl / 1000 if ttl >= 0 else None, generation)
+        return self._serializer.loads(data)
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            data = self.local.get(key)
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = self._serializer.loads(data)
+        if not missing:
+            return found
+        generation = self.local.generation
+        pipeline = self.get_client(None).pipeline(transaction=False)
+        pipeline.mget(missing)
+        for key in missing:
+            pipeline.pttl(key)
+        values, *ttls = pipeline.execute()
+        for key, data, ttl in zip(missing, values, ttls):
+            if data is None:
+                metrics.CACHE_LOOKUPS.labels('redis', 'miss').inc()
+                continue
+            metrics.CACHE_LOOKUPS.labels('redis', 'hit').inc()
+            self.local.put(key, data, ttl / 1000 if ttl >= 0 else None, generation)
+            found[key] = self._serializer.loads(data)
+        return found
+
+    def invalidate(self, keys):
+        """Drop `keys`, or every key for None, from every local tier."""
+        if keys is None:
+            self.local.clear()
+        else:
+            self.local.invalidate(keys)
+        self.get_client(write=True).publish(self.channel, self.local.message(keys))
+
+    def add(self, key, value, timeout):
+        added = super().add(key, value, timeout)
+        if added:
+            self.invalidate([key])
+        return added
+
+    def set(self, key, value, timeout):
+        super().set(key, value, timeout)
+        self.invalidate([key])
+
+    def touch(self, key, timeout):
+        touched = super().touch(key, timeout)
+        self.invalidate([key])
+        return touched
+
+    def delete(self, key):
+        deleted = super().delete(key)
+        self.invalidate([key])
+        return deleted
+
+    def incr(self, key, delta):
+        value = super().incr(key, delta)
+        self.invalidate([key])
+        return value
+
+    def set_many(self, data, timeout):
+        super().set_many(data, timeout)
+        self.invalidate(list(data))
+
+    def delete_many(self, keys):
+        super().delete_many(keys)
+        self.invalidate(list(keys))
+
+    def clear(self):
+        cleared = super().clear()
+        self.invalidate(None)
+        return cleared
+
+
+class TwoTierCache(RedisCache):
+    """
+    Django's Redis cache backend with an in-process tier. OPTIONS take
+    `local_max_entries`, `local_max_bytes`, `local_timeout` and the
+    invalidation `channel` on top of the Redis client options.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = TwoTierCacheClient
+
+    async def aget(self, key, default=None, version=None):
+        # Local hits are answered on the event loop, without a thread hop.
+        key = self.make_and_validate_key(key, version=version)
+        value = self._cache.get_local(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        return await sync_to_async(self._cache.get_remote)(key, default)
@@ -0,0 +1,55 @@
+"""
+permessage-deflate compression of the WebSocket connections served by
+Daphne.
+
+Daphne never negotiates WebSocket compression. When
+`CHAT_WS_COMPRESSION['enabled']` is set, `install()` makes its
+WebSocket factory accept permessage-deflate offers with the context
+settings of CHAT_WS_COMPRESSION, which bound the zlib memory kept per
+connection, and leaves frames below `threshold` bytes uncompressed:
+pings, typing and user count frames hardly shrink and each would still
+cost a deflate call. With context takeover, chat message frames shrink
+several times over since they repeat the keys and names of the frames
+before them.
+
+The Daphne classes live in `chat.daphne_compression`, which is only
+imported once compression is enabled under Daphne: twisted and
+autobahn take a while to import.
+"""
+import sys
+
+from django.conf import settings
+
+
+def config():
+    return {
+        'enabled': False,
+        'threshold': 128,
+        'window_bits': 12,
+        'mem_level': 5,
+        'client_window_bits': 12,
+        'no_context_takeover': False,
+        'max_message_size': 1024 * 1024,
+        **getattr(settings, 'CHAT_WS_COMPRESSION', {}),
+    }
+
+
+def context_memory(window_bits, mem_level):
+    """
+    Return the approximate bytes zlib allocates for a deflate context,
+    which a connection keeps between messages unless context takeover
+    is disabled.
+    """
+    return (1 << (window_bits + 2)) + (1 << (mem_level + 9))
+
+
+def install():
+    """
+    Make Daphne negotiate compression, if enabled. Does nothing when the
+    application is served by another server.
+    """
+    server = sys.modules.get('daphne.server')
+    if server is None or not config()['enabled']:
+        return
+    from chat.daphne_compression import CompressingWebSocketFactory
+    server.WebSocketFactory = CompressingWebSocketFactory
@@ -0,0 +1,62 @@
+"""
+Daphne's WebSocket factory with permessage-deflate, see
+`chat.compression`. Imported by `chat.compression.install()` only, so
+workers that don't compress never load twisted and autobahn.
+"""
+from autobahn.websocket.compress import (
+    PerMessageDeflateOffer,
+    PerMessageDeflateOfferAccept,
+)
+from daphne.ws_protocol import WebSocketFactory, WebSocketProtocol
+
+from chat import metrics
+from chat.compression import config
+
+
+def accept(offers):
+    """
+    Accept the first permessage-deflate offer of a client with the
+    configured context settings, or return None to go uncompressed.
+    """
+    options = config()
+    for offer in offers:
+        if not isinstance(offer, PerMessageDeflateOffer):
+            continue
+        window_bits = options['window_bits']
+        if offer.request_max_window_bits:
+            window_bits = min(window_bits, offer.request_max_window_bits)
+        return PerMessageDeflateOfferAccept(
+            offer,
+            request_max_window_bits=(
+                options['client_window_bits'] if offer.accept_max_window_bits else 0),
+            no_context_takeover=(
+                options['no_context_takeover'] or offer.request_no_context_takeover),
+            window_bits=window_bits,
+            mem_level=options['mem_level'],
+            max_message_size=options['max_message_size'],
+        )
+    return None
+
+
+class CompressingWebSocketProtocol(WebSocketProtocol):
+    """Daphne protocol that only compresses frames above the threshold."""
+
+    def sendMessage(self, payload, isBinary=False, fragmentSize=None,
+                    sync=False, doNotCompress=False):
+        if self._perMessageCompress is not None:
+            if doNotCompress or len(payload) < self.factory.threshold:
+                doNotCompress = True
+                metrics.WS_FRAMES_COMPRESSED.labels('skipped').inc()
+            else:
+                metrics.WS_FRAMES_COMPRESSED.labels('compressed').inc()
+        super().sendMessage(payload, isBinary, fragmentSize, sync, doNotCompress)
+
+
+class CompressingWebSocketFactory(WebSocketFactory):
+    """Daphne factory that negotiates permessage-deflate."""
+    protocol = CompressingWebSocketProtocol
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = config()['threshold']
+        self.setProtocolOptions(perMessageCompressionAccept=accept)
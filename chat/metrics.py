@@ -0,0 +1,417 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Metrics are plain python objects updated from the event loop, so recording
+a sample costs a dict lookup and an addition. The text exposition is only
+built when the metrics route is scraped.
+"""
+import ipaddress
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _escape(value):
+    """Escape a label value for the text exposition format."""
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    """Render a label set like `{consumer="x",room="y"}`."""
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Registry:
+    """Collection of metrics rendered together on scrape."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Return every registered metric in the Prometheus text format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """Base class for metrics with an optional set of labels."""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """
+        Return the child metric for the given label values, creating
+        it on first use.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f'{self.name} expects labels {self.labelnames}')
+            child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """Drop the child for the given label values."""
+        self._children.pop(tuple(str(v) for v in values), None)
+
+    def _default_child(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class _ValueChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}{labels} {_format_value(child.value)}'
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down. A gauge can also read its value
+    from a callable at scrape time with `set_function`.
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child().dec(amount)
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def set_function(self, function):
+        """Compute the (unlabelled) value by calling `function` on scrape."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            yield f'{self.name} {_format_value(self._function())}'
+            return
+        for key, child in list(self._children.items()):
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}{labels} {_format_value(child.value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            bounds = self.buckets + (float('inf'),)
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames, key, (('le', _format_value(bound)),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_count{labels} {cumulative}'
+            yield f'{self.name}_sum{labels} {_format_value(child.sum)}'
+
+
+def _executor_queue_depth(executor):
+    queue = getattr(executor, '_work_queue', None)
+    return queue.qsize() if queue is not None else 0
+
+
+def threadpool_queue_depth():
+    """
+    Number of sync calls (ORM queries, sync views) waiting for a thread
+    in the executors used by asgiref's `sync_to_async`.
+    """
+    executors = [SyncToAsync.single_thread_executor]
+    executors.extend(list(SyncToAsync.context_to_thread_executor.values()))
+    return sum(
+        _executor_queue_depth(e) for e in executors
+        if isinstance(e, ThreadPoolExecutor)
+    )
+
+
+ACTIVE_CONNECTIONS = Gauge(
+    'chat_active_connections',
+    'Open WebSocket connections per room kind.',
+    ('kind',),
+)
+MESSAGES_RECEIVED = Counter(
+    'chat_messages_received_total',
+    'Frames received from WebSocket clients.',
+    ('consumer',),
+)
+MESSAGES_SENT = Counter(
+    'chat_messages_sent_total',
+    'Frames sent to WebSocket clients.',
+    ('consumer',),
+)
+GROUP_SEND_SECONDS = Histogram(
+    'chat_group_send_seconds',
+    'Latency of channel layer group_send calls.',
+    ('consumer',),
+)
+DB_WRITE_SECONDS = Histogram(
+    'chat_db_write_seconds',
+    'Latency of the message insert in PersonalChatConsumer.receive.',
+)
+HANDLER_SECONDS = Histogram(
+    'chat_handler_seconds',
+    'Consumer handler durations, recorded while profiling is enabled.',
+    ('consumer', 'handler'),
+)
+FANOUT_SECONDS = Histogram(
+    'chat_fanout_seconds',
+    'Time from a message broadcast to its delivery to a recipient consumer.',
+    ('kind', 'node'),
+)
+DELIVERY_SECONDS = Histogram(
+    'chat_delivery_seconds',
+    'Time from a message reaching the server to the recipient client ack.',
+    ('kind', 'node'),
+)
+CONNECTIONS_REAPED = Counter(
+    'chat_connections_reaped_total',
+    'Connections closed by the server after missing heartbeats.',
+    ('consumer',),
+)
+GROUP_MEMBERS_SWEPT = Counter(
+    'chat_group_members_swept_total',
+    'Stale channel names removed from channel layer groups.',
+)
+TYPING_EVENTS = Counter(
+    'chat_typing_events_total',
+    'Typing frames from clients, by whether they were broadcast or throttled.',
+    ('consumer', 'result'),
+)
+HASHING_QUEUE_DEPTH = Gauge(
+    'chat_password_hashing_queue_depth',
+    'Password hashing calls waiting for a hashing thread.',
+)
+HASHING_REJECTED = Counter(
+    'chat_password_hashing_rejected_total',
+    'Password hashing calls rejected because the hashing queue was full.',
+)
+ATTACHMENT_BYTES = Counter(
+    'chat_attachment_bytes_received_total',
+    'Attachment bytes received in upload chunks.',
+)
+ATTACHMENT_UPLOADS = Counter(
+    'chat_attachment_uploads_total',
+    'Attachment uploads, by whether they completed or were rejected.',
+    ('result',),
+)
+WS_FRAMES_COMPRESSED = Counter(
+    'chat_ws_frames_compressed_total',
+    'Frames sent on compressed connections, by whether they were compressed '
+    'or skipped for being below the threshold.',
+    ('result',),
+)
+MESSAGE_CHANGES = Counter(
+    'chat_message_changes_total',
+    'Personal chat messages edited or deleted, and changes refused.',
+    ('result',),
+)
+NOTICES_SENT = Counter(
+    'chat_notices_sent_total',
+    'Notices of new personal chat messages sent to user groups.',
+)
+DIRECTORY_DELTAS = Counter(
+    'chat_directory_deltas_total',
+    'Room occupancy deltas added to the public room directory.',
+)
+DIRECTORY_ROOMS = Gauge(
+    'chat_directory_rooms',
+    'Rooms in the latest public room directory snapshot of this worker.',
+)
+DIRECTORY_ERRORS = Counter(
+    'chat_directory_errors_total',
+    'Public room directory flushes that failed to reach Redis.',
+)
+REPLICA_LAG_SECONDS = Gauge(
+    'chat_db_replica_lag_seconds',
+    'Replay lag of the read replica at its last check.',
+)
+REPLICA_FALLBACKS = Counter(
+    'chat_db_replica_fallbacks_total',
+    'Reads routed to the primary instead of the replica, by reason.',
+    ('reason',),
+)
+CACHE_LOOKUPS = Counter(
+    'chat_cache_lookups_total',
+    'Cache lookups by tier (local or redis) and result.',
+    ('tier', 'result'),
+)
+CACHE_EVICTIONS = Counter(
+    'chat_cache_local_evictions_total',
+    'Entries dropped from the in-process cache tier, by reason.',
+    ('reason',),
+)
+CACHE_LOCAL_BYTES = Gauge(
+    'chat_cache_local_bytes',
+    'Bytes of values held in the in-process cache tier.',
+)
+USERS_COUNT_ROOMS = Gauge(
+    'chat_users_count_rooms',
+    'Rooms tracked in PublicRoomConsumer.users_count.',
+)
+THREADPOOL_QUEUE_DEPTH = Gauge(
+    'chat_threadpool_queue_depth',
+    'Sync calls queued for a sync_to_async worker thread.',
+)
+THREADPOOL_QUEUE_DEPTH.set_function(threadpool_queue_depth)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware answering `GET <path>` with the metrics exposition
+    and passing every other request to the wrapped application. Only
+    clients in `allowed_networks` that didn't come through a proxy may
+    read the metrics; others get 403.
+    """
+
+    def __init__(self, inner, path='/metrics', registry=REGISTRY,
+                 allowed_networks=('127.0.0.0/8', '::1/128')):
+        self.inner = inner
+        self.path = path
+        self.registry = registry
+        self.allowed_networks = [
+            ipaddress.ip_network(network.strip())
+            for network in allowed_networks if network.strip()
+        ]
+
+    def allowed(self, scope):
+        """Tell whether the client of a request may read the metrics."""
+        if any(key == b'x-forwarded-for' for key, _ in scope.get('headers', [])):
+            return False
+        client = scope.get('client')
+        if not client:
+            return False
+        try:
+            address = ipaddress.ip_address(client[0])
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.inner(scope, receive, send)
+
+        if not self.allowed(scope):
+            status, body = 403, b''
+        elif scope['method'] not in ('GET', 'HEAD'):
+            status, body = 405, b''
+        else:
+            status, body = 200, self.registry.render().encode()
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', CONTENT_TYPE.encode()),
+                (b'content-length', str(len(body)).encode()),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': body if scope['method'] == 'GET' else b'',
+        })
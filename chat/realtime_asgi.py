@@ -0,0 +1,43 @@
+"""
+Asgi configuration for realtime workers, which only serve websockets.
+
+Run with `daphne chat.realtime_asgi:application`. It uses the slim
+`chat.realtime_settings` and doesn't build Django's HTTP handler, so a
+worker starts without the admin, the views and their middleware. Plain
+HTTP requests other than the metrics route are answered with 404.
+"""
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat.realtime_settings')
+django.setup(set_prefix=False)
+
+from channels.routing import ProtocolTypeRouter  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+
+from chat import compression  # noqa: E402
+from chat.metrics import MetricsMiddleware  # noqa: E402
+from rooms.routing import websocket_application  # noqa: E402
+
+
+async def not_found(scope, receive, send):
+    await send({
+        'type': 'http.response.start',
+        'status': 404,
+        'headers': [(b'content-type', b'text/plain')],
+    })
+    await send({'type': 'http.response.body', 'body': b'Not Found'})
+
+
+compression.install()
+
+application = ProtocolTypeRouter({
+    'http': MetricsMiddleware(
+        not_found,
+        path=settings.METRICS_PATH,
+        allowed_networks=settings.METRICS_ALLOWED_NETWORKS,
+    ),
+    'websocket': websocket_application(),
+})
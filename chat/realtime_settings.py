@@ -0,0 +1,22 @@
+"""
+Django settings for realtime workers, served by `chat.realtime_asgi`.
+
+The project settings with only the apps the websocket consumers need:
+no admin, messages or static files apps, and no HTTP middleware. Their
+modules aren't imported when a worker starts.
+"""
+from chat.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'channels',
+    'authentication',
+    'rooms',
+]
+
+MIDDLEWARE = []
+
+# Only used to build attachment links; the admin routes need its app.
+ROOT_URLCONF = 'chat.realtime_urls'
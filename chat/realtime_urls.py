@@ -0,0 +1,9 @@
+"""
+Urls known to realtime workers, for reversing links in websocket frames.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('', include('authentication.urls')),
+    path('', include('rooms.urls'))
+]
@@ -0,0 +1,267 @@
+"""
+Routing of reads to an optional read replica.
+
+When DATABASES has the CHAT_DB_REPLICA alias, `ReplicaRouter` sends
+the reads of the configured apps there and every write to the primary.
+Reads stay on the primary:
+
+- inside a transaction on the primary, so they see its writes;
+- while the context is pinned: for the rest of a request that isn't a
+  GET or HEAD, and for `sticky_seconds` after a write to the configured
+  apps. Those writes also pin the user bound to the context in the
+  cache, so the user's next requests and connections read their own
+  writes from the primary even on other workers;
+- while the replica lags more than `max_lag` seconds, or can't be
+  reached. The lag is checked at most every `lag_check_interval`
+  seconds per process.
+
+`ReplicaRoutingMiddleware` binds requests to their session's user;
+consumers bind themselves with `abind_user`.
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from chat import metrics
+
+LAG_SQL = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() '
+    'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+    'END'
+)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_user_id = ContextVar('replica_user_id', default=None)
+_pinned_until = ContextVar('replica_pinned_until', default=0.0)
+
+
+def config():
+    return {
+        'alias': 'replica',
+        'apps': ['authentication', 'rooms'],
+        'sticky_seconds': 5,
+        'max_lag': 2.0,
+        'lag_check_interval': 1.0,
+        **getattr(settings, 'CHAT_DB_REPLICA', {}),
+    }
+
+
+def replica_configured():
+    return config()['alias'] in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def pin(seconds=None):
+    """Read from the primary in this context, for `seconds` or for good."""
+    until = float('inf') if seconds is None else time.monotonic() + seconds
+    if until > _pinned_until.get():
+        _pinned_until.set(until)
+
+
+def pinned():
+    return _pinned_until.get() > time.monotonic()
+
+
+class UserPins:
+    """
+    Pins of users to the primary, shared through the cache. A process
+    refreshes a user's pin at most every half sticky window, so pins
+    live for one and a half windows: a write skipped by the throttle
+    is still covered for a full window.
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.refreshed = {}
+
+    def add(self, user_id):
+        seconds = config()['sticky_seconds']
+        now = time.monotonic()
+        if now - self.refreshed.get(user_id, float('-inf')) < seconds / 2:
+            return
+        if len(self.refreshed) >= self.max_users:
+            self.refreshed.clear()
+        self.refreshed[user_id] = now
+        cache.set(_pin_key(user_id), True, timeout=seconds * 1.5)
+
+    def forget(self, user_id):
+        self.refreshed.pop(user_id, None)
+
+
+user_pins = UserPins()
+
+
+def record_write():
+    """Pin this context and the bound user after a write."""
+    seconds = config()['sticky_seconds']
+    pin(seconds)
+    user_id = _user_id.get()
+    if user_id is not None:
+        user_pins.add(user_id)
+
+
+def pin_user(user_id):
+    """Pin a user's reads to the primary, e.g. right after signing in."""
+    user_pins.forget(user_id)
+    user_pins.add(user_id)
+
+
+def bind_user(user_id):
+    """
+    Bind the current context to a user, pinning it if the user wrote
+    recently. Return the token to reset the binding with.
+    """
+    token = _user_id.set(user_id)
+    if user_id is not None and cache.get(_pin_key(user_id)):
+        pin(config()['sticky_seconds'])
+    return token
+
+
+async def abind_user(user_id):
+    """Like `bind_user`, from async code."""
+    _user_id.set(user_id)
+    if user_id is not None and await cache.aget(_pin_key(user_id)):
+        pin(config()['sticky_seconds'])
+
+
+def replica_lag(alias):
+    """
+    Return the replay lag of a database in seconds, 0 for one that
+    isn't a standby, or None if it can't be queried.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        return None
+
+
+class LagGuard:
+    """Per-process view of whether the replica is fresh enough to read."""
+
+    def __init__(self):
+        self.checks = {}
+
+    def healthy(self, alias):
+        options = config()
+        now = time.monotonic()
+        checked_at, healthy = self.checks.get(alias, (None, False))
+        if checked_at is not None and now - checked_at < options['lag_check_interval']:
+            return healthy
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # No queries on the event loop; keep the last known state.
+            return healthy
+        lag = replica_lag(alias)
+        healthy = lag is not None and lag <= options['max_lag']
+        if lag is not None:
+            metrics.REPLICA_LAG_SECONDS.set(lag)
+        self.checks[alias] = (now, healthy)
+        return healthy
+
+
+lag_guard = LagGuard()
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads to the replica when they can't miss a
+    recent write.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_configured():
+            return None
+        options = config()
+        if model._meta.app_label not in options['apps']:
+            return None
+        if pinned():
+            reason = 'pinned'
+        elif connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            reason = 'transaction'
+        elif not lag_guard.healthy(options['alias']):
+            reason = 'lag'
+        else:
+            return options['alias']
+        metrics.REPLICA_FALLBACKS.labels(reason).inc()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not replica_configured():
+            return None
+        # Writes to other apps, e.g. sessions, don't affect routed reads.
+        if model._meta.app_label in config()['apps']:
+            record_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, config()['alias']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == config()['alias']:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Bind each request to its session's user, and read from the primary
+    for the whole of requests that may write. Async views are served on
+    the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_configured():
+            return self.get_response(request)
+        pin_token = _pinned_until.set(_pinned_until.get())
+        user_token = bind_user(request.session.get(SESSION_KEY))
+        if request.method not in SAFE_METHODS:
+            pin()
+        try:
+            return self.get_response(request)
+        finally:
+            _pinned_until.reset(pin_token)
+            _user_id.reset(user_token)
+
+    async def __acall__(self, request):
+        if not replica_configured():
+            return await self.get_response(request)
+        # The session may have to be loaded from the database.
+        user_id = await sync_to_async(request.session.get)(SESSION_KEY)
+        pin_token = _pinned_until.set(_pinned_until.get())
+        user_token = _user_id.set(None)
+        await abind_user(user_id)
+        if request.method not in SAFE_METHODS:
+            pin()
+        try:
+            return await self.get_response(request)
+        finally:
+            _pinned_until.reset(pin_token)
+            _user_id.reset(user_token)
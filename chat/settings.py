@@ -42,8 +42,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'chat.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'authentication.middleware.HashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'chat.urls'
@@ -79,6 +81,20 @@ DATABASES = {
     }
 }
 
+# Optional read replica, used by chat.routers.ReplicaRouter. Tests read
+# the primary through it, as a replica would mirror it.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'HOST': os.environ.get('DB_REPLICA_HOST', os.environ.get('DB_HOST')),
+        'NAME': os.environ.get('DB_REPLICA_NAME', os.environ.get('DB_NAME')),
+        'USER': os.environ.get('DB_REPLICA_USER', os.environ.get('DB_USER')),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASS', os.environ.get('DB_PASS')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['chat.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -98,6 +114,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Argon2 becomes the preferred hasher with CHAT_PASSWORD_HASHER=argon2.
+# Hashes made with the other hashers are upgraded on the next login.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('CHAT_PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(
+        0, PASSWORD_HASHERS.pop(
+            PASSWORD_HASHERS.index(
+                'django.contrib.auth.hashers.Argon2PasswordHasher')))
+
+# Password hashing pool: hashing threads, and calls allowed to wait for
+# one before requests are answered with 429.
+CHAT_HASHING = {
+    'workers': int(os.environ.get('CHAT_HASHING_WORKERS', os.cpu_count() or 2)),
+    'queue_limit': int(os.environ.get('CHAT_HASHING_QUEUE_LIMIT', 32)),
+    'retry_after': 1,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -116,6 +155,19 @@ USE_TZ = False
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# collectstatic writes content-hashed file names plus gzip and brotli
+# variants, which chat.asgi serves with far-future cache headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'chat.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -127,11 +179,209 @@ ASGI_APPLICATION = "chat.asgi.application"
 
 # settings.py
 
+# Application-level heartbeat: connections are pinged every interval and
+# closed after CHAT_IDLE_TIMEOUT seconds without any frame from the client.
+CHAT_HEARTBEAT_INTERVAL = int(os.environ.get('CHAT_HEARTBEAT_INTERVAL', 25))
+CHAT_IDLE_TIMEOUT = int(os.environ.get('CHAT_IDLE_TIMEOUT', 75))
+
+# Default cache: Redis, with an in-process LRU in front of it kept in
+# sync across workers over pub/sub (chat.cache). It uses its own Redis
+# database, since clearing the cache flushes it.
+CACHES = {
+    'default': {
+        'BACKEND': 'chat.cache.TwoTierCache',
+        'LOCATION': os.environ.get('CHAT_CACHE_URL', 'redis://redis:6379/1'),
+        'OPTIONS': {
+            'local_max_entries': 10000,
+            'local_max_bytes': 64 * 1024 * 1024,
+            'local_timeout': 60,
+            'channel': 'chat-cache:invalidate',
+        },
+    },
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             "hosts": [('redis', 6379)],
+            # Live connections refresh their membership on every
+            # heartbeat, so members older than this are dead.
+            "group_expiry": 4 * CHAT_HEARTBEAT_INTERVAL,
+        },
+    },
+}
+
+# Path of the Prometheus metrics route served by the ASGI application.
+METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+
+# Client networks allowed to scrape the metrics route. Requests relayed
+# by a proxy (carrying X-Forwarded-For) are refused, since their client
+# address is the proxy's.
+METRICS_ALLOWED_NETWORKS = os.environ.get(
+    'METRICS_ALLOWED_NETWORKS',
+    '127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,::1/128,fc00::/7',
+).split(',')
+
+# Runtime profiling of the consumer handlers, toggled with
+# `python manage.py chat_profiling on|off`.
+CHAT_PROFILING = {
+    'flag_file': os.environ.get(
+        'CHAT_PROFILING_FLAG', '/tmp/chat-profiling.flag'),
+    'poll_seconds': 1.0,
+    'sample_rate': 0.01,
+    'slow_ms': 100.0,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'profiling_file': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get(
+                'CHAT_PROFILING_LOG', '/tmp/chat-profiling.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'rooms.profiling': {
+            'handlers': ['profiling_file'],
+            'level': 'INFO',
+            'propagate': False,
         },
     },
 }
+
+# Width of the message id ranges the personal chat history is rendered
+# and cached in.
+CHAT_HISTORY_CHUNK_SIZE = 100
+
+# Age of the latest message of a history chunk after which no message
+# committing late can still land in it, so it is cached for good.
+CHAT_HISTORY_SEAL_SECONDS = 60
+
+# Reconnect-with-resume: most messages replayed from the database to a
+# personal chat, and the per-worker replay buffer of public rooms.
+CHAT_RESUME_LIMIT = 200
+CHAT_REPLAY_BUFFER_SIZE = 100
+CHAT_REPLAY_ROOMS = 1000
+
+# Typing indicators: seconds between broadcast typing starts of one
+# connection, between merged typing frames, and until a typer expires.
+CHAT_TYPING_THROTTLE = 3
+CHAT_TYPING_INTERVAL = 1
+CHAT_TYPING_TIMEOUT = 5
+
+# Characters of a new message's content included in the notices sent
+# to the devices of its chat's participants.
+CHAT_NOTICE_PREVIEW = 80
+
+# Durable delivery: append chat events to a capped Redis Stream per room
+# and let every connection read from its own offset. Off by default;
+# the channel layer alone delivers at most once. A stream expires `ttl`
+# seconds after its latest event.
+CHAT_STREAMS = {
+    'enabled': os.environ.get('CHAT_STREAMS_ENABLED', '') == '1',
+    'url': os.environ.get('CHAT_STREAMS_URL', 'redis://redis:6379/0'),
+    'maxlen': 1000,
+    'read_count': 200,
+    'ttl': 24 * 60 * 60,
+}
+
+# Public room directory: occupancy index in Redis under `prefix`, the
+# seconds between a worker's flushes of its deltas and refreshes of its
+# snapshot of the `top` rooms, and how long a silent worker's counts
+# are kept.
+CHAT_DIRECTORY = {
+    'url': os.environ.get('CHAT_DIRECTORY_URL', 'redis://redis:6379/0'),
+    'prefix': 'room-directory',
+    'interval': 1.0,
+    'top': 50,
+    'worker_ttl': 30,
+}
+
+# Public rooms with at least this many connections are split into
+# shard groups; views of a room's groups are refreshed every
+# CHAT_SHARD_REFRESH seconds per worker.
+CHAT_SHARD_THRESHOLD = 1000
+CHAT_SHARD_COUNT = 8
+CHAT_SHARD_REFRESH = 1.0
+
+# Username autocomplete: results per search, hot prefixes cached per
+# process and for how long, and how long a search waits for a newer
+# keystroke of the same user before querying.
+CHAT_USER_SEARCH = {
+    'limit': 10,
+    'cache_size': 10000,
+    'cache_ttl': 30,
+    'debounce_ms': 150,
+}
+
+# User uploaded files, such as chat attachments.
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
+# Chat attachments: stored under `root`, received in chunks of at most
+# `chunk_size` bytes, limited in size per file and in total per user.
+# Uploads not finished within `upload_ttl` seconds are dropped. Set
+# `sendfile_header` (e.g. 'X-Accel-Redirect') to let the proxy serve
+# downloads from `sendfile_prefix`.
+CHAT_ATTACHMENTS = {
+    'root': os.path.join(MEDIA_ROOT, 'attachments'),
+    'chunk_size': 256 * 1024,
+    'max_size': 50 * 1024 * 1024,
+    'quota': 500 * 1024 * 1024,
+    'upload_ttl': 24 * 60 * 60,
+    'sendfile_header': os.environ.get('CHAT_SENDFILE_HEADER') or None,
+    'sendfile_prefix': '/protected/attachments/',
+}
+
+# Static files served by chat.asgi. Daphne has no zero-copy send, so
+# behind a proxy set `sendfile_header` (e.g. 'X-Accel-Redirect') to let
+# the proxy send the collected files from `sendfile_prefix`.
+CHAT_STATIC_FILES = {
+    'sendfile_header': os.environ.get('CHAT_SENDFILE_HEADER') or None,
+    'sendfile_prefix': '/protected/static/',
+}
+
+# permessage-deflate on WebSocket connections served by Daphne. Frames
+# below `threshold` bytes are sent uncompressed. The window bits (9-15)
+# and memory level (1-9) bound the zlib context kept per connection:
+# about 2**(window_bits + 2) + 2**(mem_level + 9) bytes, or none
+# between messages with `no_context_takeover`. Measure with
+# `manage.py bench_compression`: with these settings typical chat
+# traffic takes about a quarter of the bytes on the wire.
+CHAT_WS_COMPRESSION = {
+    'enabled': os.environ.get('CHAT_WS_COMPRESSION_ENABLED', '') == '1',
+    'threshold': 128,
+    'window_bits': 12,
+    'mem_level': 5,
+    'client_window_bits': 12,
+    'no_context_takeover': False,
+    'max_message_size': 1024 * 1024,
+}
+
+# Message retention, enforced by `manage.py prune_messages`: days messages
+# are kept unless their chat sets its own retention_days (None keeps them
+# forever), message ids examined per transaction, seconds between
+# batches and how long a batch waits for a locked row.
+CHAT_RETENTION = {
+    'days': int(os.environ['CHAT_RETENTION_DAYS'])
+    if os.environ.get('CHAT_RETENTION_DAYS') else None,
+    'batch_size': 1000,
+    'pause': 0.1,
+    'lock_timeout': '2s',
+}
+
+# Read replica routing: apps whose reads may go to the replica, how long
+# a writer keeps reading from the primary, and the replica lag (checked
+# every lag_check_interval seconds) above which reads fall back to it.
+CHAT_DB_REPLICA = {
+    'alias': 'replica',
+    'apps': ['authentication', 'rooms'],
+    'sticky_seconds': 5,
+    'max_lag': 2.0,
+    'lag_check_interval': 1.0,
+}
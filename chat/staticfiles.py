@@ -0,0 +1,235 @@
+"""
+Static files pipeline: content-hashed, precompressed files written by
+collectstatic and served from the ASGI application.
+"""
+import asyncio
+import gzip
+import mimetypes
+import re
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is an optional speedup
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.mjs', '.map', '.svg', '.html', '.txt', '.json', '.xml',
+)
+MIN_COMPRESS_SIZE = 256
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = b'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = b'public, max-age=60'
+CHUNK_SIZE = 64 * 1024
+
+# Content-Encoding -> suffix of the precompressed variant, in preference order.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def config():
+    return {
+        'sendfile_header': None,
+        'sendfile_prefix': '/protected/static/',
+        **getattr(settings, 'CHAT_STATIC_FILES', {}),
+    }
+
+
+def compress_file(path):
+    """
+    Write `.gz` and, when brotli is installed, `.br` variants next to a
+    file. Variants that aren't smaller than the original are skipped.
+    """
+    data = Path(path).read_bytes()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            Path(f'{path}{suffix}').write_bytes(compressed)
+            written.append(f'{path}{suffix}')
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes gzip and brotli variants of the
+    collected text assets. URLs fall back to the plain file name when
+    a file is missing from the manifest, e.g. before collectstatic ran.
+    """
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                compress_file(self.path(name))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Return the content codings accepted by an Accept-Encoding header,
+    ignoring the ones explicitly refused with q=0.
+    """
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    ASGI middleware serving collected static files from STATIC_ROOT.
+
+    Precompressed variants are chosen from Accept-Encoding, and hashed
+    file names get far-future immutable caching. Daphne doesn't offer
+    the `http.response.zerocopysend` extension, so behind a proxy set
+    `sendfile_header` to let the proxy send the file; otherwise it is
+    handed to servers offering zero-copy send, or streamed in chunks
+    read off the event loop. Requests for files that aren't collected
+    are passed to the wrapped application.
+    """
+
+    def __init__(self, inner, root=None, url=None):
+        self.inner = inner
+        self.root = Path(root or settings.STATIC_ROOT).resolve()
+        self.prefix = '/' + (url or settings.STATIC_URL).strip('/') + '/'
+        self.options = config()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.prefix):
+            return await self.inner(scope, receive, send)
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.inner(scope, receive, send)
+
+        # Path resolution and stat() hit the disk; keep them off the loop.
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(
+            None, self.find, scope['path'],
+            _header(scope, b'accept-encoding'))
+        if found is None:
+            return await self.inner(scope, receive, send)
+
+        await self.serve(scope, send, *found)
+
+    def find(self, request_path, accept_encoding):
+        """
+        Return `(path, variant, coding, stat)` of the file a request
+        path maps to inside the static root, or None.
+        """
+        path = self.resolve(request_path)
+        if path is None:
+            return None
+        variant, coding = self.select_variant(accept_encoding, path)
+        return path, variant, coding, variant.stat()
+
+    def resolve(self, request_path):
+        """
+        Map a request path to a file inside the static root, or None.
+        """
+        relative = unquote(request_path[len(self.prefix):])
+        path = (self.root / relative).resolve()
+        if self.root not in path.parents or not path.is_file():
+            return None
+        return path
+
+    def select_variant(self, accept_encoding, path):
+        """Pick the precompressed variant the client accepts, if any."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding, suffix in ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if coding in accepted and variant.is_file():
+                return variant, coding
+        return path, None
+
+    async def serve(self, scope, send, path, variant, coding, stat):
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}{"-" + coding if coding else ""}"'
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in (
+                'application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+
+        headers = [
+            (b'content-type', content_type.encode()),
+            (b'cache-control', IMMUTABLE_CACHE_CONTROL
+                if HASHED_NAME_RE.search(path.name) else DEFAULT_CACHE_CONTROL),
+            (b'etag', etag.encode()),
+            (b'last-modified', formatdate(stat.st_mtime, usegmt=True).encode()),
+            (b'vary', b'Accept-Encoding'),
+        ]
+        if coding:
+            headers.append((b'content-encoding', coding.encode()))
+
+        if _header(scope, b'if-none-match') == etag:
+            await send({'type': 'http.response.start', 'status': 304,
+                        'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if self.options['sendfile_header']:
+            # The proxy sends the file, keeping the headers set here.
+            location = self.options['sendfile_prefix'] + str(
+                variant.relative_to(self.root))
+            headers.append((self.options['sendfile_header'].lower().encode(),
+                            location.encode()))
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        headers.append((b'content-length', str(stat.st_size).encode()))
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': headers})
+
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        with open(variant, 'rb') as file:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': file,
+                    'count': stat.st_size,
+                })
+                return
+            await self.stream(file, send)
+
+    async def stream(self, file, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, file.read, CHUNK_SIZE)
+            more = len(chunk) == CHUNK_SIZE
+            await send({'type': 'http.response.body', 'body': chunk,
+                        'more_body': more})
+            if not more:
+                return
@@ -0,0 +1,28 @@
+"""
+Tests for the helpers shared by the benchmarks.
+"""
+from django.test import SimpleTestCase
+
+from chat.benchmarking import percentile, summarize
+
+
+class PercentileTest(SimpleTestCase):
+    """
+    Test the percentile helpers.
+    """
+
+    def test_nearest_rank(self):
+        """
+        Test nearest rank percentiles over a simple range.
+        """
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary_in_milliseconds(self):
+        self.assertEqual(summarize([0.001, 0.002]), {
+            'count': 2, 'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 2.0, 'max_ms': 2.0})
+        self.assertEqual(summarize([])['p50_ms'], None)
@@ -0,0 +1,162 @@
+"""
+Tests for the two-tier cache backend.
+"""
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+
+from django.test import SimpleTestCase
+
+from chat import metrics
+from chat.cache import LocalTier, TwoTierCache
+
+LOCATION = 'redis://redis:6379/1'
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    """
+    Test reads through the local tier and invalidations across two
+    processes, each with its own local tier.
+    """
+
+    def setUp(self):
+        self.channel = f'test-cache:{uuid.uuid4().hex}'
+        self.cache = self._backend()
+        self.other = self._backend()
+        # Simulate another process: a local tier of its own.
+        tier = self.other._cache.local = LocalTier(100, 1024 * 1024, 60)
+        tier.start(self.other._cache.get_client(write=True), self.channel)
+        for backend in (self.cache, self.other):
+            self.assertTrue(backend._cache.local.listening.wait(2))
+        self.addCleanup(self.cache.delete_many, ['a', 'b', 'c', 'n'])
+
+    def _backend(self, **options):
+        return TwoTierCache(LOCATION, {
+            'KEY_PREFIX': self.channel,
+            'OPTIONS': {'channel': self.channel, **options},
+        })
+
+    def _write(self, method, *args, **kwargs):
+        """Write through `self.cache` and wait for `self.other` to hear of it."""
+        tier = self.other._cache.local
+        generation = tier.generation
+        result = getattr(self.cache, method)(*args, **kwargs)
+        self.assertTrue(wait_for(lambda: tier.generation > generation))
+        return result
+
+    def _local_keys(self, backend):
+        return {key.rsplit(':', 1)[-1] for key in backend._cache.local.entries}
+
+    def test_reads_fill_the_local_tier(self):
+        self._write('set', 'a', {'value': 1})
+        hits = metrics.CACHE_LOOKUPS.labels('local', 'hit').value
+
+        self.assertEqual(self.other.get('a'), {'value': 1})
+        value = self.other.get('a')
+        self.assertEqual(value, {'value': 1})
+
+        self.assertEqual(metrics.CACHE_LOOKUPS.labels('local', 'hit').value, hits + 1)
+        # Every hit returns a copy.
+        value['value'] = 2
+        self.assertEqual(self.other.get('a'), {'value': 1})
+        self.assertIsNone(self.other.get('missing'))
+        self.assertEqual(self._local_keys(self.other), {'a'})
+
+    def test_writes_invalidate_other_processes(self):
+        self._write('set_many', {'a': 1, 'b': 1, 'n': 1})
+        self.assertEqual(self.other.get_many(['a', 'b', 'n']), {'a': 1, 'b': 1, 'n': 1})
+        self.assertEqual(self._local_keys(self.other), {'a', 'b', 'n'})
+
+        self.cache.set('a', 2)
+        self.cache.delete('b')
+        self.cache.incr('n')
+
+        self.assertTrue(wait_for(lambda: not self._local_keys(self.other)))
+        self.assertEqual(self.other.get('a'), 2)
+        self.assertIsNone(self.other.get('b'))
+        self.assertEqual(self.other.get('n'), 2)
+
+    def test_clear_empties_other_processes(self):
+        self._write('set', 'a', 1)
+        self.other.get('a')
+
+        self.cache.clear()
+
+        self.assertTrue(wait_for(lambda: not self._local_keys(self.other)))
+        self.assertIsNone(self.other.get('a'))
+
+    def test_local_copies_expire_with_redis(self):
+        self._write('set', 'a', 1, timeout=1)
+        self.other.get('a')
+
+        expires, _ = self.other._cache.local.entries[self.other.make_key('a')]
+
+        self.assertLessEqual(expires - time.monotonic(), 1)
+
+    def test_read_racing_an_invalidation_is_not_kept(self):
+        tier = self.other._cache.local
+        generation = tier.generation
+        tier.invalidate(['unrelated'])
+
+        tier.put(self.other.make_key('a'), b'1', None, generation)
+
+        self.assertEqual(self._local_keys(self.other), set())
+
+    async def test_aget_serves_local_hits(self):
+        await sync_to_async(self._write)('set', 'a', 'value')
+
+        self.assertEqual(await self.other.aget('a'), 'value')
+        self.assertEqual(await self.other.aget('a'), 'value')
+        self.assertEqual(await self.other.aget('missing', 'default'), 'default')
+
+
+class LocalTierTest(SimpleTestCase):
+    """
+    Test the bounds of the local tier.
+    """
+
+    def setUp(self):
+        self.tier = LocalTier(max_entries=2, max_bytes=10, timeout=60)
+        self.tier.listening.set()
+
+    def test_least_recently_used_is_evicted(self):
+        evictions = metrics.CACHE_EVICTIONS.labels('capacity').value
+        self.tier.put('a', b'1', None, 0)
+        self.tier.put('b', b'2', None, 0)
+        self.tier.get('a')
+
+        self.tier.put('c', b'3', None, 0)
+
+        self.assertEqual(list(self.tier.entries), ['a', 'c'])
+        self.assertEqual(metrics.CACHE_EVICTIONS.labels('capacity').value, evictions + 1)
+
+    def test_bytes_are_bounded(self):
+        self.tier.put('a', b'123456', None, 0)
+        self.tier.put('b', b'123456', None, 0)
+        self.tier.put('c', b'x' * 11, None, 0)
+
+        self.assertEqual(list(self.tier.entries), ['b'])
+        self.assertEqual(self.tier.size, 6)
+
+    def test_expired_entries_are_dropped(self):
+        self.tier.put('a', b'1', 0.01, 0)
+        time.sleep(0.02)
+
+        self.assertIsNone(self.tier.get('a'))
+        self.assertEqual(self.tier.size, 0)
+
+    def test_bypassed_while_not_listening(self):
+        self.tier.put('a', b'1', None, 0)
+        self.tier.listening.clear()
+
+        self.assertIsNone(self.tier.get('a'))
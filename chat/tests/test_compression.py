@@ -0,0 +1,100 @@
+"""
+Tests for WebSocket compression and its benchmark.
+"""
+import sys
+import types
+from unittest import mock
+
+from autobahn.websocket.compress import PerMessageDeflateOffer
+from daphne.ws_protocol import WebSocketProtocol
+
+from django.test import SimpleTestCase, override_settings
+
+from chat import compression, daphne_compression
+from rooms.compression_benchmark import CompressionBenchmarkConfig, measure, run
+
+
+class AcceptTest(SimpleTestCase):
+    """
+    Test negotiating permessage-deflate with the configured contexts.
+    """
+
+    def test_accepts_deflate_with_bounded_context(self):
+        offer = PerMessageDeflateOffer.parse({'client_max_window_bits': [True]})
+
+        accepted = daphne_compression.accept([offer])
+
+        self.assertEqual(accepted.window_bits, 12)
+        self.assertEqual(accepted.mem_level, 5)
+        self.assertEqual(accepted.request_max_window_bits, 12)
+        self.assertIn('client_max_window_bits=12', accepted.get_extension_string())
+
+    def test_respects_client_window_request(self):
+        offer = PerMessageDeflateOffer.parse({
+            'server_max_window_bits': ['10'],
+            'server_no_context_takeover': [True],
+        })
+
+        accepted = daphne_compression.accept([offer])
+
+        self.assertEqual(accepted.window_bits, 10)
+        self.assertTrue(accepted.no_context_takeover)
+        self.assertEqual(accepted.request_max_window_bits, 0)
+
+    def test_no_offer(self):
+        self.assertIsNone(daphne_compression.accept([]))
+
+
+class ThresholdTest(SimpleTestCase):
+    """
+    Test that frames below the threshold are sent uncompressed.
+    """
+
+    @override_settings(CHAT_WS_COMPRESSION={'threshold': 100})
+    def test_small_frames_are_not_compressed(self):
+        factory = daphne_compression.CompressingWebSocketFactory(None)
+        protocol = factory.buildProtocol(None)
+        protocol._perMessageCompress = object()
+
+        with mock.patch.object(WebSocketProtocol, 'sendMessage') as send:
+            protocol.sendMessage(b'{"type": "ping"}', False)
+            protocol.sendMessage(b'x' * 100, False)
+
+        self.assertTrue(send.call_args_list[0].args[4])
+        self.assertFalse(send.call_args_list[1].args[4])
+
+    @override_settings(CHAT_WS_COMPRESSION={'enabled': True})
+    def test_install_replaces_daphne_factory(self):
+        server = types.ModuleType('daphne.server')
+        with mock.patch.dict(sys.modules, {'daphne.server': server}):
+            compression.install()
+
+        self.assertIs(server.WebSocketFactory, daphne_compression.CompressingWebSocketFactory)
+
+
+class CompressionBenchmarkTest(SimpleTestCase):
+    """
+    Test the compression benchmark.
+    """
+
+    def test_uncompressed_baseline(self):
+        payloads = [b'{"type": "ping"}'] * 3
+
+        result = measure(payloads)
+
+        self.assertEqual(result['wire_bytes'], result['raw_bytes'])
+        self.assertEqual(result['frames_compressed'], 0)
+
+    def test_small_run(self):
+        config = CompressionBenchmarkConfig(
+            messages=200, resumes=2, thresholds=[128], contexts=[[12, 5]],
+            no_context_takeover=[False])
+
+        results = run(config)
+
+        for traffic in results['traffic'].values():
+            baseline, compressed = traffic['runs']
+            self.assertEqual(baseline['setting'], 'uncompressed')
+            self.assertGreater(compressed['saved_ratio'], 0.3)
+            self.assertLess(compressed['frames_compressed'], traffic['frames'])
+            self.assertEqual(compressed['context_memory_bytes'], 32768)
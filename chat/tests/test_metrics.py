@@ -0,0 +1,153 @@
+"""
+Tests for the metrics registry and the metrics ASGI route.
+"""
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from channels.routing import URLRouter
+
+from django.test import SimpleTestCase
+from django.urls import path
+
+from chat import metrics
+from rooms.consumers import PublicRoomConsumer
+
+
+async def _not_found(scope, receive, send):
+    """Fallback ASGI app used behind the metrics middleware."""
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class RegistryTest(SimpleTestCase):
+    """
+    Test the text exposition of each metric type.
+    """
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_with_labels(self):
+        """
+        Test that labelled counters are rendered per label set.
+        """
+        counter = metrics.Counter(
+            'test_total', 'Test counter.', ('room',), registry=self.registry)
+        counter.labels('a').inc()
+        counter.labels('a').inc(2)
+        counter.labels('b').inc()
+
+        output = self.registry.render()
+
+        self.assertIn('# TYPE test_total counter', output)
+        self.assertIn('test_total{room="a"} 3.0', output)
+        self.assertIn('test_total{room="b"} 1.0', output)
+
+    def test_gauge_function(self):
+        """
+        Test that a gauge reads its value from the callback on render.
+        """
+        gauge = metrics.Gauge('test_gauge', 'Test gauge.',
+                              registry=self.registry)
+        gauge.set_function(lambda: 7)
+
+        self.assertIn('test_gauge 7.0', self.registry.render())
+
+    def test_histogram_buckets(self):
+        """
+        Test that histogram buckets are cumulative and end with +Inf.
+        """
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test histogram.', buckets=(0.1, 1),
+            registry=self.registry)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        output = self.registry.render()
+
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', output)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', output)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', output)
+        self.assertIn('test_seconds_count 3', output)
+
+    def test_label_values_are_escaped(self):
+        """
+        Test that quotes in label values don't break the exposition.
+        """
+        counter = metrics.Counter(
+            'test_total', 'Test counter.', ('room',), registry=self.registry)
+        counter.labels('a"b').inc()
+
+        self.assertIn(r'test_total{room="a\"b"} 1.0', self.registry.render())
+
+
+class MetricsMiddlewareTest(SimpleTestCase):
+    """
+    Test the metrics route in front of the http application.
+    """
+
+    async def test_metrics_route(self):
+        """
+        Test that the metrics path returns the exposition.
+        """
+        app = metrics.MetricsMiddleware(_not_found)
+        communicator = HttpCommunicator(app, 'GET', '/metrics')
+        communicator.scope['client'] = ('127.0.0.1', 50000)
+        response = await communicator.get_response()
+
+        self.assertEqual(response['status'], 200)
+        self.assertIn(b'# TYPE chat_active_connections gauge',
+                      response['body'])
+
+    async def test_external_clients_are_refused(self):
+        """
+        Test that clients outside the allowed networks and requests
+        relayed by a proxy get 403.
+        """
+        app = metrics.MetricsMiddleware(
+            _not_found, allowed_networks=['10.0.0.0/8'])
+        for client, headers in (
+                (('203.0.113.7', 50000), []),
+                (('10.0.0.5', 50000), [(b'x-forwarded-for', b'203.0.113.7')]),
+                (None, [])):
+            communicator = HttpCommunicator(
+                app, 'GET', '/metrics', headers=headers)
+            communicator.scope['client'] = client
+            response = await communicator.get_response()
+
+            self.assertEqual(response['status'], 403)
+            self.assertEqual(response['body'], b'')
+
+    async def test_other_paths_pass_through(self):
+        """
+        Test that requests to other paths reach the wrapped application.
+        """
+        app = metrics.MetricsMiddleware(_not_found)
+        communicator = HttpCommunicator(app, 'GET', '/chat/room/')
+        response = await communicator.get_response()
+
+        self.assertEqual(response['status'], 404)
+
+    async def test_consumer_connections_are_counted(self):
+        """
+        Test that a public room connection is counted under its room
+        kind, without the room name, until it disconnects.
+        """
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, "/ws/chat/metricsroom/")
+        gauge = metrics.ACTIVE_CONNECTIONS.labels('public')
+        connections = gauge.value
+        await communicator.connect()
+        await communicator.receive_json_from()
+
+        output = metrics.REGISTRY.render()
+        self.assertEqual(gauge.value, connections + 1)
+        self.assertIn('chat_active_connections{kind="public"}', output)
+        self.assertNotIn('metricsroom', output)
+        self.assertIn('chat_users_count_rooms', output)
+
+        await communicator.disconnect()
+
+        self.assertEqual(gauge.value, connections)
@@ -0,0 +1,182 @@
+"""
+Tests for routing reads to the read replica.
+"""
+import contextvars
+from unittest import mock
+
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from chat import routers
+from rooms.models import Message
+
+User = get_user_model()
+
+
+@override_settings(CHAT_DB_REPLICA={'sticky_seconds': 5})
+class ReplicaRouterTest(SimpleTestCase):
+    """
+    Test where the router sends reads and writes.
+    """
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        for patcher in (
+            mock.patch.object(routers, 'replica_configured', return_value=True),
+            mock.patch.object(routers.lag_guard, 'healthy', return_value=True),
+            mock.patch.object(routers, 'cache', mock.Mock(
+                get=mock.Mock(return_value=None),
+                aget=mock.AsyncMock(return_value=None))),
+        ):
+            self.mocked = patcher.start()
+            self.addCleanup(patcher.stop)
+        routers.user_pins.refreshed.clear()
+
+    def _in_context(self, function):
+        """Run `function` with fresh context variables."""
+        return contextvars.Context().run(function)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(
+            self._in_context(lambda: self.router.db_for_read(Message)), 'replica')
+
+    def test_unrouted_app(self):
+        self.assertIsNone(self.router.db_for_read(mock.Mock(_meta=mock.Mock(app_label='admin'))))
+
+    def test_reads_after_write_stay_on_primary(self):
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(Message), DEFAULT_DB_ALIAS)
+            return self.router.db_for_read(Message)
+
+        self.assertEqual(self._in_context(write_then_read), DEFAULT_DB_ALIAS)
+
+    def test_unrouted_write_does_not_pin(self):
+        session = mock.Mock(_meta=mock.Mock(app_label='sessions'))
+
+        def write_then_read():
+            routers.bind_user(7)
+            self.assertEqual(self.router.db_for_write(session), DEFAULT_DB_ALIAS)
+            return self.router.db_for_read(Message)
+
+        self.assertEqual(self._in_context(write_then_read), 'replica')
+        self.mocked.set.assert_not_called()
+
+    def test_throttled_writes_stay_pinned(self):
+        """
+        Test that a write skipped by the refresh throttle is still
+        covered by the pin for a full sticky window.
+        """
+        with mock.patch('chat.routers.time.monotonic', side_effect=[0, 2.4]):
+            routers.user_pins.add(7)
+            routers.user_pins.add(7)
+
+        self.mocked.set.assert_called_once()
+        self.assertGreaterEqual(
+            self.mocked.set.call_args.kwargs['timeout'], 2.4 + 5)
+
+    def test_write_pins_bound_user_across_contexts(self):
+        def write_as_user():
+            routers.bind_user(7)
+            self.router.db_for_write(Message)
+
+        self._in_context(write_as_user)
+
+        self.mocked.set.assert_called_once_with('db-pin:7', True, timeout=7.5)
+
+        def read_as_user():
+            routers.bind_user(7)
+            return self.router.db_for_read(Message)
+
+        self.mocked.get.return_value = True
+        self.assertEqual(self._in_context(read_as_user), DEFAULT_DB_ALIAS)
+        self.mocked.get.return_value = None
+        self.assertEqual(self._in_context(read_as_user), 'replica')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        routers.lag_guard.healthy.return_value = False
+
+        self.assertEqual(
+            self._in_context(lambda: self.router.db_for_read(Message)), DEFAULT_DB_ALIAS)
+
+    def test_transaction_falls_back_to_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(
+                self._in_context(lambda: self.router.db_for_read(Message)),
+                DEFAULT_DB_ALIAS)
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'rooms'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'rooms'))
+
+    def test_middleware_pins_unsafe_requests(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Message))
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+
+        def request(method):
+            request = getattr(factory, method)('/')
+            request.session = {SESSION_KEY: '3'}
+            middleware(request)
+
+        self._in_context(lambda: (request('get'), request('post'), request('get')))
+
+        self.assertEqual(seen, ['replica', DEFAULT_DB_ALIAS, 'replica'])
+
+    async def test_async_middleware_pins_unsafe_requests(self):
+        seen = []
+
+        async def view(request):
+            seen.append(self.router.db_for_read(Message))
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        for method in ('get', 'post', 'get'):
+            request = getattr(factory, method)('/')
+            request.session = {SESSION_KEY: '3'}
+            await middleware(request)
+
+        self.assertEqual(seen, ['replica', DEFAULT_DB_ALIAS, 'replica'])
+        self.mocked.aget.assert_called_with('db-pin:3')
+
+    def test_no_replica(self):
+        routers.replica_configured.return_value = False
+
+        self.assertIsNone(self.router.db_for_read(Message))
+        self.assertIsNone(self.router.db_for_write(Message))
+
+
+class ReplicaLagTest(TestCase):
+    """
+    Test measuring the replica lag.
+    """
+
+    def test_primary_has_no_lag(self):
+        self.assertEqual(routers.replica_lag(DEFAULT_DB_ALIAS), 0)
+
+    @override_settings(CHAT_DB_REPLICA={'max_lag': 1, 'lag_check_interval': 60})
+    def test_guard_caches_checks(self):
+        guard = routers.LagGuard()
+        with mock.patch.object(routers, 'replica_lag', side_effect=[5.0, 0.0]) as lag:
+            self.assertFalse(guard.healthy('replica'))
+            self.assertFalse(guard.healthy('replica'))
+
+        lag.assert_called_once_with('replica')
+
+    def test_login_pins_user(self):
+        user = User.objects.create_user(username='replicauser', password='testpassword1')
+        cache.delete(f'db-pin:{user.id}')
+
+        with mock.patch.object(routers, 'replica_configured', return_value=True):
+            contextvars.Context().run(
+                self.client.login, username='replicauser', password='testpassword1')
+
+        self.assertTrue(cache.get(f'db-pin:{user.id}'))
@@ -0,0 +1,183 @@
+"""
+Tests for the static files pipeline and the ASGI static route.
+"""
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from channels.testing import HttpCommunicator
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from chat.staticfiles import StaticFilesMiddleware, accepted_encodings
+
+
+async def _not_found(scope, receive, send):
+    """Fallback ASGI app used behind the static files middleware."""
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class CollectStaticTest(SimpleTestCase):
+    """
+    Test collectstatic output and serving it from the ASGI middleware.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            STATIC_ROOT=cls.static_root, DEBUG=False)
+        cls.settings_override.enable()
+        call_command('collectstatic', interactive=False, stdout=StringIO())
+        cls.hashed_name = staticfiles_storage.stored_name(
+            'css/base-room-style.css')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root)
+        super().tearDownClass()
+
+    async def _get(self, path, headers=None, extensions=None):
+        app = StaticFilesMiddleware(_not_found)
+        communicator = HttpCommunicator(
+            app, 'GET', path, headers=headers or [])
+        if extensions:
+            communicator.scope['extensions'] = extensions
+        return await communicator.get_response()
+
+    @staticmethod
+    def _headers(response):
+        return {k.decode(): v.decode() for k, v in response['headers']}
+
+    def test_hashed_and_compressed_files(self):
+        """
+        Test that collectstatic writes hashed names with gzip and brotli
+        variants next to them.
+        """
+        self.assertRegex(self.hashed_name, r'base-room-style\.[0-9a-f]{12}\.css$')
+        collected = Path(self.static_root) / self.hashed_name
+        self.assertTrue(collected.is_file())
+        self.assertTrue(Path(f'{collected}.gz').is_file())
+        self.assertTrue(Path(f'{collected}.br').is_file())
+
+    async def test_negotiates_brotli(self):
+        """
+        Test that a brotli capable client gets the brotli variant with
+        immutable caching.
+        """
+        response = await self._get(
+            f'/static/{self.hashed_name}',
+            headers=[(b'accept-encoding', b'gzip, deflate, br')],
+        )
+        headers = self._headers(response)
+
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(headers['content-encoding'], 'br')
+        self.assertIn('immutable', headers['cache-control'])
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(int(headers['content-length']), len(response['body']))
+
+    async def test_negotiates_gzip_and_identity(self):
+        """
+        Test gzip when brotli is refused and the plain file otherwise.
+        """
+        response = await self._get(
+            f'/static/{self.hashed_name}',
+            headers=[(b'accept-encoding', b'gzip, br;q=0')],
+        )
+        self.assertEqual(self._headers(response)['content-encoding'], 'gzip')
+
+        response = await self._get(f'/static/{self.hashed_name}')
+        self.assertNotIn('content-encoding', self._headers(response))
+        self.assertIn(b'body', response['body'])
+
+    async def test_not_modified(self):
+        """
+        Test that a matching If-None-Match gets a 304.
+        """
+        response = await self._get(f'/static/{self.hashed_name}')
+        etag = self._headers(response)['etag']
+
+        response = await self._get(
+            f'/static/{self.hashed_name}',
+            headers=[(b'if-none-match', etag.encode())],
+        )
+        self.assertEqual(response['status'], 304)
+
+    async def test_zero_copy_send(self):
+        """
+        Test that the file is handed to the server when it supports the
+        zero-copy extension.
+        """
+        app = StaticFilesMiddleware(_not_found)
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            if message['type'] == 'http.response.zerocopysend':
+                message = {**message, 'data': message['file'].read()}
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'headers': [],
+            'path': f'/static/{self.hashed_name}',
+            'extensions': {'http.response.zerocopysend': {}},
+        }
+        await app(scope, receive, send)
+
+        self.assertEqual(sent[1]['type'], 'http.response.zerocopysend')
+        self.assertIn(b'body', sent[1]['data'])
+
+    async def test_sendfile_header(self):
+        """
+        Test that the proxy is asked to send the negotiated variant when
+        a sendfile header is configured.
+        """
+        with override_settings(CHAT_STATIC_FILES={
+                'sendfile_header': 'X-Accel-Redirect'}):
+            response = await self._get(
+                f'/static/{self.hashed_name}',
+                headers=[(b'accept-encoding', b'gzip')],
+            )
+
+        headers = self._headers(response)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(
+            headers['x-accel-redirect'],
+            f'/protected/static/{self.hashed_name}.gz',
+        )
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(response['body'], b'')
+
+    async def test_missing_files_pass_through(self):
+        """
+        Test that unknown files and path traversal reach the inner app.
+        """
+        response = await self._get('/static/css/missing.css')
+        self.assertEqual(response['status'], 404)
+
+        response = await self._get('/static/../settings.py')
+        self.assertEqual(response['status'], 404)
+
+
+class AcceptEncodingTest(SimpleTestCase):
+    """
+    Test parsing of the Accept-Encoding header.
+    """
+
+    def test_refused_codings(self):
+        """
+        Test that codings with q=0 are not accepted.
+        """
+        self.assertEqual(
+            accepted_encodings('gzip;q=1.0, br; q=0, identity'),
+            {'gzip', 'identity'},
+        )
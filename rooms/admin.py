@@ -0,0 +1,126 @@
+"""
+Personal chats and messages in admin site.
+
+The message and chat tables are too large for the default change list:
+its exact `COUNT(*)` queries and page offsets scan the whole table.
+These change lists show the planner's estimate of the row count instead,
+page by primary key with `?before=<id>` links, and only allow sorting
+by descending id, which the primary key index serves. Messages are
+filtered by date through `timestamp__gte` and `timestamp__lt`, which use
+the block range index on the timestamp.
+"""
+import json
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db import connections
+
+from rooms.models import Message, PersonalChatRoom
+
+KEYSET_VAR = 'before'
+
+
+def estimated_count(queryset, exact_below=1000):
+    """
+    Return the planner's estimate of the rows of a queryset, or the
+    exact count when the estimate is small enough to count cheaply.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list paged by primary key, newest first, with an estimated
+    result count.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        before = request.GET.get(KEYSET_VAR, '')
+        self.before = int(before) if before.isdigit() else None
+        self.first_url = self.next_url = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter and sort links start again from the newest rows.
+        return super().get_query_string(new_params, [KEYSET_VAR, *(remove or [])])
+
+    def get_results(self, request):
+        queryset = self.queryset
+        if self.before is not None:
+            queryset = queryset.filter(pk__lt=self.before)
+            self.first_url = self.get_query_string()
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        if len(rows) > self.list_per_page:
+            self.next_url = self.get_query_string(
+                {KEYSET_VAR: self.result_list[-1].pk})
+
+        self.result_count = estimated_count(
+            self.queryset, self.model_admin.exact_count_below)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+
+
+class KeysetAdmin(admin.ModelAdmin):
+    """Admin of a large table, see `KeysetChangeList`."""
+    ordering = ('-id',)
+    sortable_by = ()
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    exact_count_below = 1000
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class PersonalChatRoomAdmin(KeysetAdmin):
+    """Personal chats in admin."""
+    list_display = ('id', 'members', 'retention_days')
+    raw_id_fields = ('participants',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('participants')
+
+    @admin.display(description='participants')
+    def members(self, chat):
+        return ', '.join(user.username for user in chat.participants.all())
+
+
+class MessageAdmin(KeysetAdmin):
+    """Personal chat messages in admin."""
+    list_display = ('id', 'chat', 'sender', 'preview', 'timestamp', 'version', 'deleted')
+    list_select_related = ('chat', 'sender')
+    list_filter = ('timestamp',)
+    raw_id_fields = ('chat', 'sender', 'attachment')
+    readonly_fields = ('version', 'deleted', 'changed')
+
+    @admin.display(description='content')
+    def preview(self, message):
+        if len(message.content) > 60:
+            return message.content[:60] + '…'
+        return message.content
+
+
+admin.site.register(PersonalChatRoom, PersonalChatRoomAdmin)
+admin.site.register(Message, MessageAdmin)
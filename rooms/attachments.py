@@ -0,0 +1,299 @@
+"""
+Chunked, resumable file attachments of personal chats.
+
+An upload starts with a JSON `upload_start` frame declaring the file's
+name, size and, optionally, its SHA-256. The server reserves the size
+against the uploader's quota and answers with the upload id and the
+offset to send from, which is past the bytes already stored when an
+upload is resumed. The file is then sent as binary frames, each a
+`HEADER` of upload id and offset followed by at most `chunk_size`
+bytes. Chunks are written straight to the upload's file and hashed as
+they arrive, so no upload is ever held in memory.
+
+Downloads honour single byte ranges. The file is served with
+`FileResponse`, which WSGI servers send with sendfile(); behind a proxy
+that supports it, `sendfile_header` hands the file to the proxy
+instead.
+"""
+import hashlib
+import os
+import re
+import struct
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+
+from rooms.models import Attachment, PersonalChatRoom
+
+User = get_user_model()
+
+HEADER = struct.Struct('!QQ')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadError(Exception):
+    """Raised when an upload can't be started or a chunk is rejected."""
+
+
+def config():
+    return {
+        'root': os.path.join(settings.MEDIA_ROOT, 'attachments'),
+        'chunk_size': 256 * 1024,
+        'max_size': 50 * 1024 * 1024,
+        'quota': 500 * 1024 * 1024,
+        'upload_ttl': 24 * 60 * 60,
+        'sendfile_header': None,
+        'sendfile_prefix': '/protected/attachments/',
+        **getattr(settings, 'CHAT_ATTACHMENTS', {}),
+    }
+
+
+def relative_path(attachment):
+    return os.path.join(str(attachment.chat_id), str(attachment.id))
+
+
+def storage_path(attachment):
+    return os.path.join(config()['root'], relative_path(attachment))
+
+
+def attachment_fields(attachment):
+    """Return the description of an attachment sent to clients."""
+    return {
+        'id': attachment.id,
+        'name': attachment.name,
+        'size': attachment.size,
+        'content_type': attachment.content_type,
+        'url': reverse('attachment', args=[attachment.id]),
+    }
+
+
+def _delete_stale(user):
+    cutoff = datetime.now() - timedelta(seconds=config()['upload_ttl'])
+    Attachment.objects.filter(
+        uploader=user, completed=False, created__lt=cutoff).delete()
+
+
+def reserve(user, chat_id, name, size, content_type='', sha256='', caption=''):
+    """
+    Create an upload in a chat of the user, if the file fits in the
+    size limit and the user's quota. Reservations of a user are
+    serialised on the user's row; uploads abandoned for longer than
+    `upload_ttl` are dropped first and don't count against the quota.
+    """
+    options = config()
+    if not isinstance(name, str) or not name.strip():
+        raise UploadError('Missing file name')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('Invalid file size')
+    if size > options['max_size']:
+        raise UploadError('File is too large')
+    if not PersonalChatRoom.objects.filter(
+            id=chat_id, participants=user).exists():
+        raise UploadError('Not a participant of this chat')
+
+    with transaction.atomic():
+        User.objects.select_for_update().filter(id=user.id).first()
+        _delete_stale(user)
+        used = Attachment.objects.filter(uploader=user).aggregate(
+            total=Sum('size'))['total'] or 0
+        if used + size > options['quota']:
+            raise UploadError('Attachment quota exceeded')
+        return Attachment.objects.create(
+            chat_id=chat_id,
+            uploader=user,
+            name=os.path.basename(name.strip())[:255],
+            content_type=str(content_type or 'application/octet-stream')[:100],
+            size=size,
+            sha256=str(sha256 or '').lower()[:64],
+            caption=str(caption or ''),
+        )
+
+
+def find_upload(user, chat_id, upload_id):
+    """Return an unfinished upload of the user in a chat."""
+    try:
+        return Attachment.objects.get(
+            id=upload_id, uploader=user, chat_id=chat_id, completed=False)
+    except (Attachment.DoesNotExist, ValueError, TypeError):
+        raise UploadError('Unknown upload')
+
+
+class Upload:
+    """
+    The open file of an upload in progress on a connection. The hash
+    covers the bytes written so far; on resume it is rebuilt from the
+    stored bytes.
+    """
+
+    def __init__(self, attachment):
+        self.attachment = attachment
+        path = storage_path(attachment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o640)
+        self.offset = os.fstat(self.fd).st_size
+        self.hasher = hashlib.sha256()
+        block = config()['chunk_size']
+        position = 0
+        while position < self.offset:
+            data = os.pread(self.fd, block, position)
+            self.hasher.update(data)
+            position += len(data)
+
+    @property
+    def complete(self):
+        return self.offset >= self.attachment.size
+
+    def write(self, offset, data):
+        """Append a chunk, which must start where the file ends."""
+        if offset != self.offset:
+            raise UploadError(f'Expected offset {self.offset}')
+        if len(data) > config()['chunk_size']:
+            raise UploadError('Chunk is too large')
+        if self.offset + len(data) > self.attachment.size:
+            raise UploadError('Chunk exceeds the declared size')
+        os.pwrite(self.fd, data, offset)
+        self.hasher.update(data)
+        self.offset += len(data)
+
+    def finish(self):
+        """
+        Verify the checksum of a fully received file and mark it
+        complete. A file that doesn't match its declared checksum is
+        deleted.
+        """
+        os.fsync(self.fd)
+        self.close()
+        digest = self.hasher.hexdigest()
+        if self.attachment.sha256 and self.attachment.sha256 != digest:
+            self.attachment.delete()
+            raise UploadError('Checksum mismatch')
+        self.attachment.sha256 = digest
+        self.attachment.completed = True
+        self.attachment.save(update_fields=['sha256', 'completed'])
+        return self.attachment
+
+    def abort(self):
+        """
+        Drop an upload whose file can't be written, e.g. on a full disk,
+        so it no longer counts against the uploader's quota.
+        """
+        self.close()
+        self.attachment.delete()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def parse_chunk(data):
+    """Split a binary frame into `(upload_id, offset, chunk)`."""
+    if len(data) < HEADER.size:
+        raise UploadError('Invalid chunk')
+    upload_id, offset = HEADER.unpack_from(data)
+    return upload_id, offset, memoryview(data)[HEADER.size:]
+
+
+def delete_file(attachment, using=None):
+    """
+    Remove the stored file of an attachment once the current transaction
+    commits, so a deletion that is rolled back keeps its file.
+    """
+    transaction.on_commit(partial(_remove, storage_path(attachment)), using=using)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def parse_range(header, size):
+    """
+    Return the `(start, end)` inclusive byte range of a Range header,
+    None to send the whole file, or raise ValueError if the range can't
+    be satisfied. Multiple ranges are answered with the whole file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """
+    A file limited to a byte range. It exposes the file descriptor,
+    positioned at the range start, so that WSGI servers can sendfile()
+    the response's Content-Length bytes from it.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(request, attachment):
+    """Return the response serving an attachment or the requested range."""
+    options = config()
+    size = attachment.size
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if options['sendfile_header']:
+        # The proxy serves the file and the range itself.
+        response = HttpResponse(content_type=attachment.content_type)
+        response.headers[options['sendfile_header']] = (
+            options['sendfile_prefix'] + relative_path(attachment))
+    else:
+        start, end = byte_range or (0, size - 1)
+        response = FileResponse(
+            FileRange(open(storage_path(attachment), 'rb'), start, end - start + 1),
+            content_type=attachment.content_type,
+            status=206 if byte_range else 200,
+        )
+        response.block_size = options['chunk_size']
+        response.headers['Content-Length'] = end - start + 1
+        if byte_range:
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['ETag'] = f'"{attachment.sha256}"'
+    response.headers['Content-Disposition'] = content_disposition_header(
+        True, attachment.name)
+    return response
@@ -0,0 +1,289 @@
+"""
+WebSocket load benchmark for the chat consumers.
+
+The harness runs the websocket routes of the project in-process, connects
+simulated clients to public rooms and personal chats, drives them at a
+fixed message rate and measures connect time, end-to-end delivery latency,
+throughput and memory per connection.
+"""
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from chat.benchmarking import summarize
+from rooms.models import PersonalChatRoom
+from rooms.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+MARKER = 'bench'
+
+
+@dataclass
+class BenchmarkConfig:
+    """Shape of a benchmark run."""
+    public_clients: int = 1000
+    rooms: int = 10
+    personal_chats: int = 50
+    rate: float = 1.0
+    duration: float = 10.0
+    drain: float = 2.0
+    layer: str = 'memory'
+    redis_url: str = 'redis://localhost:6379/0'
+    seed: int = 0
+
+
+@dataclass
+class BenchmarkClient:
+    """One simulated WebSocket client."""
+    kind: str
+    path: str
+    username: str
+    user: object = None
+    communicator: object = None
+    audience: int = 2
+    connect_seconds: float = 0.0
+    sent: int = 0
+
+
+@dataclass
+class BenchmarkStats:
+    """Raw samples collected during a run."""
+    connect_seconds: list = field(default_factory=list)
+    latencies: dict = field(default_factory=lambda: {
+        'public': [], 'personal': []})
+    sent: int = 0
+    expected: int = 0
+    delivered: int = 0
+    errors: int = 0
+
+
+def make_channel_layer(config):
+    """
+    Build the channel layer the run should use.
+    """
+    if config.layer == 'redis':
+        from channels_redis.core import RedisChannelLayer
+        return RedisChannelLayer(hosts=[config.redis_url], capacity=10000)
+    if config.layer == 'memory':
+        from channels.layers import InMemoryChannelLayer
+        return InMemoryChannelLayer(capacity=10000)
+    raise ValueError(f'Unknown channel layer {config.layer!r}')
+
+
+def create_personal_chats(count, prefix):
+    """
+    Create `count` personal chats with two fresh users each. Users share
+    one precomputed password hash so that setup doesn't hash per user.
+    """
+    password = make_password(None)
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{i}', password=password)
+        for i in range(count * 2)
+    ])
+    chats = PersonalChatRoom.objects.bulk_create(
+        [PersonalChatRoom() for _ in range(count)])
+    Through = PersonalChatRoom.participants.through
+    Through.objects.bulk_create([
+        Through(personalchatroom_id=chat.id, user_id=user.id)
+        for index, chat in enumerate(chats)
+        for user in users[index * 2:index * 2 + 2]
+    ])
+    return [
+        (chat, users[index * 2], users[index * 2 + 1])
+        for index, chat in enumerate(chats)
+    ]
+
+
+def delete_personal_chats(chats):
+    """Remove the users and chats created for a run."""
+    PersonalChatRoom.objects.filter(id__in=[c.id for c, _, _ in chats]).delete()
+    User.objects.filter(
+        id__in=[u.id for _, a, b in chats for u in (a, b)]).delete()
+
+
+def build_clients(config, chats):
+    """
+    Spread the public clients over the rooms and add two clients per
+    personal chat.
+    """
+    clients = [
+        BenchmarkClient(
+            kind='public',
+            path=f'/ws/chat/benchroom{i % config.rooms}/',
+            username=f'bench-public-{i}',
+            audience=(
+                config.public_clients // config.rooms
+                + (i % config.rooms < config.public_clients % config.rooms)
+            ),
+        )
+        for i in range(config.public_clients)
+    ]
+    for chat, user1, user2 in chats:
+        clients.extend(
+            BenchmarkClient(
+                kind='personal',
+                path=f'/ws/chat/{chat.id}/',
+                username=user.username,
+                user=user,
+            )
+            for user in (user1, user2)
+        )
+    return clients
+
+
+def _payload(client, seq):
+    """Build an outgoing frame carrying the send time of the message."""
+    marker = f'{MARKER}:{client.username}:{seq}:{perf_counter()!r}'
+    if client.kind == 'public':
+        return {'message': marker, 'username': client.username}
+    return {'message': marker, 'timestamp': time.time() * 1000}
+
+
+async def _connect(application, client, stats):
+    communicator = WebsocketCommunicator(application, client.path)
+    if client.user is not None:
+        communicator.scope['user'] = client.user
+    start = perf_counter()
+    connected, _ = await communicator.connect(timeout=30)
+    client.connect_seconds = perf_counter() - start
+    if not connected:
+        stats.errors += 1
+        return
+    client.communicator = communicator
+    stats.connect_seconds.append(client.connect_seconds)
+
+
+async def _read(client, stats):
+    """
+    Read frames for a client until cancelled, recording the delivery
+    latency of every benchmark message.
+    """
+    queue = client.communicator.output_queue
+    while True:
+        frame = await queue.get()
+        text = frame.get('text')
+        if not text:
+            continue
+        message = json.loads(text).get('message', '')
+        if not isinstance(message, str) or not message.startswith(MARKER):
+            continue
+        sent_at = float(message.rsplit(':', 1)[1])
+        stats.latencies[client.kind].append(perf_counter() - sent_at)
+        stats.delivered += 1
+
+
+async def _drive(client, config, stats, deadline, rng):
+    """Send messages at the configured rate until the deadline."""
+    interval = 1 / config.rate
+    await asyncio.sleep(rng.random() * interval)
+    seq = 0
+    while perf_counter() < deadline:
+        await client.communicator.send_json_to(_payload(client, seq))
+        seq += 1
+        stats.sent += 1
+        stats.expected += client.audience
+        await asyncio.sleep(interval)
+    client.sent = seq
+
+
+async def run_benchmark(config, chats=()):
+    """
+    Run a benchmark and return a JSON-serializable result dict.
+    """
+    rng = random.Random(config.seed)
+    layer = make_channel_layer(config)
+    previous_layer = channel_layers.set(DEFAULT_CHANNEL_LAYER, layer)
+    application = URLRouter(websocket_urlpatterns)
+    clients = build_clients(config, chats)
+    stats = BenchmarkStats()
+
+    try:
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        connect_start = perf_counter()
+        await asyncio.gather(*(
+            _connect(application, client, stats) for client in clients))
+        connect_elapsed = perf_counter() - connect_start
+        memory_after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        connected = [c for c in clients if c.communicator is not None]
+        readers = [
+            asyncio.create_task(_read(client, stats)) for client in connected]
+
+        start = perf_counter()
+        deadline = start + config.duration
+        await asyncio.gather(*(
+            _drive(client, config, stats, deadline, rng)
+            for client in connected))
+        send_elapsed = perf_counter() - start
+        await asyncio.sleep(config.drain)
+        elapsed = perf_counter() - start
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(
+            *(c.communicator.disconnect() for c in connected),
+            return_exceptions=True,
+        )
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if previous_layer is None:
+            channel_layers.backends.pop(DEFAULT_CHANNEL_LAYER, None)
+        else:
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, previous_layer)
+
+    all_latencies = stats.latencies['public'] + stats.latencies['personal']
+    return {
+        'config': asdict(config),
+        'clients': len(clients),
+        'connected': len(connected),
+        'errors': stats.errors,
+        'connect': {
+            **summarize(stats.connect_seconds),
+            'total_seconds': round(connect_elapsed, 3),
+        },
+        'memory_per_connection_bytes': (
+            (memory_after - memory_before) // len(connected)
+            if connected else None
+        ),
+        'messages_sent': stats.sent,
+        'messages_expected': stats.expected,
+        'messages_delivered': stats.delivered,
+        'sent_per_second': round(stats.sent / send_elapsed, 2),
+        'delivered_per_second': round(stats.delivered / elapsed, 2),
+        'latency': {
+            'all': summarize(all_latencies),
+            'public': summarize(stats.latencies['public']),
+            'personal': summarize(stats.latencies['personal']),
+        },
+    }
+
+
+async def prepare_and_run(config, keep_data=False):
+    """
+    Create the personal chat fixtures, run the benchmark and clean up.
+    """
+    prefix = f'bench{int(time.time())}_'
+    chats = await sync_to_async(create_personal_chats)(
+        config.personal_chats, prefix)
+    try:
+        return await run_benchmark(config, chats)
+    finally:
+        if not keep_data:
+            await sync_to_async(delete_personal_chats)(chats)
@@ -0,0 +1,171 @@
+"""
+Bandwidth and CPU benchmark of WebSocket compression for chat traffic.
+
+The benchmark builds the frames the consumers send for typical personal
+chat and public room traffic: messages with their trace fields, typing
+and user count frames, heartbeats and the occasional resume batch after
+a reconnect. It runs them through the permessage-deflate implementation
+Daphne uses, once per compression setting, and reports the bytes on the
+wire against the CPU time spent compressing, next to the uncompressed
+baseline.
+"""
+import itertools
+import json
+import random
+import uuid
+from dataclasses import asdict, dataclass, field
+from time import process_time_ns
+
+from autobahn.websocket.compress import PerMessageDeflate
+
+from chat.compression import context_memory
+from rooms.replay import resume_frame
+from rooms.seeding import message_content
+from rooms.typing_indicators import typing_frame
+
+NAMES = ('alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi')
+
+
+@dataclass
+class CompressionBenchmarkConfig:
+    """Traffic and compression settings to measure."""
+    messages: int = 5000
+    resumes: int = 10
+    thresholds: list = field(default_factory=lambda: [0, 256, 1024, 4096])
+    contexts: list = field(default_factory=lambda: [[15, 8], [12, 5], [9, 1]])
+    no_context_takeover: list = field(default_factory=lambda: [False, True])
+    seed: int = 0
+
+
+def _trace_fields(clock):
+    return {
+        'trace_id': uuid.UUID(int=clock).hex,
+        'received_at': 1700000000000 + clock,
+        'broadcast_at': 1700000000002 + clock,
+    }
+
+
+def _timestamp(rng):
+    return f'{rng.randint(1, 12):02d}:{rng.randint(0, 59):02d} ' + rng.choice(('a.m', 'p.m.'))
+
+
+def personal_frames(config, rng):
+    """Yield the frames a personal chat connection receives."""
+    history = []
+    resume_every = config.messages // max(1, config.resumes)
+    for i in range(config.messages):
+        message = {
+            'id': 100000 + i,
+            'message': message_content(rng),
+            'sender': rng.choice(NAMES[:2]),
+            'timestamp': _timestamp(rng),
+        }
+        history.append(message)
+        yield {**message, **_trace_fields(i)}
+        if i % 10 == 0:
+            yield typing_frame([rng.choice(NAMES[:2])])
+        if i % 25 == 0:
+            yield {'type': 'ping'}
+        if resume_every and i % resume_every == resume_every - 1:
+            missed = history[-rng.randint(20, 200):]
+            yield resume_frame(missed, complete=True)
+
+
+def public_frames(config, rng):
+    """Yield the frames a public room connection receives."""
+    buffer = []
+    resume_every = config.messages // max(1, config.resumes)
+    for i in range(config.messages):
+        frame = {
+            'id': uuid.UUID(int=i).hex,
+            'message': message_content(rng),
+            'username': rng.choice(NAMES),
+            **_trace_fields(i),
+        }
+        buffer = (buffer + [frame])[-100:]
+        yield frame
+        if i % 3 == 0:
+            yield typing_frame(rng.sample(NAMES, rng.randint(1, 3)))
+        if i % 5 == 0:
+            yield {'user_count': rng.randint(50, 500)}
+        if i % 25 == 0:
+            yield {'type': 'ping'}
+        if resume_every and i % resume_every == resume_every - 1:
+            yield resume_frame(buffer[-rng.randint(10, 100):], complete=True)
+
+
+def frame_header_size(length):
+    """Return the size of a server WebSocket frame header."""
+    if length < 126:
+        return 2
+    return 4 if length < 65536 else 10
+
+
+def measure(payloads, threshold=None, window_bits=15, mem_level=8,
+            no_context_takeover=False):
+    """
+    Send payloads through one connection's compressor. A threshold of
+    None measures the uncompressed baseline.
+    """
+    deflate = PerMessageDeflate(
+        True, no_context_takeover, False, window_bits, 0, mem_level)
+    inflate = PerMessageDeflate(
+        False, no_context_takeover, False, window_bits, 0, mem_level)
+    wire = compressed = cpu = 0
+    for payload in payloads:
+        if threshold is None or len(payload) < threshold:
+            wire += frame_header_size(len(payload)) + len(payload)
+            continue
+        start = process_time_ns()
+        deflate.start_compress_message()
+        data = deflate.compress_message_data(payload) + deflate.end_compress_message()
+        cpu += process_time_ns() - start
+        compressed += 1
+        wire += frame_header_size(len(data)) + len(data)
+
+        inflate.start_decompress_message()
+        restored = inflate.decompress_message_data(data)
+        inflate.end_decompress_message()
+        if restored != payload:
+            raise RuntimeError('Compressed frame did not round-trip')
+    raw = sum(frame_header_size(len(p)) + len(p) for p in payloads)
+    return {
+        'frames': len(payloads),
+        'frames_compressed': compressed,
+        'raw_bytes': raw,
+        'wire_bytes': wire,
+        'saved_ratio': round(1 - wire / raw, 4) if raw else 0.0,
+        'compress_cpu_ms': round(cpu / 1e6, 3),
+        'cpu_us_per_kib_saved': (
+            round(cpu / 1e3 / ((raw - wire) / 1024), 3) if raw > wire else None),
+    }
+
+
+def run(config):
+    """Measure every setting on both kinds of traffic and return the results."""
+    results = {'config': asdict(config), 'traffic': {}}
+    for kind, frames in (('personal', personal_frames), ('public', public_frames)):
+        rng = random.Random(config.seed)
+        payloads = [json.dumps(frame).encode() for frame in frames(config, rng)]
+        sizes = sorted(len(payload) for payload in payloads)
+        runs = [{'setting': 'uncompressed', **measure(payloads)}]
+        for threshold, (window_bits, mem_level), takeover in itertools.product(
+                config.thresholds, config.contexts, config.no_context_takeover):
+            runs.append({
+                'setting': {
+                    'threshold': threshold,
+                    'window_bits': window_bits,
+                    'mem_level': mem_level,
+                    'no_context_takeover': takeover,
+                },
+                'context_memory_bytes': (
+                    0 if takeover else context_memory(window_bits, mem_level)),
+                **measure(payloads, threshold, window_bits, mem_level, takeover),
+            })
+        results['traffic'][kind] = {
+            'frames': len(payloads),
+            'median_frame_bytes': sizes[len(sizes) // 2],
+            'max_frame_bytes': sizes[-1],
+            'runs': runs,
+        }
+    return results
@@ -3,23 +3,311 @@ Consumers for public chat and personal chat.
 """
 
 from datetime import datetime
+from time import perf_counter
 
+import asyncio
 import json
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from chat import metrics, routers
 from rooms.models import (
     PersonalChatRoom,
     Message
 )
+from rooms.heartbeat import HeartbeatMixin
+from rooms.profiling import profiled
+from rooms import (
+    attachments,
+    directory,
+    edits,
+    notifications,
+    replay,
+    sharding,
+    streams,
+    tracing,
+    typing_indicators,
+)
+
+
+def format_timestamp(timestamp):
+    """Format a message time the way the chat pages display it."""
+    return timestamp.strftime(
+        '%I:%M %p').replace('AM', 'a.m').replace('PM', 'p.m.')
+
+
+class ChatConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
+    """
+    Base consumer that records connection, frame and broadcast metrics
+    and the latency traces of the messages it delivers, keeps the
+    connection alive with a heartbeat, relays typing indicators and,
+    when durable delivery is enabled, reads chat events from the room
+    stream.
+    """
+    room_kind = None
+    tracked_room = None
+    acks = None
+    typing_throttle = None
+    typing_indicators = None
+    typing_name = None
+    stream_offset = None
+    stream_lock = None
+
+    async def websocket_connect(self, message):
+        streams.hold_clients()
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        try:
+            await super().websocket_disconnect(message)
+        finally:
+            await streams.release_clients()
+
+    async def websocket_receive(self, message):
+        metrics.MESSAGES_RECEIVED.labels(type(self).__name__).inc()
+        await super().websocket_receive(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None or bytes_data is not None:
+            metrics.MESSAGES_SENT.labels(type(self).__name__).inc()
+        await super().send(text_data, bytes_data, close)
+
+    async def group_send(self, group, message):
+        """
+        Send a message to a channel layer group and record how long
+        the channel layer took to accept it.
+        """
+        start = perf_counter()
+        await self.channel_layer.group_send(group, message)
+        metrics.GROUP_SEND_SECONDS.labels(type(self).__name__).observe(
+            perf_counter() - start)
+
+    async def room_send(self, event):
+        """Send an event to every connection of the room."""
+        await self.group_send(self.room_group(), event)
+
+    async def broadcast(self, event):
+        """
+        Deliver a chat event to the room. With durable delivery the
+        event is appended to the room stream and the room is only
+        notified to read it.
+        """
+        if streams.enabled():
+            await streams.publish(self.room_group(), event)
+            event = {'type': 'stream_notify'}
+        await self.room_send(event)
+
+    async def start_stream(self, group):
+        """
+        Start reading a group's stream, from the `offset` the client
+        reconnected with or else from its latest entry. Return True if
+        the client resumes from an offset.
+        """
+        if not streams.enabled():
+            return False
+        self.stream_lock = asyncio.Lock()
+        offset = streams.parse_offset(replay.query_param(self.scope, 'offset'))
+        if offset is None:
+            self.stream_offset = await streams.last_offset(group)
+            return False
+        self.stream_offset = offset
+        if not await streams.is_retained(group, offset):
+            await self.send(text_data=json.dumps(
+                replay.resume_frame([], complete=False)))
+        await self.read_stream()
+        return True
+
+    async def read_stream(self):
+        """
+        Dispatch the stream entries after this connection's offset to
+        their handlers, advancing the offset as they are sent.
+        """
+        if self.stream_lock is None:
+            return
+        async with self.stream_lock:
+            count = streams.config()['read_count']
+            while True:
+                entries = await streams.read_after(
+                    self.room_group(), self.stream_offset)
+                for offset, event in entries:
+                    await self.dispatch({**event, 'offset': offset})
+                    self.stream_offset = offset
+                if len(entries) < count:
+                    return
+
+    async def stream_notify(self, event):
+        """Receives the notification of new entries in the room stream."""
+        await self.read_stream()
+
+    async def heartbeat_tick(self):
+        # Catch up on entries whose notification was lost.
+        await self.read_stream()
+
+    def stream_fields(self, event):
+        """Return the stream offset of an event to include in frames."""
+        return {'offset': event['offset']} if 'offset' in event else {}
+
+    def track_connection(self, room):
+        """
+        Count this connection as active in the given room.
+        """
+        self.tracked_room = room
+        self.acks = tracing.AckTracker(self.room_kind)
+        metrics.ACTIVE_CONNECTIONS.labels(self.room_kind).inc()
+
+    def untrack_connection(self):
+        """
+        Stop counting this connection.
+        """
+        if self.tracked_room is None:
+            return
+        metrics.ACTIVE_CONNECTIONS.labels(self.room_kind).dec()
+        self.tracked_room = None
+
+    def trace_fields(self, event):
+        """
+        Record the delivery of a traced event to this connection and
+        return the trace fields to include in the client frame.
+        """
+        if self.acks is not None:
+            self.acks.delivered(event)
+        return tracing.frame_fields(event)
+
+    def handle_control(self, data):
+        """
+        Handle heartbeat pongs and latency acks. Return False if the
+        frame is not a control frame.
+        """
+        if not isinstance(data, dict):
+            return False
+        frame_type = data.get('type')
+        if frame_type == 'ack':
+            if self.acks is not None:
+                self.acks.acknowledge(data.get('trace_id'))
+            return True
+        return frame_type == 'pong'
+
+    def room_group(self):
+        """
+        Return the group of the room, which typing indicators and
+        stream notifications are sent to.
+        """
+        raise NotImplementedError
+
+    async def handle_typing(self, data, name):
+        """
+        Add the typing state of the given user to the room's next merged
+        typing event, unless it is throttled. Return False if the frame
+        is not a typing frame.
+        """
+        if not isinstance(data, dict) or data.get('type') != 'typing':
+            return False
+        if not isinstance(name, str) or not name:
+            return True
+        if self.typing_throttle is None:
+            self.typing_throttle = typing_indicators.TypingThrottle()
+        active = data.get('active', True) is not False
+        if active:
+            allowed = self.typing_throttle.start()
+        else:
+            allowed = self.typing_throttle.stop()
+        if not allowed:
+            metrics.TYPING_EVENTS.labels(type(self).__name__, 'throttled').inc()
+            return True
+
+        self.typing_name = name
+        metrics.TYPING_EVENTS.labels(type(self).__name__, 'broadcast').inc()
+        typing_indicators.room_typers(self.room_group(), self.room_send).update(
+            name, active)
+        return True
+
+    async def stop_typing(self):
+        """
+        Stop the typing indicator of this connection, if it is shown.
+        """
+        if self.typing_throttle is not None and self.typing_throttle.stop():
+            typing_indicators.room_typers(self.room_group(), self.room_send).update(
+                self.typing_name, False)
 
+    async def typing_stopped(self, name):
+        """Forget a typer whose message just arrived."""
+        typers = typing_indicators.room_typers(self.room_group())
+        if typers is not None:
+            typers.update(name, False)
+        if self.typing_indicators is not None:
+            await self.typing_indicators.remove(name, self.typing_name)
 
-class PublicRoomConsumer(AsyncWebsocketConsumer):
+    async def send_typing(self, users):
+        await self.send(text_data=json.dumps(
+            typing_indicators.typing_frame(users)))
+
+    async def typing_update(self, event):
+        """
+        Receives the typers of a worker in the room and sends the
+        merged typers of all workers if they changed.
+        """
+        if self.typing_indicators is None:
+            self.typing_indicators = typing_indicators.TypingIndicators(
+                self.send_typing)
+        await self.typing_indicators.update(
+            event['worker'], event['users'], event['expires'], self.typing_name)
+
+
+class PublicRoomConsumer(ChatConsumer):
     """
     WebSocket consumer for handling chat functionality in a group chat setting.
+    Connections of large rooms are spread over shard groups, and
+    counted in the public room directory.
     """
+    room_kind = 'public'
     users_count = {}
+    member_group = None
+    listed = False
+
+    def heartbeat_groups(self):
+        return [self.member_group]
+
+    def room_group(self):
+        return self.room_group_name
+
+    async def room_view(self, fresh=False):
+        """Return this worker's view of the room's groups and occupancy."""
+        view = sharding.room_views.get(self.room_group_name)
+        if fresh or view.stale():
+            await view.refresh(
+                self.channel_layer,
+                fallback=self.users_count.get(self.room_group_name, 0))
+        return view
+
+    async def room_send(self, event):
+        """Send an event to the room group and its shards in parallel."""
+        view = await self.room_view()
+        await asyncio.gather(*(
+            self.group_send(group, event) for group in view.targets))
+
+    async def send_user_count(self):
+        """Broadcast the occupancy of the room across all its groups."""
+        view = await self.room_view(fresh=True)
+        await self.room_send({
+            'type': 'user_count',
+            'count': view.occupancy,
+        })
+
+    async def heartbeat_tick(self):
+        """
+        Move the connection to the group it belongs in since the room
+        was sharded or unsharded.
+        """
+        await super().heartbeat_tick()
+        view = await self.room_view()
+        group = view.member_group(self.channel_name)
+        if group != self.member_group:
+            await self.channel_layer.group_add(group, self.channel_name)
+            previous, self.member_group = self.member_group, group
+            await self.channel_layer.group_discard(previous, self.channel_name)
 
+    @profiled
     async def connect(self):
         """
         Handles a new WebSocket connection to the chat.Initializes the 
@@ -29,8 +317,10 @@ class PublicRoomConsumer(AsyncWebsocketConsumer):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
 
+        view = await self.room_view(fresh=True)
+        self.member_group = view.member_group(self.channel_name)
         await self.channel_layer.group_add(
-            self.room_group_name,
+            self.member_group,
             self.channel_name
         )
 
@@ -39,15 +329,27 @@ class PublicRoomConsumer(AsyncWebsocketConsumer):
         self.users_count[self.room_group_name] += 1
 
         await self.accept()
+        self.track_connection(self.room_name)
+        directory.room_directory.joined(self.room_name)
+        self.listed = True
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_count',
-                'count': self.users_count[self.room_group_name]
-            }
-        )
+        await self.send_user_count()
+        if not await self.start_stream(self.room_group_name):
+            await self.resume()
+
+    async def resume(self):
+        """
+        Send the frames buffered on this worker after the client's
+        `last_seen` message id, if it reconnected with one.
+        """
+        last_seen = replay.parse_last_seen(self.scope)
+        if last_seen is None:
+            return
+        frames, complete = replay.replay_buffer.since(self.room_group_name, last_seen)
+        await self.send(text_data=json.dumps(
+            replay.resume_frame(frames, complete)))
 
+    @profiled
     async def disconnect(self, code):
         """
         Handles the WebSocket disconnection. Decrements the 
@@ -55,45 +357,51 @@ class PublicRoomConsumer(AsyncWebsocketConsumer):
         to the group.
         """
         await self.channel_layer.group_discard(
-            self.room_group_name,
+            self.member_group,
             self.channel_name
         )
 
         if self.room_group_name in self.users_count:
             self.users_count[self.room_group_name] -= 1
+        if self.listed:
+            directory.room_directory.left(self.room_name)
+            self.listed = False
+        self.untrack_connection()
+        await self.stop_typing()
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_count',
-                'count': self.users_count[self.room_group_name]
-            }
-        )
+        await self.send_user_count()
+        if not self.users_count.get(self.room_group_name):
+            sharding.room_views.forget(self.room_group_name)
 
+    @profiled
     async def receive(self, text_data):
         """
         Handles incoming messages sent by the WebSocket client.
         Parses the incoming JSON message and broadcasts it to the group.
         """
+        trace = tracing.start_trace()
         try:
             data = json.loads(text_data)
+            if self.handle_control(data):
+                return
+            if await self.handle_typing(data, data.get('username')):
+                return
             message = data['message']
             username = data['username']
-        except (json.JSONDecodeError, KeyError):
+        except (json.JSONDecodeError, KeyError, TypeError):
             await self.send(text_data=json.dumps({
                 'error': 'Invalid message format or missing data'
             }))
             return
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username
-            }
-        )
+        await self.broadcast({
+            'type': 'chat_message',
+            'message': message,
+            'username': username,
+            **tracing.mark_broadcast(trace),
+        })
 
+    @profiled
     async def chat_message(self, event):
         """
         Receives messages sent to the group and sends them 
@@ -102,11 +410,19 @@ class PublicRoomConsumer(AsyncWebsocketConsumer):
         message = event['message']
         username = event['username']
 
-        await self.send(text_data=json.dumps({
+        frame = {
+            'id': event['trace_id'],
             'message': message,
-            'username': username
-        }))
+            'username': username,
+            **self.trace_fields(event),
+            **self.stream_fields(event),
+        }
+        replay.replay_buffer.add(self.room_group_name, frame['id'], frame)
+
+        await self.send(text_data=json.dumps(frame))
+        await self.typing_stopped(username)
 
+    @profiled
     async def user_count(self, event):
         """
         Receives user count updates and sends them to 
@@ -119,20 +435,43 @@ class PublicRoomConsumer(AsyncWebsocketConsumer):
         }))
 
 
-class PersonalChatConsumer(AsyncWebsocketConsumer):
+class PersonalChatConsumer(ChatConsumer):
     """
     WebSocket consumer for handling chat functionality in a 
-    personal chat.
+    personal chat. Files are uploaded as chunked binary frames, see
+    `rooms.attachments`; messages are edited and deleted with change
+    frames, see `rooms.edits`. New messages are also noticed to the
+    devices of every participant, see `rooms.notifications`.
     """
+    room_kind = 'personal'
+    uploads = None
+    participants = None
 
+    def heartbeat_groups(self):
+        return [self.chat_group_name]
+
+    def room_group(self):
+        return self.chat_group_name
+
+    @profiled
     async def connect(self):
         """
         Handles a new WebSocket connection to the personal chat.
         Initializes the chat ID and group, adds the connection to the group.
+        Connections of users who aren't participants of the chat are
+        refused before they can read its group, stream or history.
         """
         self.user = self.scope['user']
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
         self.chat_group_name = f'chat_{self.chat_id}'
+        is_participant = self.user.is_authenticated and await (
+            PersonalChatRoom.objects.filter(
+                id=self.chat_id, participants=self.user).aexists())
+        if not is_participant:
+            await self.close()
+            return
+        if routers.replica_configured():
+            await routers.abind_user(self.user.id)
 
         await self.channel_layer.group_add(
             self.chat_group_name,
@@ -140,7 +479,55 @@ class PersonalChatConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        self.track_connection(self.chat_id)
+        if not await self.start_stream(self.chat_group_name):
+            await self.resume()
+
+    async def resume(self):
+        """
+        Send the messages stored after the client's `last_seen` message
+        id in one frame, if it reconnected with one, with the edits and
+        deletions of earlier messages made after `changed_since`. The
+        frame is marked incomplete when more than CHAT_RESUME_LIMIT
+        messages or changes were missed.
+        """
+        last_seen = replay.parse_last_seen(self.scope)
+        if last_seen is None or not last_seen.isdigit():
+            return
+
+        limit = replay.resume_limit()
+        missed = Message.objects.filter(
+            chat_id=self.chat_id,
+            id__gt=int(last_seen),
+            deleted=False,
+        ).select_related('sender', 'attachment').order_by('id')[:limit + 1]
+        messages = [
+            {
+                'id': message.id,
+                'message': message.content,
+                'sender': message.sender.username,
+                'timestamp': format_timestamp(message.timestamp),
+                'version': message.version,
+                **self.attachment_fields(message.attachment),
+            }
+            async for message in missed
+        ]
+        complete = len(messages) <= limit
+
+        changes = None
+        since = edits.from_ms(replay.query_param(self.scope, 'changed_since'))
+        if since is not None:
+            changed = edits.changes_since(self.chat_id, int(last_seen), since)
+            changes = [
+                edits.change_frame(message)
+                async for message in changed[:limit + 1]
+            ]
+            complete = complete and len(changes) <= limit
+            changes = changes[:limit]
+        await self.send(text_data=json.dumps(replay.resume_frame(
+            messages[:limit], complete=complete, changes=changes)))
 
+    @profiled
     async def disconnect(self, code):
         """
         Handles the WebSocket disconnection.
@@ -149,37 +536,77 @@ class PersonalChatConsumer(AsyncWebsocketConsumer):
             self.chat_group_name,
             self.channel_name
         )
+        self.untrack_connection()
+        await self.stop_typing()
+        for upload in (self.uploads or {}).values():
+            upload.close()
+        self.uploads = None
 
+    @profiled
     async def receive(self, text_data=None, bytes_data=None):
         """
         Handles incoming messages sent by the WebSocket client.
         Parses the incoming JSON message, saves it to the database, 
-        and broadcasts it to the group.
+        and broadcasts it to the group. The message is stamped with the
+        server receive time; the client timestamp is not trusted.
+        Binary frames are attachment chunks.
         """
+        trace = tracing.start_trace()
+        if bytes_data is not None:
+            await self.receive_chunk(bytes_data, trace)
+            return
         data = json.loads(text_data)
+        if self.handle_control(data):
+            return
+        if await self.handle_typing(data, self.user.username):
+            return
+        if isinstance(data, dict) and data.get('type') == 'upload_start':
+            await self.start_upload(data, trace)
+            return
+        if isinstance(data, dict) and data.get('type') in ('edit', 'delete'):
+            await self.change_message(data)
+            return
         message = data['message']
-        timestamp = datetime.fromtimestamp(data['timestamp'] / 1000)
+        timestamp = datetime.fromtimestamp(trace['received_at'] / 1000)
 
-        chat = await PersonalChatRoom.objects.aget(
-            id=self.chat_id
-        )
-        await Message.objects.acreate(
-            chat=chat,
+        start = perf_counter()
+        saved = await Message.objects.acreate(
+            chat_id=self.chat_id,
             sender=self.user,
             content=message,
             timestamp=timestamp,
         )
+        metrics.DB_WRITE_SECONDS.observe(perf_counter() - start)
 
-        await self.channel_layer.group_send(
-            self.chat_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'sender': self.user.username,
-                'timestamp': timestamp.strftime(
-                    '%I:%M %p').replace('AM', 'a.m').replace('PM', 'p.m.'),
-            })
+        await self.broadcast({
+            'type': 'chat_message',
+            'id': saved.id,
+            'message': message,
+            'sender': self.user.username,
+            'timestamp': format_timestamp(timestamp),
+            **tracing.mark_broadcast(trace),
+        })
+        await self.notify_participants(saved.id, message)
+
+    async def notify_participants(self, message_id, content, attachment=None):
+        """
+        Send the notice of a new message to the devices of every
+        participant of the chat, the sender's other devices included.
+        """
+        if self.participants is None:
+            self.participants = await notifications.participant_ids(self.chat_id)
+        event = {
+            'type': 'chat_notice',
+            'notice': notifications.notice_frame(
+                int(self.chat_id), message_id, self.user.username, content,
+                attachment),
+        }
+        await asyncio.gather(*(
+            self.group_send(notifications.user_group(user_id), event)
+            for user_id in self.participants))
+        metrics.NOTICES_SENT.inc(len(self.participants))
 
+    @profiled
     async def chat_message(self, event):
         """
         Receives messages sent to the personal chat group and sends 
@@ -190,7 +617,284 @@ class PersonalChatConsumer(AsyncWebsocketConsumer):
         timestamp = event['timestamp']
 
         await self.send(text_data=json.dumps({
+            'id': event['id'],
             'message': message,
             'sender': sender,
             'timestamp': timestamp,
+            **({'attachment': event['attachment']} if 'attachment' in event else {}),
+            **self.trace_fields(event),
+            **self.stream_fields(event),
+        }))
+        await self.typing_stopped(sender)
+
+    async def change_message(self, data):
+        """
+        Edit or delete one of the user's messages and broadcast the
+        change, or tell the client why it was refused.
+        """
+        try:
+            if not self.user.is_authenticated:
+                raise edits.EditError('Authentication required')
+            if data['type'] == 'edit':
+                message = await sync_to_async(edits.edit_message)(
+                    self.user, self.chat_id, data.get('id'),
+                    data.get('message'), data.get('version'))
+            else:
+                message = await sync_to_async(edits.delete_message)(
+                    self.user, self.chat_id, data.get('id'), data.get('version'))
+        except edits.EditError as error:
+            metrics.MESSAGE_CHANGES.labels('refused').inc()
+            await self.send(text_data=json.dumps({
+                'type': 'change_error',
+                'id': data.get('id'),
+                'error': str(error),
+            }))
+            return
+        metrics.MESSAGE_CHANGES.labels(data['type']).inc()
+        await self.broadcast({
+            'type': 'message_changed',
+            'change': edits.change_frame(message),
+        })
+
+    async def message_changed(self, event):
+        """
+        Receives edits and deletions of the chat's messages and sends
+        them to the WebSocket client.
+        """
+        await self.send(text_data=json.dumps({
+            **event['change'],
+            **self.stream_fields(event),
+        }))
+
+    def attachment_fields(self, attachment):
+        """Return the attachment of a message to include in frames."""
+        if attachment is None:
+            return {}
+        return {'attachment': attachments.attachment_fields(attachment)}
+
+    async def send_upload_error(self, upload_id, error, offset=None):
+        metrics.ATTACHMENT_UPLOADS.labels('rejected').inc()
+        frame = {'type': 'upload_error', 'upload_id': upload_id, 'error': str(error)}
+        if offset is not None:
+            frame['offset'] = offset
+        await self.send(text_data=json.dumps(frame))
+
+    async def start_upload(self, data, trace):
+        """
+        Start a new upload, or resume the one named by `upload_id`, and
+        tell the client the offset to send chunks from.
+        """
+        upload_id = data.get('upload_id')
+        if not self.user.is_authenticated:
+            await self.send_upload_error(upload_id, 'Authentication required')
+            return
+        try:
+            if upload_id is not None:
+                attachment = await sync_to_async(attachments.find_upload)(
+                    self.user, self.chat_id, upload_id)
+            else:
+                attachment = await sync_to_async(attachments.reserve)(
+                    self.user, self.chat_id, data.get('name'), data.get('size'),
+                    data.get('content_type'), data.get('sha256'),
+                    data.get('message'))
+        except attachments.UploadError as error:
+            await self.send_upload_error(upload_id, error)
+            return
+
+        if self.uploads is None:
+            self.uploads = {}
+        previous = self.uploads.pop(attachment.id, None)
+        if previous is not None:
+            previous.close()
+        loop = asyncio.get_running_loop()
+        upload = await loop.run_in_executor(None, attachments.Upload, attachment)
+        self.uploads[attachment.id] = upload
+
+        await self.send(text_data=json.dumps({
+            'type': 'upload_ready',
+            'upload_id': attachment.id,
+            'offset': upload.offset,
+            'chunk_size': attachments.config()['chunk_size'],
         }))
+        if upload.complete:
+            await self.finish_upload(upload, trace)
+
+    async def receive_chunk(self, bytes_data, trace):
+        """
+        Write a chunk to its upload's file and acknowledge the new
+        offset, finishing the upload after its last chunk.
+        """
+        upload_id = upload = None
+        try:
+            upload_id, offset, chunk = attachments.parse_chunk(bytes_data)
+            upload = (self.uploads or {}).get(upload_id)
+            if upload is None:
+                raise attachments.UploadError('Unknown upload')
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, upload.write, offset, chunk)
+        except attachments.UploadError as error:
+            await self.send_upload_error(
+                upload_id, error, upload.offset if upload else None)
+            return
+        except OSError:
+            await self.abort_upload(upload)
+            return
+        metrics.ATTACHMENT_BYTES.inc(len(chunk))
+
+        if upload.complete:
+            await self.finish_upload(upload, trace)
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'upload_progress',
+            'upload_id': upload_id,
+            'offset': upload.offset,
+        }))
+
+    async def abort_upload(self, upload):
+        """
+        Drop an upload whose file couldn't be written. There is no offset
+        to resume from, so the client has to start over.
+        """
+        upload_id = upload.attachment.id
+        self.uploads.pop(upload_id, None)
+        await sync_to_async(upload.abort)()
+        await self.send_upload_error(upload_id, 'Could not store the file')
+
+    async def finish_upload(self, upload, trace):
+        """
+        Verify a fully received upload and post it as a message of the
+        chat, with its caption.
+        """
+        attachment = upload.attachment
+        del self.uploads[attachment.id]
+        try:
+            await sync_to_async(upload.finish)()
+        except attachments.UploadError as error:
+            await self.send_upload_error(attachment.id, error)
+            return
+        except OSError:
+            await self.abort_upload(upload)
+            return
+        metrics.ATTACHMENT_UPLOADS.labels('completed').inc()
+
+        timestamp = datetime.fromtimestamp(trace['received_at'] / 1000)
+        saved = await Message.objects.acreate(
+            chat_id=self.chat_id,
+            sender=self.user,
+            content=attachment.caption,
+            timestamp=timestamp,
+            attachment=attachment,
+        )
+        await self.broadcast({
+            'type': 'chat_message',
+            'id': saved.id,
+            'message': attachment.caption,
+            'sender': self.user.username,
+            'timestamp': format_timestamp(timestamp),
+            **self.attachment_fields(attachment),
+            **tracing.mark_broadcast(trace),
+        })
+        await self.notify_participants(saved.id, attachment.caption, attachment)
+
+
+class NotificationConsumer(ChatConsumer):
+    """
+    WebSocket consumer delivering the notices of new messages in all
+    the personal chats of the signed-in user, one connection per device.
+    """
+    room_kind = 'notifications'
+    user_group_name = None
+
+    def heartbeat_groups(self):
+        return [self.user_group_name]
+
+    def room_group(self):
+        return self.user_group_name
+
+    @profiled
+    async def connect(self):
+        """
+        Adds the connection of a signed-in user to the user's group.
+        Anonymous connections are refused.
+        """
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.user_group_name = notifications.user_group(self.user.id)
+
+        await self.channel_layer.group_add(
+            self.user_group_name,
+            self.channel_name,
+        )
+        await self.accept()
+        self.track_connection('notifications')
+
+    @profiled
+    async def disconnect(self, code):
+        """
+        Handles the WebSocket disconnection.
+        """
+        if self.user_group_name is None:
+            return
+        await self.channel_layer.group_discard(
+            self.user_group_name,
+            self.channel_name
+        )
+        self.untrack_connection()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Only heartbeat pongs are expected from the client.
+        """
+        if text_data is not None:
+            self.handle_control(json.loads(text_data))
+
+    async def chat_notice(self, event):
+        """
+        Receives the notices of new messages in the user's chats and
+        sends them to the WebSocket client.
+        """
+        await self.send(text_data=json.dumps(event['notice']))
+
+
+class DirectoryConsumer(ChatConsumer):
+    """
+    WebSocket consumer sending the most occupied public rooms when the
+    connection opens and whenever the worker's snapshot changes.
+    """
+    room_kind = 'directory'
+
+    @profiled
+    async def connect(self):
+        """
+        Accepts the connection and sends the current directory.
+        """
+        await self.accept()
+        self.track_connection('directory')
+        rooms = await directory.room_directory.snapshot()
+        directory.room_directory.subscribe(self.send_directory)
+        await self.send_directory(rooms)
+
+    @profiled
+    async def disconnect(self, code):
+        """
+        Handles the WebSocket disconnection.
+        """
+        directory.room_directory.unsubscribe(self.send_directory)
+        self.untrack_connection()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Only heartbeat pongs are expected from the client.
+        """
+        if text_data is not None:
+            self.handle_control(json.loads(text_data))
+
+    async def send_directory(self, rooms):
+        await self.send(text_data=json.dumps(directory.directory_frame(rooms)))
+
+
+metrics.USERS_COUNT_ROOMS.set_function(
+    lambda: len(PublicRoomConsumer.users_count)
+)
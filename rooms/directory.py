@@ -0,0 +1,285 @@
+"""
+Live directory of the active public rooms.
+
+The occupancy of every public room is kept in one Redis sorted set,
+`<prefix>`, scored by connections. `PublicRoomConsumer` counts the
+connections it accepts and closes in the worker's `Directory`, and each
+worker adds the deltas of the last `interval` seconds to the set with a
+single script call, so the index is maintained incrementally instead of
+being computed from the channel layer groups.
+
+Each worker also keeps its own contribution in the hash
+`<prefix>:worker:<id>` under a liveness key it renews on every flush.
+When a worker dies without closing its connections, another worker
+notices the expired liveness key and subtracts the dead worker's counts
+from the index. A worker that was only cut off from Redis for that long
+finds itself reaped on its next flush and writes all its counts again.
+
+After each flush the worker reads the top `top` rooms into memory. The
+directory view answers from that snapshot and `DirectoryConsumer`
+connections receive it whenever it changes, so no request aggregates
+anything. Processes without an event loop refresh the snapshot on
+demand, at most once per interval.
+"""
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+import redis
+
+from chat import metrics
+from rooms import streams
+
+DEFAULTS = {
+    'url': 'redis://redis:6379/0',
+    'prefix': 'room-directory',
+    'interval': 1.0,
+    'top': 50,
+    'worker_ttl': 30,
+}
+
+# KEYS: index, worker hash, worker liveness, worker set.
+# ARGV: liveness ttl, worker id, mode, then room and count pairs. In
+# 'delta' mode the counts are added to the worker's; the script returns
+# 0 without applying them if the worker was reaped. In 'full' mode they
+# replace the worker's counts.
+APPLY_SCRIPT = '''
+if ARGV[3] == 'delta' and redis.call('SISMEMBER', KEYS[4], ARGV[2]) == 0 then
+    return 0
+end
+if ARGV[3] == 'full' then
+    local counts = redis.call('HGETALL', KEYS[2])
+    for i = 1, #counts, 2 do
+        redis.call('ZINCRBY', KEYS[1], -counts[i + 1], counts[i])
+    end
+    redis.call('DEL', KEYS[2])
+end
+for i = 4, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], ARGV[i + 1], ARGV[i])
+    if redis.call('HINCRBY', KEYS[2], ARGV[i], ARGV[i + 1]) <= 0 then
+        redis.call('HDEL', KEYS[2], ARGV[i])
+    end
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', 0)
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[2])
+return 1
+'''
+
+# KEYS: index, worker hash, worker liveness, worker set. ARGV: worker id.
+REAP_SCRIPT = '''
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+local counts = redis.call('HGETALL', KEYS[2])
+for i = 1, #counts, 2 do
+    redis.call('ZINCRBY', KEYS[1], -counts[i + 1], counts[i])
+end
+redis.call('DEL', KEYS[2])
+redis.call('SREM', KEYS[4], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', 0)
+return 1
+'''
+
+_sync_clients = {}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_DIRECTORY', {})}
+
+
+def worker_keys(worker_id):
+    """Return the index, hash, liveness and worker set keys of a worker."""
+    prefix = config()['prefix']
+    return [
+        prefix,
+        f'{prefix}:worker:{worker_id}',
+        f'{prefix}:alive:{worker_id}',
+        f'{prefix}:workers',
+    ]
+
+
+def directory_frame(rooms):
+    return {'type': 'directory', 'rooms': rooms}
+
+
+def _rooms(entries):
+    return [
+        {'room': room.decode(), 'users': int(users)}
+        for room, users in entries
+    ]
+
+
+def _sync_client(url):
+    client = _sync_clients.get(url)
+    if client is None:
+        client = _sync_clients[url] = redis.Redis.from_url(url)
+    return client
+
+
+class Directory:
+    """
+    A worker's share of the room occupancy index and its snapshot of
+    the most occupied rooms.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.local = Counter()
+        self.pending = Counter()
+        self.synced = False
+        self.rooms = []
+        self.published = None
+        self.refreshed_at = None
+        self.reaped_at = 0.0
+        self.subscribers = set()
+        self.task = None
+
+    def joined(self, room):
+        self.update(room, 1)
+
+    def left(self, room):
+        self.update(room, -1)
+
+    def update(self, room, delta):
+        self.local[room] += delta
+        if self.local[room] <= 0:
+            del self.local[room]
+        self.pending[room] += delta
+        self.start()
+
+    def subscribe(self, subscriber):
+        """
+        Send the snapshot to `subscriber`, an async callable, whenever
+        it changes.
+        """
+        self.subscribers.add(subscriber)
+        self.start()
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def start(self):
+        """Run the flush loop on the running event loop, if it isn't."""
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+
+    def idle(self):
+        return not (self.local or self.pending or self.subscribers)
+
+    async def run(self):
+        interval = config()['interval']
+        streams.hold_clients()
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.flush()
+                    await self.refresh()
+                except redis.RedisError:
+                    metrics.DIRECTORY_ERRORS.inc()
+                    continue
+                if self.idle():
+                    return
+        finally:
+            await streams.release_clients()
+
+    async def flush(self):
+        """
+        Add the pending deltas to the index and renew this worker. The
+        first flush, and the first after this worker was reaped while
+        cut off from Redis, write all of its counts instead.
+        """
+        deltas = {room: delta for room, delta in self.pending.items() if delta}
+        self.pending.clear()
+        if not deltas and not self.local:
+            return
+        options = config()
+        client = streams.loop_client(options['url'])
+        keys = worker_keys(self.worker_id)
+        try:
+            if self.synced and await client.eval(
+                    APPLY_SCRIPT, 4, *keys, *self._args('delta', deltas)):
+                metrics.DIRECTORY_DELTAS.inc(len(deltas))
+                return
+            await client.eval(APPLY_SCRIPT, 4, *keys, *self._args('full', self.local))
+        except redis.RedisError:
+            # Retry them with the next flush.
+            self.pending.update(deltas)
+            raise
+        self.synced = True
+        metrics.DIRECTORY_DELTAS.inc(len(self.local))
+
+    def _args(self, mode, counts):
+        args = [config()['worker_ttl'], self.worker_id, mode]
+        for room, count in counts.items():
+            args += [room, count]
+        return args
+
+    async def refresh(self):
+        """Read the top rooms and send them to subscribers if they changed."""
+        options = config()
+        client = streams.loop_client(options['url'])
+        if time.monotonic() - self.reaped_at >= options['worker_ttl']:
+            self.reaped_at = time.monotonic()
+            await self.reap(client)
+        rooms = _rooms(await client.zrevrange(
+            options['prefix'], 0, options['top'] - 1, withscores=True))
+        self.rooms = rooms
+        self.refreshed_at = time.monotonic()
+        metrics.DIRECTORY_ROOMS.set(len(rooms))
+        if rooms == self.published:
+            return
+        self.published = rooms
+        await asyncio.gather(*(
+            subscriber(rooms) for subscriber in list(self.subscribers)),
+            return_exceptions=True)
+
+    async def reap(self, client):
+        """Remove the counts of workers whose liveness key expired."""
+        workers = await client.smembers(worker_keys(self.worker_id)[3])
+        for worker_id in workers:
+            worker_id = worker_id.decode()
+            if worker_id != self.worker_id:
+                await client.eval(
+                    REAP_SCRIPT, 4, *worker_keys(worker_id), worker_id)
+
+    def stale(self):
+        return (self.refreshed_at is None
+                or time.monotonic() - self.refreshed_at >= config()['interval'])
+
+    async def snapshot(self):
+        """
+        Return the snapshot of the most occupied rooms, the last one
+        read if Redis can't be reached.
+        """
+        if self.stale():
+            try:
+                await self.refresh()
+            except redis.RedisError:
+                metrics.DIRECTORY_ERRORS.inc()
+        return self.rooms
+
+    def top(self, limit=None):
+        """
+        Return the snapshot of the most occupied rooms, reading it from
+        Redis first if no flush loop refreshed it within the interval.
+        While Redis can't be reached, the last snapshot is served and
+        read again after an interval.
+        """
+        if self.stale():
+            options = config()
+            try:
+                self.rooms = _rooms(_sync_client(options['url']).zrevrange(
+                    options['prefix'], 0, options['top'] - 1, withscores=True))
+            except redis.RedisError:
+                metrics.DIRECTORY_ERRORS.inc()
+            self.refreshed_at = time.monotonic()
+        return self.rooms[:limit]
+
+
+room_directory = Directory()
@@ -0,0 +1,114 @@
+"""
+Editing and deleting personal chat messages.
+
+An edit replaces the content of a message and increments its version.
+A deletion leaves a tombstone: the message keeps its id, loses its
+content and attachment, and is marked deleted under a new version. Both
+only apply to the version the client last saw, so that concurrent
+changes don't overwrite each other, and both stamp the message with the
+time of the change.
+
+Connected clients receive a change frame naming the message id and its
+new version, and patch the message in place. Clients reconnecting with
+`changed_since=<ms>` get the changes they missed since in their resume
+frame. Clients apply a change only over an older version of a message,
+so changes may arrive twice or out of order.
+"""
+from datetime import datetime
+
+from django.db import transaction
+
+from rooms.history import invalidate_history
+from rooms.models import Message
+
+# Pages resume the changes made from this long before they were
+# rendered, which covers edits stamped before they were committed.
+CHANGE_MARGIN_MS = 5000
+
+
+class EditError(Exception):
+    """An edit or deletion that is refused."""
+
+
+def to_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def from_ms(value):
+    """Return the time of a `changed_since` parameter, or None."""
+    if value is None or not str(value).isdigit():
+        return None
+    return datetime.fromtimestamp(int(value) / 1000)
+
+
+def _own_message(user, chat_id, message_id):
+    if not isinstance(message_id, int):
+        raise EditError('Unknown message')
+    try:
+        return Message.objects.select_related('attachment').get(
+            id=message_id, chat_id=chat_id, sender=user, deleted=False)
+    except Message.DoesNotExist:
+        raise EditError('Unknown message') from None
+
+
+def _change(message, version, **fields):
+    """Apply `fields` to a message if it is still at `version`."""
+    if version is None:
+        version = message.version
+    elif not isinstance(version, int):
+        raise EditError('Invalid version')
+    changed = datetime.now()
+    updated = Message.objects.filter(
+        id=message.id, version=version, deleted=False,
+    ).update(version=version + 1, changed=changed, **fields)
+    if not updated:
+        raise EditError('Message changed')
+    for name, value in fields.items():
+        setattr(message, name, value)
+    message.version = version + 1
+    message.changed = changed
+
+
+def edit_message(user, chat_id, message_id, content, version=None):
+    """Replace the content of one of the user's messages."""
+    if not isinstance(content, str) or not content.strip():
+        raise EditError('Empty message')
+    message = _own_message(user, chat_id, message_id)
+    _change(message, version, content=content)
+    invalidate_history(message.chat_id)
+    return message
+
+
+def delete_message(user, chat_id, message_id, version=None):
+    """Replace one of the user's messages, and its attachment, by a tombstone."""
+    message = _own_message(user, chat_id, message_id)
+    attachment = message.attachment
+    with transaction.atomic():
+        _change(message, version, content='', deleted=True, attachment=None)
+        if attachment is not None:
+            attachment.delete()
+    invalidate_history(message.chat_id)
+    return message
+
+
+def change_frame(message):
+    """Build the frame telling clients about an edit or a deletion."""
+    frame = {
+        'type': 'delete' if message.deleted else 'edit',
+        'id': message.id,
+        'version': message.version,
+        'changed': to_ms(message.changed),
+    }
+    if not message.deleted:
+        frame['message'] = message.content
+    return frame
+
+
+def changes_since(chat_id, last_seen, since):
+    """
+    Return the changed messages up to `last_seen` a client missed since
+    `since`, oldest change first. Later messages are resumed whole.
+    """
+    return Message.objects.filter(
+        chat_id=chat_id, changed__gt=since, id__lte=last_seen,
+    ).order_by('changed', 'id')
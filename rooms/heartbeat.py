@@ -0,0 +1,137 @@
+"""
+Application-level heartbeat and group membership cleanup.
+
+Every accepted connection gets a heartbeat task that sends a `ping`
+frame each `CHAT_HEARTBEAT_INTERVAL` seconds and re-adds the connection
+to its channel layer groups, which refreshes its membership timestamp.
+Any frame from the client counts as a sign of life; connections silent
+for longer than `CHAT_IDLE_TIMEOUT` are removed from their groups and
+closed.
+
+Because live members keep refreshing their timestamp, the layer's
+`group_expiry` can be short, and `GroupSweeper` removes the members of
+dead connections from groups that nobody sends to.
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+
+from chat import metrics
+from rooms.redis_groups import RedisGroups, channels_redis_version
+
+PING_FRAME = json.dumps({'type': 'ping'})
+IDLE_CLOSE_CODE = 4008
+
+
+def heartbeat_interval():
+    return getattr(settings, 'CHAT_HEARTBEAT_INTERVAL', 25)
+
+
+def idle_timeout():
+    return getattr(settings, 'CHAT_IDLE_TIMEOUT', 75)
+
+
+class HeartbeatMixin:
+    """
+    Consumer mixin that pings the client, keeps its group memberships
+    fresh and reaps idle connections.
+    """
+    heartbeat_task = None
+    last_seen = 0.0
+
+    def heartbeat_groups(self):
+        """Return the groups whose membership the heartbeat refreshes."""
+        return []
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        self.start_heartbeat()
+
+    def start_heartbeat(self):
+        interval = heartbeat_interval()
+        self.last_seen = time.monotonic()
+        if interval and self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(
+                self.heartbeat(interval, idle_timeout()))
+
+    async def heartbeat(self, interval, timeout):
+        """
+        Ping the client every interval until it has been idle for
+        longer than the timeout, then reap the connection.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_seen > timeout:
+                await self.reap()
+                return
+            await self.send(text_data=PING_FRAME)
+            for group in self.heartbeat_groups():
+                await self.channel_layer.group_add(group, self.channel_name)
+            await self.heartbeat_tick()
+
+    async def heartbeat_tick(self):
+        """Hook for periodic work of live connections."""
+
+    async def reap(self):
+        """
+        Leave the groups right away, so broadcasts stop paying for this
+        connection, and close it.
+        """
+        metrics.CONNECTIONS_REAPED.labels(type(self).__name__).inc()
+        for group in self.heartbeat_groups():
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self.close(code=IDLE_CLOSE_CODE)
+
+    async def websocket_receive(self, message):
+        self.last_seen = time.monotonic()
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        if self.heartbeat_task is not None:
+            if self.heartbeat_task is not asyncio.current_task():
+                self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        await super().websocket_disconnect(message)
+
+
+class GroupSweeper:
+    """
+    Remove members whose membership timestamp is older than the layer's
+    group expiry from every group in the channel layer. Layers whose
+    groups can't be read, including channels_redis versions the Redis
+    layout wasn't checked against, raise NotImplementedError.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    async def sweep(self):
+        """Sweep all groups once and return the number of removed members."""
+        if hasattr(self.layer, 'groups'):
+            removed = self.sweep_in_memory()
+        elif RedisGroups.supports(self.layer):
+            removed = await self.sweep_redis()
+        else:
+            raise NotImplementedError(
+                f'Cannot sweep groups of {type(self.layer).__name__} '
+                f'(channels_redis {channels_redis_version()})')
+        metrics.GROUP_MEMBERS_SWEPT.inc(removed)
+        return removed
+
+    def sweep_in_memory(self):
+        cutoff = time.time() - self.layer.group_expiry
+        removed = 0
+        for group, channels in list(self.layer.groups.items()):
+            for channel, joined in list(channels.items()):
+                if joined < cutoff:
+                    del channels[channel]
+                    removed += 1
+            if not channels:
+                self.layer.groups.pop(group, None)
+        return removed
+
+    async def sweep_redis(self):
+        cutoff = int(time.time()) - self.layer.group_expiry
+        return await RedisGroups(self.layer).sweep(cutoff)
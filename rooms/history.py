@@ -0,0 +1,153 @@
+"""
+Rendering of personal chat history in cached chunks.
+
+Messages are grouped into chunks of `CHAT_HISTORY_CHUNK_SIZE` messages
+of the chat, in id order. The messages past the last sealed chunk are
+open; once the oldest `CHAT_HISTORY_CHUNK_SIZE` of them are all older
+than `CHAT_HISTORY_SEAL_SECONDS`, they are sealed into a new chunk. The
+wait covers messages that become visible after messages with higher
+ids because their transaction committed late. The id bounds of the
+sealed chunks are cached per chat, and their rendered HTML without
+expiry, so each page view only reads and renders the open messages,
+through the `(chat, id)` index. Editing or deleting a message bumps the
+chat's history version, which retires all of its cached chunks at once.
+Tombstones of deleted messages are left out, through the partial index
+of live messages.
+"""
+import bisect
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.safestring import mark_safe
+
+from rooms.models import Message
+
+CHUNK_TEMPLATE = 'chat/history-chunk.html'
+
+
+def chunk_size():
+    return getattr(settings, 'CHAT_HISTORY_CHUNK_SIZE', 100)
+
+
+def seal_seconds():
+    return getattr(settings, 'CHAT_HISTORY_SEAL_SECONDS', 60)
+
+
+def _version_key(chat_id):
+    return f'chat-history-version:{chat_id}'
+
+
+def history_version(chat_id):
+    """
+    Return the current history version of a chat. A missing version is
+    initialised from the clock so that it never matches chunks cached
+    under an evicted earlier version.
+    """
+    key = _version_key(chat_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_history(chat_id):
+    """
+    Retire every cached chunk of a chat by bumping its history version.
+    Versions are clock values, so they double as the time the history
+    last changed other than by a new message.
+    """
+    cache.set(_version_key(chat_id), time.time_ns(), timeout=None)
+
+
+def _chunk_key(chat_id, version, viewer_id, chunk):
+    return f'chat-history:{chat_id}:{version}:{viewer_id}:{chunk}'
+
+
+def _sealed_key(chat_id, version):
+    return f'chat-history-sealed:{chat_id}:{version}'
+
+
+def _render_chunk(messages, user):
+    # Realtime workers import this module but never render pages.
+    from django.template.loader import render_to_string
+    return render_to_string(CHUNK_TEMPLATE, {'messages': messages, 'user': user})
+
+
+def render_history(chat, user):
+    """
+    Return the rendered history of a chat for the viewing user, newest
+    chunk first, reusing cached sealed chunks.
+    """
+    size = chunk_size()
+    messages = Message.objects.filter(chat=chat, deleted=False).order_by('id')
+    version = history_version(chat.id)
+    sealed_key = _sealed_key(chat.id, version)
+    sealed = cache.get(sealed_key, [])
+    bound = sealed[-1][1] if sealed else 0
+    open_messages = list(
+        messages.filter(id__gt=bound).select_related('attachment'))
+
+    cutoff = datetime.now() - timedelta(seconds=seal_seconds())
+    new_chunks = []
+    while len(open_messages) >= size and open_messages[size - 1].timestamp < cutoff:
+        new_chunks.append(open_messages[:size])
+        open_messages = open_messages[size:]
+    if new_chunks:
+        sealed = sealed + [
+            (chunk[0].id, chunk[-1].id) for chunk in new_chunks]
+        cache.set(sealed_key, sealed, timeout=None)
+
+    keys = [
+        _chunk_key(chat.id, version, user.id, number)
+        for number in range(len(sealed))
+    ]
+    rendered = cache.get_many(keys)
+    grouped = {}
+    for offset, chunk in enumerate(new_chunks, len(sealed) - len(new_chunks)):
+        grouped[offset] = chunk
+
+    missing = [
+        number for number, key in enumerate(keys)
+        if key not in rendered and number not in grouped
+    ]
+    if missing:
+        ranges = Q()
+        for number in missing:
+            first_id, last_id = sealed[number]
+            ranges |= Q(id__gte=first_id, id__lte=last_id)
+            grouped[number] = []
+        last_ids = [last_id for _, last_id in sealed]
+        for message in messages.filter(ranges).select_related('attachment'):
+            grouped[bisect.bisect_left(last_ids, message.id)].append(message)
+
+    to_cache = {}
+    for number, chunk_messages in grouped.items():
+        rendered[keys[number]] = to_cache[keys[number]] = _render_chunk(
+            chunk_messages[::-1], user)
+    if to_cache:
+        cache.set_many(to_cache, timeout=None)
+
+    parts = [_render_chunk(open_messages[::-1], user)] if open_messages else []
+    parts += [rendered[key] for key in reversed(keys)]
+    return mark_safe(''.join(parts))
+
+
+def latest_message(chat_id):
+    """
+    Return `(id, timestamp)` of the latest live message of a chat, or
+    `(None, None)` for an empty chat. Deletions change the history
+    version, so skipping deleted messages lets this read the first entry
+    of `message_live_idx` instead of walking the whole chat.
+    """
+    latest = (
+        Message.objects.filter(chat_id=chat_id, deleted=False)
+        .order_by('-id')
+        .values_list('id', 'timestamp')
+        .first()
+    )
+    return latest or (None, None)
@@ -0,0 +1,75 @@
+"""
+Command for load testing the chat consumers.
+"""
+import json
+
+from asgiref.sync import async_to_sync
+
+from django.core.management.base import BaseCommand
+
+from rooms.benchmark import BenchmarkConfig, prepare_and_run
+
+
+class Command(BaseCommand):
+    """
+    Open simulated WebSocket clients against the chat consumers and
+    report connect time, delivery latency, throughput and memory.
+    """
+    help = 'Run a WebSocket load benchmark against the chat consumers.'
+
+    def add_arguments(self, parser):
+        defaults = BenchmarkConfig()
+        parser.add_argument(
+            '--public-clients', type=int, default=defaults.public_clients,
+            help='Clients spread over the public rooms.')
+        parser.add_argument(
+            '--rooms', type=int, default=defaults.rooms,
+            help='Number of public rooms.')
+        parser.add_argument(
+            '--personal-chats', type=int, default=defaults.personal_chats,
+            help='Personal chats, each with two connected users.')
+        parser.add_argument(
+            '--rate', type=float, default=defaults.rate,
+            help='Messages per second sent by each client.')
+        parser.add_argument(
+            '--duration', type=float, default=defaults.duration,
+            help='Seconds to keep sending messages.')
+        parser.add_argument(
+            '--drain', type=float, default=defaults.drain,
+            help='Seconds to wait for in-flight messages after sending.')
+        parser.add_argument(
+            '--layer', choices=('memory', 'redis'), default=defaults.layer,
+            help='Channel layer backend to run against.')
+        parser.add_argument(
+            '--redis-url', default=defaults.redis_url,
+            help='Redis used by the redis channel layer.')
+        parser.add_argument(
+            '--seed', type=int, default=defaults.seed,
+            help='Seed for the send schedule jitter.')
+        parser.add_argument(
+            '--output',
+            help='Write the JSON results to this file.')
+        parser.add_argument(
+            '--keep-data', action='store_true',
+            help="Don't delete the users and chats created for the run.")
+
+    def handle(self, *args, **options):
+        config = BenchmarkConfig(
+            public_clients=options['public_clients'],
+            rooms=options['rooms'],
+            personal_chats=options['personal_chats'],
+            rate=options['rate'],
+            duration=options['duration'],
+            drain=options['drain'],
+            layer=options['layer'],
+            redis_url=options['redis_url'],
+            seed=options['seed'],
+        )
+        results = async_to_sync(prepare_and_run)(
+            config, keep_data=options['keep_data'])
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
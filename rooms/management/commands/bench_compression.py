@@ -0,0 +1,58 @@
+"""
+Command for measuring WebSocket compression on chat traffic.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from rooms.compression_benchmark import CompressionBenchmarkConfig, run
+
+
+class Command(BaseCommand):
+    """
+    Compress typical personal chat and public room frames with several
+    permessage-deflate settings and report bandwidth saved against CPU
+    spent.
+    """
+    help = 'Measure bandwidth and CPU of WebSocket compression settings.'
+
+    def add_arguments(self, parser):
+        defaults = CompressionBenchmarkConfig()
+        parser.add_argument(
+            '--messages', type=int, default=defaults.messages,
+            help='Chat messages per kind of traffic.')
+        parser.add_argument(
+            '--resumes', type=int, default=defaults.resumes,
+            help='Resume batches sent after reconnects.')
+        parser.add_argument(
+            '--thresholds', type=int, nargs='+', default=defaults.thresholds,
+            help='Frame sizes from which frames are compressed.')
+        parser.add_argument(
+            '--contexts', nargs='+', default=None,
+            help='Deflate contexts as WINDOW_BITS:MEM_LEVEL, e.g. 12:5.')
+        parser.add_argument(
+            '--seed', type=int, default=defaults.seed,
+            help='Seed for the generated traffic.')
+        parser.add_argument(
+            '--output',
+            help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        config = CompressionBenchmarkConfig(
+            messages=options['messages'],
+            resumes=options['resumes'],
+            thresholds=options['thresholds'],
+            seed=options['seed'],
+        )
+        if options['contexts']:
+            config.contexts = [
+                [int(value) for value in context.split(':')]
+                for context in options['contexts']
+            ]
+        results = run(config)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,50 @@
+"""
+Command for switching the consumer handler profiling on and off.
+"""
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from rooms.profiling import profiler
+
+
+class Command(BaseCommand):
+    """
+    Write or remove the profiling flag file polled by the running
+    workers on this host.
+    """
+    help = 'Turn runtime profiling of the chat consumers on or off.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('state', choices=('on', 'off', 'status'))
+        parser.add_argument(
+            '--sample-rate', type=float,
+            help='Fraction of handler calls run under cProfile.')
+        parser.add_argument(
+            '--slow-ms', type=float,
+            help='Handler calls slower than this are written to the trace log.')
+
+    def handle(self, *args, **options):
+        flag_file = profiler.config()['flag_file']
+
+        if options['state'] == 'on':
+            overrides = {
+                key: options[key] for key in ('sample_rate', 'slow_ms')
+                if options[key] is not None
+            }
+            with open(flag_file, 'w', encoding='utf-8') as file:
+                file.write(json.dumps(overrides))
+        elif options['state'] == 'off':
+            try:
+                os.remove(flag_file)
+            except FileNotFoundError:
+                pass
+
+        profiler.refresh()
+        state = 'on' if profiler.enabled else 'off'
+        self.stdout.write(f'Profiling is {state} ({flag_file}).')
+        if profiler.enabled:
+            self.stdout.write(
+                f"sample_rate={profiler.options['sample_rate']} "
+                f"slow_ms={profiler.options['slow_ms']}")
@@ -0,0 +1,62 @@
+"""
+Command for profiling the cold start of the ASGI entry points.
+"""
+import json
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from rooms.startup import PRELOAD, first_websocket, import_profile
+
+
+class Command(BaseCommand):
+    """
+    Report the import time of each entry point per module and package,
+    and optionally the time until a freshly started Daphne accepts its
+    first WebSocket.
+    """
+    help = 'Profile import time and time to first WebSocket of the ASGI entry points.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modules', nargs='*', default=['chat.asgi', 'chat.realtime_asgi'],
+            help='Entry point modules to profile.')
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Slowest modules and packages to list.')
+        parser.add_argument(
+            '--no-preload', action='store_true',
+            help=f'Count the server modules ({", ".join(PRELOAD)}) as well.')
+        parser.add_argument(
+            '--first-websocket', type=int, default=0, metavar='RUNS',
+            help='Start Daphne this many times per entry point and report the '
+                 'time to the first accepted WebSocket.')
+        parser.add_argument(
+            '--path', default='/ws/chat/startup/',
+            help='WebSocket path to open for --first-websocket.')
+        parser.add_argument(
+            '--output',
+            help='Write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        preload = () if options['no_preload'] else PRELOAD
+        results = []
+        for module in options['modules']:
+            result = import_profile(module, preload=preload, top=options['top'])
+            if options['first_websocket']:
+                runs = [
+                    first_websocket(f'{module}:application', path=options['path'])
+                    for _ in range(options['first_websocket'])
+                ]
+                result['first_websocket_ms'] = {
+                    'median': round(statistics.median(runs) * 1000, 1),
+                    'min': round(min(runs) * 1000, 1),
+                    'runs': len(runs),
+                }
+            results.append(result)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,74 @@
+"""
+Command for deleting messages past their retention.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from rooms.retention import config, count_expired, prune
+
+
+class Command(BaseCommand):
+    """
+    Delete the messages older than their chat's retention, in small
+    batches of message ids with pauses between them. An interrupted run
+    is continued by the next one.
+    """
+    help = 'Delete messages older than the retention policy.'
+
+    def add_arguments(self, parser):
+        defaults = config()
+        parser.add_argument(
+            '--days', type=int,
+            help='Global retention in days, instead of CHAT_RETENTION.')
+        parser.add_argument(
+            '--batch-size', type=int, default=defaults['batch_size'],
+            help='Message ids examined per transaction.')
+        parser.add_argument(
+            '--pause', type=float, default=defaults['pause'],
+            help='Seconds to wait between batches.')
+        parser.add_argument(
+            '--max-batches', type=int,
+            help='Stop after this many batches; the next run continues.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Start a new pass instead of continuing an unfinished one.')
+        parser.add_argument(
+            '--report-interval', type=float, default=5,
+            help='Seconds between progress lines.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the messages that would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = count_expired(options['days'])
+            self.stdout.write(f'{count} messages are past their retention.')
+            return
+
+        started = time.monotonic()
+        last_report = started
+
+        def report(progress, result):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report < options['report_interval']:
+                return
+            last_report = now
+            self.stdout.write(
+                f'Deleted {progress.deleted} messages, '
+                f'at id {progress.last_id} of {progress.max_id}.')
+
+        progress = prune(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            restart=options['restart'],
+            max_batches=options['max_batches'],
+            report=report,
+        )
+        state = 'Finished' if progress.finished else 'Paused'
+        self.stdout.write(
+            f'{state} retention pass: deleted {progress.deleted} messages, '
+            f'at id {progress.last_id} of {progress.max_id}, '
+            f'in {time.monotonic() - started:.1f}s.')
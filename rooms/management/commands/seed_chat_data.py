@@ -0,0 +1,86 @@
+"""
+Command for seeding users, personal chats and messages for load tests.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rooms.seeding import SeedConfig, delete_seeded, seed
+
+
+class Command(BaseCommand):
+    """
+    Bulk create a reproducible dataset of users, personal chats and
+    messages and report how long each step took.
+    """
+    help = 'Seed users, personal chats and messages for load tests.'
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument(
+            '--users', type=int, default=defaults.users,
+            help='Users to create.')
+        parser.add_argument(
+            '--chats', type=int, default=defaults.chats,
+            help='Personal chats between pairs of users.')
+        parser.add_argument(
+            '--messages', type=int, default=defaults.messages,
+            help='Messages spread over the chats.')
+        parser.add_argument(
+            '--days', type=int, default=defaults.days,
+            help='Days of history the messages span.')
+        parser.add_argument(
+            '--until',
+            help='ISO date the history ends at, for identical datasets. '
+                 'Defaults to now.')
+        parser.add_argument(
+            '--password', default=defaults.password,
+            help='Password of every seeded user.')
+        parser.add_argument(
+            '--hash-mode', choices=('shared', 'pool'), default=defaults.hash_mode,
+            help='Reuse one precomputed hash, or hash every password on a '
+                 'process pool.')
+        parser.add_argument(
+            '--processes', type=int, default=defaults.processes,
+            help='Hashing processes in pool mode. Defaults to the CPU count.')
+        parser.add_argument(
+            '--batch-size', type=int, default=defaults.batch_size,
+            help='Rows per INSERT or COPY batch.')
+        parser.add_argument(
+            '--prefix', default=defaults.prefix,
+            help='Prefix of the seeded usernames.')
+        parser.add_argument(
+            '--seed', type=int, default=defaults.seed,
+            help='Random seed of the dataset.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Delete users with the prefix, and their chats, first.')
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        config = SeedConfig(
+            users=options['users'],
+            chats=options['chats'],
+            messages=options['messages'],
+            days=options['days'],
+            password=options['password'],
+            hash_mode=options['hash_mode'],
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            until=options['until'] or '',
+        )
+        if options['reset']:
+            delete_seeded(config.prefix)
+        with transaction.atomic():
+            report = seed(config)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,36 @@
+"""
+Command for removing stale members from channel layer groups.
+"""
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from django.core.management.base import BaseCommand
+
+from rooms.heartbeat import GroupSweeper
+
+
+class Command(BaseCommand):
+    """
+    Periodically remove channel names that haven't refreshed their group
+    membership within the channel layer's group expiry.
+    """
+    help = 'Remove orphaned channel names from the chat groups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='Seconds between sweeps.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Sweep once and exit.')
+
+    def handle(self, *args, **options):
+        sweeper = GroupSweeper(get_channel_layer())
+        while True:
+            removed = async_to_sync(sweeper.sweep)()
+            self.stdout.write(f'Removed {removed} stale group members.')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
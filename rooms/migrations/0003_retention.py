@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-19 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_attachment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('max_id', models.BigIntegerField()),
+                ('deleted', models.BigIntegerField(default=0)),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='personalchatroom',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Days messages are kept, instead of the global retention.', null=True),
+        ),
+    ]
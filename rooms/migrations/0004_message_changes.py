@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-19 11:34
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking new messages on large tables.
+    atomic = False
+
+    dependencies = [
+        ('rooms', '0003_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='changed',
+            field=models.DateTimeField(blank=True, help_text='Time of the last edit or of the deletion.', null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='deleted',
+            field=models.BooleanField(default=False, help_text='Tombstone of a deleted message, kept so that clients can apply the deletion.'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Incremented by every edit, and by the deletion.'),
+        ),
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['chat', 'id'], name='message_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(condition=models.Q(('changed__isnull', False)), fields=['chat', 'changed'], name='message_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-19 11:51
+
+from django.conf import settings
+from django.contrib.postgres.indexes import BrinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking new messages on large tables.
+    atomic = False
+
+    dependencies = [
+        ('rooms', '0004_message_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=BrinIndex(fields=['timestamp'], name='message_timestamp_brin'),
+        ),
+    ]
@@ -4,6 +4,7 @@ Models for personal chat and messages.
 
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import BrinIndex
 
 User = get_user_model()
 
@@ -15,6 +16,33 @@ class PersonalChatRoom(models.Model):
     participants = models.ManyToManyField(
         User,
     )
+    retention_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Days messages are kept, instead of the global retention.'
+    )
+
+
+class Attachment(models.Model):
+    """
+    A file uploaded to a personal chat. The file is complete once every
+    byte is received and its checksum verified.
+    """
+    chat = models.ForeignKey(
+        PersonalChatRoom,
+        on_delete=models.CASCADE
+    )
+    uploader = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    caption = models.TextField(blank=True)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
 
 
 class Message(models.Model):
@@ -31,6 +59,60 @@ class Message(models.Model):
     )
     content = models.TextField()
     timestamp = models.DateTimeField()
+    attachment = models.OneToOneField(
+        Attachment,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        help_text='Incremented by every edit, and by the deletion.'
+    )
+    deleted = models.BooleanField(
+        default=False,
+        help_text='Tombstone of a deleted message, kept so that clients '
+                  'can apply the deletion.'
+    )
+    changed = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Time of the last edit or of the deletion.'
+    )
 
     class Meta:
         ordering = ('-timestamp',)
+        indexes = [
+            # History reads only live messages of a chat, by id.
+            models.Index(
+                fields=['chat', 'id'],
+                condition=models.Q(deleted=False),
+                name='message_live_idx',
+            ),
+            # Edits and deletions a reconnecting client missed.
+            models.Index(
+                fields=['chat', 'changed'],
+                condition=models.Q(changed__isnull=False),
+                name='message_changed_idx',
+            ),
+            # Date ranges of the admin. Messages are stamped when they
+            # arrive, so timestamps follow the table order and a block
+            # range index stays tiny.
+            BrinIndex(
+                fields=['timestamp'],
+                name='message_timestamp_brin',
+            ),
+        ]
+
+
+class RetentionProgress(models.Model):
+    """
+    Checkpoint of a message retention pass, so that an interrupted pass
+    continues where it stopped.
+    """
+    last_id = models.BigIntegerField(default=0)
+    max_id = models.BigIntegerField()
+    deleted = models.BigIntegerField(default=0)
+    started = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,49 @@
+"""
+Per-user notifications of new personal chat messages.
+
+Each device of a signed-in user keeps one `NotificationConsumer`
+connection, member of the `user_<id>` group, instead of one connection
+per open conversation. Every message posted to a personal chat is also
+sent to the group of each participant as a compact notice naming the
+chat, the message id, the sender and the start of its content, so all
+of a user's devices learn about new messages in any of their chats.
+Notices are not stored; a device that was offline reads the chats.
+"""
+from django.conf import settings
+
+from rooms.models import PersonalChatRoom
+
+
+def preview_length():
+    return getattr(settings, 'CHAT_NOTICE_PREVIEW', 80)
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+async def participant_ids(chat_id):
+    """Return the ids of the users taking part in a personal chat."""
+    through = PersonalChatRoom.participants.through
+    return [
+        user_id
+        async for user_id in through.objects.filter(
+            personalchatroom_id=chat_id,
+        ).values_list('user_id', flat=True)
+    ]
+
+
+def notice_frame(chat_id, message_id, sender, content, attachment=None):
+    """Build the notice of a new message sent to its participants' devices."""
+    length = preview_length()
+    preview = content[:length] + ('…' if len(content) > length else '')
+    frame = {
+        'type': 'notice',
+        'chat': chat_id,
+        'id': message_id,
+        'sender': sender,
+        'preview': preview,
+    }
+    if attachment is not None:
+        frame['attachment'] = attachment.name
+    return frame
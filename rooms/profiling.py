@@ -0,0 +1,166 @@
+"""
+Opt-in profiling of the consumer event handlers.
+
+Profiling is switched on and off at runtime through a flag file, written
+by the `chat_profiling` command, so no restart or redeploy is needed. The
+file is polled at most once per `CHAT_PROFILING['poll_seconds']`; when it
+is absent a wrapped handler costs one clock read and a comparison.
+
+While enabled, every handler call is timed into the
+`chat_handler_seconds` histogram. A sample of the calls also runs under
+`cProfile` and calls slower than `slow_ms` are written to the
+`rooms.profiling` logger, which the settings route to a rotating file.
+Because the event loop interleaves coroutines, a sampled profile can
+include work from other handlers that ran while the sampled one awaited.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import random
+import time
+from time import perf_counter
+
+from django.conf import settings
+
+from chat import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'flag_file': '/tmp/chat-profiling.flag',
+    'poll_seconds': 1.0,
+    'sample_rate': 0.01,
+    'slow_ms': 100.0,
+    'top_functions': 15,
+}
+
+
+class HandlerProfiler:
+    """
+    Runtime switchable timer and sampling profiler for consumer handlers.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.options = {}
+        self._next_poll = 0.0
+        self._profiling = False
+
+    def config(self):
+        """Return the configured defaults merged with the settings."""
+        return {**DEFAULTS, **getattr(settings, 'CHAT_PROFILING', {})}
+
+    def is_enabled(self):
+        """
+        Return whether profiling is on, re-reading the flag file when
+        the poll interval has elapsed.
+        """
+        if time.monotonic() >= self._next_poll:
+            self.refresh()
+        return self.enabled
+
+    def refresh(self):
+        """
+        Load the on/off state and options from the flag file. The file
+        may contain a JSON object overriding `sample_rate` and `slow_ms`.
+        """
+        options = self.config()
+        self._next_poll = time.monotonic() + options['poll_seconds']
+        try:
+            with open(options['flag_file'], encoding='utf-8') as file:
+                content = file.read().strip()
+        except OSError:
+            self.enabled = False
+            self.options = options
+            return
+
+        if content:
+            try:
+                options.update(json.loads(content))
+            except (ValueError, TypeError):
+                logger.warning('Ignoring malformed profiling flag file.')
+        self.enabled = True
+        self.options = options
+
+    async def run(self, consumer, handler, args, kwargs):
+        """
+        Run a handler, timing it and profiling it when sampled.
+        """
+        profile = None
+        if not self._profiling and random.random() < self.options['sample_rate']:
+            profile = cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+
+        start = perf_counter()
+        try:
+            return await handler(consumer, *args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+            consumer_name = type(consumer).__name__
+            metrics.HANDLER_SECONDS.labels(
+                consumer_name, handler.__name__).observe(elapsed)
+
+            if elapsed * 1000 >= self.options['slow_ms']:
+                self.log_slow_event(
+                    consumer, consumer_name, handler.__name__, elapsed, profile)
+
+    def log_slow_event(self, consumer, consumer_name, handler_name,
+                       elapsed, profile):
+        """
+        Write a slow handler call, with its profile if it was sampled,
+        as one JSON line.
+        """
+        trace = {
+            'time': time.time(),
+            'consumer': consumer_name,
+            'handler': handler_name,
+            'channel': getattr(consumer, 'channel_name', None),
+            'room': getattr(consumer, 'tracked_room', None),
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'pid': os.getpid(),
+        }
+        if profile is not None:
+            trace['profile'] = self.top_functions(profile)
+        logger.info(json.dumps(trace))
+
+    def top_functions(self, profile):
+        """
+        Return the functions with the most cumulative time in a profile.
+        """
+        stats = pstats.Stats(profile).stats
+        ranked = sorted(
+            stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                'function': f'{filename}:{line}({name})',
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _)
+            in ranked[:self.options['top_functions']]
+        ]
+
+
+profiler = HandlerProfiler()
+
+
+def profiled(handler):
+    """
+    Wrap a consumer handler so it is timed and sampled while profiling
+    is enabled, and called directly otherwise.
+    """
+    @functools.wraps(handler)
+    async def wrapper(self, *args, **kwargs):
+        if not profiler.is_enabled():
+            return await handler(self, *args, **kwargs)
+        return await profiler.run(self, handler, args, kwargs)
+    return wrapper
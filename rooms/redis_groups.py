@@ -0,0 +1,74 @@
+"""
+Group members of a channels_redis layer, read from Redis directly.
+
+channels_redis keeps each group in a sorted set of channel names scored
+by the time they last joined. Occupancy counts and the group sweeper
+work on those sets, but their layout is internal to channels_redis, so
+they are only touched on the versions it was checked against.
+"""
+import re
+
+
+def channels_redis_version():
+    """Return the `(major, minor)` version of channels_redis, or None."""
+    try:
+        import channels_redis
+    except ImportError:
+        return None
+    match = re.match(r'(\d+)\.(\d+)', channels_redis.__version__)
+    return tuple(map(int, match.groups())) if match else (0, 0)
+
+
+class RedisGroups:
+    """
+    Adapter over the group sorted sets of a channels_redis layer. Check
+    `supports(layer)` before using it.
+    """
+    SUPPORTED = ((4, 0), (5, 0))
+    ATTRIBUTES = ('_group_key', 'consistent_hash', 'connection', 'ring_size')
+
+    @classmethod
+    def supports(cls, layer):
+        version = channels_redis_version()
+        if version is None:
+            return False
+        from channels_redis.core import RedisChannelLayer
+        return (
+            isinstance(layer, RedisChannelLayer)
+            and cls.SUPPORTED[0] <= version < cls.SUPPORTED[1]
+            and all(hasattr(layer, name) for name in cls.ATTRIBUTES))
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    async def sizes(self, groups, cutoff):
+        """
+        Return the number of members of each group that joined at or
+        after `cutoff`, an epoch timestamp.
+        """
+        pipelines = {}
+        order = []
+        for group in groups:
+            index = self.layer.consistent_hash(group)
+            if index not in pipelines:
+                pipelines[index] = self.layer.connection(index).pipeline(
+                    transaction=False)
+            pipelines[index].zcount(self.layer._group_key(group), cutoff, '+inf')
+            order.append(index)
+
+        results = {index: iter(await pipeline.execute())
+                   for index, pipeline in pipelines.items()}
+        return [next(results[index]) for index in order]
+
+    async def sweep(self, cutoff):
+        """
+        Remove the members that last joined at or before `cutoff` from
+        every group and return how many were removed.
+        """
+        pattern = self.layer._group_key('*')
+        removed = 0
+        for index in range(self.layer.ring_size):
+            connection = self.layer.connection(index)
+            async for key in connection.scan_iter(match=pattern, count=500):
+                removed += await connection.zremrangebyscore(key, 0, cutoff)
+        return removed
@@ -0,0 +1,107 @@
+"""
+Resuming chat connections from the last message a client has seen.
+
+Clients reconnect with `?last_seen=<message id>` and receive the messages
+they missed in a single `resume` frame. Personal chats replay from the
+database. Public room messages aren't stored, so each worker keeps a
+bounded buffer of the latest frames of the rooms it has members in; a
+replay from a worker that didn't see the client's last message is sent
+whole and marked incomplete.
+"""
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+
+def resume_limit():
+    return getattr(settings, 'CHAT_RESUME_LIMIT', 200)
+
+
+def query_param(scope, name):
+    """Return a query string parameter of a connection, or None."""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    values = query.get(name)
+    return values[0] if values and values[0] else None
+
+
+def parse_last_seen(scope):
+    """Return the `last_seen` query parameter of a connection, or None."""
+    return query_param(scope, 'last_seen')
+
+
+def resume_frame(messages, complete, changes=None):
+    """
+    Build the batched frame carrying the missed messages and, for
+    personal chats, the missed edits and deletions of earlier ones.
+    """
+    frame = {
+        'type': 'resume',
+        'messages': messages,
+        'complete': complete,
+    }
+    if changes is not None:
+        frame['changes'] = changes
+    return frame
+
+
+class ReplayBuffer:
+    """
+    Per-process buffer of the latest message frames of each public room,
+    bounded both in frames per room and in rooms.
+    """
+
+    def __init__(self, size=None, max_rooms=None):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.rooms = OrderedDict()
+
+    def limits(self):
+        return (
+            self.size or getattr(settings, 'CHAT_REPLAY_BUFFER_SIZE', 100),
+            self.max_rooms or getattr(settings, 'CHAT_REPLAY_ROOMS', 1000),
+        )
+
+    def add(self, room, message_id, frame):
+        """
+        Remember a frame. Every member on this worker receives the same
+        event, so frames already buffered are ignored.
+        """
+        size, max_rooms = self.limits()
+        frames = self.rooms.get(room)
+        if frames is None:
+            frames = self.rooms[room] = OrderedDict()
+            if len(self.rooms) > max_rooms:
+                self.rooms.popitem(last=False)
+        else:
+            self.rooms.move_to_end(room)
+
+        if message_id in frames:
+            return
+        frames[message_id] = frame
+        if len(frames) > size:
+            frames.popitem(last=False)
+
+    def since(self, room, last_seen):
+        """
+        Return `(frames, complete)` with the frames after `last_seen`.
+        If `last_seen` is no longer buffered, every buffered frame is
+        returned and `complete` is False.
+        """
+        frames = self.rooms.get(room)
+        if not frames:
+            return [], False
+        if last_seen not in frames:
+            return list(frames.values()), False
+
+        missed = []
+        found = False
+        for message_id, frame in frames.items():
+            if found:
+                missed.append(frame)
+            elif message_id == last_seen:
+                found = True
+        return missed, True
+
+
+replay_buffer = ReplayBuffer()
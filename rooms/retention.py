@@ -0,0 +1,202 @@
+"""
+Message retention: deleting messages older than their chat's policy.
+
+A chat keeps its messages for its own `retention_days`, or else for
+`CHAT_RETENTION['days']`; without either they are kept forever. A
+retention pass walks the message ids up to the highest id at its start
+in windows of `batch_size` ids. Each window starts at the next id older
+than the latest retention cutoff, found through the primary key and the
+timestamp index, so recent messages aren't walked and the pass ends
+once no candidates are left. Each window is one short transaction
+that selects the expired ids and deletes them with a plain DELETE, so
+rows aren't loaded as models and no per-row signals run; attachments
+of the deleted messages are removed after, and the history cache of
+the touched chats is invalidated once per window. Windows hold row
+locks on old messages only, give up after `lock_timeout` rather than
+wait on a busy row, and windows that deleted rows are followed by a
+`pause` of seconds, so inserts of new messages are never blocked.
+
+The pass records its position in `RetentionProgress` after every
+window; a new run continues an unfinished pass.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Max, Min, Q
+
+from rooms.history import invalidate_history
+from rooms.models import Attachment, Message, PersonalChatRoom, RetentionProgress
+
+
+def config():
+    return {
+        'days': None,
+        'batch_size': 1000,
+        'pause': 0.1,
+        'lock_timeout': '2s',
+        **getattr(settings, 'CHAT_RETENTION', {}),
+    }
+
+
+def cutoffs(now=None, days=None):
+    """
+    Return the `(retention_days, cutoff)` pairs of the policies, None
+    standing for the chats without their own. `days` overrides the
+    global retention.
+    """
+    now = now or datetime.now()
+    days = config()['days'] if days is None else days
+    policies = []
+    if days:
+        policies.append((None, now - timedelta(days=days)))
+    overrides = (
+        PersonalChatRoom.objects.filter(retention_days__isnull=False)
+        .values_list('retention_days', flat=True).distinct()
+    )
+    for chat_days in overrides:
+        policies.append((chat_days, now - timedelta(days=chat_days)))
+    return policies
+
+
+def expired(now=None, days=None, policies=None):
+    """
+    Return the filter of expired messages, or None if every message is
+    kept. `days` overrides the global retention.
+    """
+    if policies is None:
+        policies = cutoffs(now, days)
+    condition = Q()
+    for chat_days, cutoff in policies:
+        if chat_days is None:
+            condition |= Q(chat__retention_days__isnull=True, timestamp__lt=cutoff)
+        else:
+            condition |= Q(chat__retention_days=chat_days, timestamp__lt=cutoff)
+    return condition or None
+
+
+def next_candidate(after_id, max_id, cutoff):
+    """
+    Return the lowest id in `(after_id, max_id]` of a message older than
+    `cutoff`, or None.
+    """
+    return Message.objects.filter(
+        id__gt=after_id, id__lte=max_id, timestamp__lt=cutoff,
+    ).aggregate(first=Min('id'))['first']
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one window of message ids."""
+    deleted: int = 0
+    attachments: int = 0
+    chats: int = 0
+
+
+def delete_window(condition, first_id, last_id, lock_timeout=None):
+    """Delete the expired messages with ids in `[first_id, last_id]`."""
+    with transaction.atomic():
+        if lock_timeout and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+        rows = list(
+            Message.objects.filter(condition, id__gte=first_id, id__lte=last_id)
+            .values_list('id', 'chat_id', 'attachment_id')
+        )
+        if not rows:
+            return BatchResult()
+        ids = [row[0] for row in rows]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Message._meta.db_table} '
+                f'WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                ids,
+            )
+        attachment_ids = [row[2] for row in rows if row[2] is not None]
+        if attachment_ids:
+            Attachment.objects.filter(id__in=attachment_ids).delete()
+
+    chat_ids = {row[1] for row in rows}
+    for chat_id in chat_ids:
+        invalidate_history(chat_id)
+    return BatchResult(len(ids), len(attachment_ids), len(chat_ids))
+
+
+def current_pass(restart=False):
+    """
+    Return the progress of the unfinished retention pass, or start a
+    new pass up to the current highest message id.
+    """
+    progress = None
+    if not restart:
+        progress = RetentionProgress.objects.filter(
+            finished__isnull=True).order_by('-id').first()
+    if progress is None:
+        bounds = Message.objects.aggregate(first=Min('id'), last=Max('id'))
+        progress = RetentionProgress.objects.create(
+            last_id=(bounds['first'] or 1) - 1,
+            max_id=bounds['last'] or 0,
+        )
+    return progress
+
+
+def prune(days=None, batch_size=None, pause=None, restart=False,
+          max_batches=None, report=None):
+    """
+    Run or continue a retention pass and return its progress. `report`
+    is called with the progress after every window. Stops early after
+    `max_batches` windows, leaving the pass to be continued.
+    """
+    options = config()
+    batch_size = batch_size or options['batch_size']
+    pause = options['pause'] if pause is None else pause
+    progress = current_pass(restart)
+    policies = cutoffs(days=days)
+    condition = expired(policies=policies)
+    # Every expired message is older than the latest cutoff.
+    latest = max((cutoff for _, cutoff in policies), default=None)
+    batches = retries = 0
+
+    while progress.last_id < progress.max_id:
+        if max_batches is not None and batches >= max_batches:
+            return progress
+        first_id = None
+        if condition is not None:
+            first_id = next_candidate(progress.last_id, progress.max_id, latest)
+        if first_id is None:
+            progress.last_id = progress.max_id
+            break
+        last_id = min(first_id + batch_size - 1, progress.max_id)
+        try:
+            result = delete_window(
+                condition, first_id, last_id, options['lock_timeout'])
+        except OperationalError:
+            # A row of the window is locked; retry it after the pause.
+            retries += 1
+            if retries > 3:
+                raise
+            time.sleep(pause or 0.1)
+            continue
+        retries = 0
+        progress.last_id = last_id
+        progress.deleted += result.deleted
+        progress.save(update_fields=['last_id', 'deleted', 'updated'])
+        batches += 1
+        if report is not None:
+            report(progress, result)
+        if pause and result.deleted and progress.last_id < progress.max_id:
+            time.sleep(pause)
+
+    progress.finished = datetime.now()
+    progress.save(update_fields=['last_id', 'finished', 'updated'])
+    return progress
+
+
+def count_expired(days=None):
+    """Return the number of messages the policy would delete now."""
+    condition = expired(days=days)
+    if condition is None:
+        return 0
+    return Message.objects.filter(condition).count()
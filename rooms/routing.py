@@ -1,12 +1,23 @@
 """
 Routes for websocket connection.
 """
+from channels.auth import AuthMiddlewareStack
+from channels.routing import URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
 
 from django.urls import re_path
 
 from rooms import consumers
 
 websocket_urlpatterns = [
+    re_path(
+        r'ws/notifications/$',
+        consumers.NotificationConsumer.as_asgi()
+    ),
+    re_path(
+        r'ws/rooms/$',
+        consumers.DirectoryConsumer.as_asgi()
+    ),
     re_path(
         r'ws/chat/(?P<chat_id>\d+)/$',
         consumers.PersonalChatConsumer.as_asgi()
@@ -16,3 +27,12 @@ websocket_urlpatterns = [
         consumers.PublicRoomConsumer.as_asgi()
     ),
 ]
+
+
+def websocket_application():
+    """Return the ASGI application serving the chat websockets."""
+    return AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(websocket_urlpatterns)
+        ),
+    )
@@ -0,0 +1,292 @@
+"""
+Bulk seeding of users, personal chats and messages for load tests.
+
+Users share one precomputed password hash, or get their own hashes
+computed on a process pool. Users, chats and participants are inserted
+with `bulk_create`; messages are streamed with COPY on PostgreSQL. The
+same seed always produces the same users, chats and messages, so every
+perf test can start from the same data.
+
+Messages follow skewed, conversation-like distributions: a few chats
+and users carry most of the traffic, message lengths are log-normal,
+and messages come in bursts of short gaps separated by long pauses.
+They are inserted in timestamp order across all chats, as live traffic
+would be, so the table's heap order follows the timestamps its BRIN
+index relies on.
+"""
+import csv
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+import random
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+
+from rooms.models import Message, PersonalChatRoom
+
+User = get_user_model()
+
+WORDS = (
+    'hey hi hello ok okay yes no maybe sure thanks lol see you later '
+    'tomorrow today tonight meeting call lunch dinner coffee work home '
+    'did you get my message what time are we still on for the weekend '
+    'sounds good let me know when you are free I will be there soon '
+    'sorry running late can not make it how about next week great idea'
+).split()
+MAX_CONTENT_LENGTH = 2000
+MESSAGE_COLUMNS = ('chat_id', 'sender_id', 'content', 'timestamp', 'version', 'deleted')
+
+
+@dataclass
+class SeedConfig:
+    """Shape of the seeded dataset."""
+    users: int = 1000
+    chats: int = 2000
+    messages: int = 100000
+    days: int = 30
+    password: str = 'seed-password'
+    hash_mode: str = 'shared'
+    processes: int = 0
+    batch_size: int = 5000
+    prefix: str = 'seed'
+    seed: int = 0
+    until: str = ''
+
+
+def _cumulative_weights(count, exponent, rng):
+    """
+    Zipf-like weights over `count` items in a random order, so that a
+    few items are picked much more often than the rest.
+    """
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1 / rank ** exponent for rank in ranks))
+
+
+def _pick(rng, cumulative):
+    return bisect_left(cumulative, rng.random() * cumulative[-1])
+
+
+def hash_passwords(config):
+    """
+    Return one password hash per user: a single precomputed hash in
+    `shared` mode, or hashes with their own salt made on a process
+    pool in `pool` mode.
+    """
+    if config.hash_mode == 'shared':
+        return [make_password(config.password)] * config.users
+    if config.hash_mode != 'pool':
+        raise ValueError(f'Unknown hash mode {config.hash_mode!r}')
+
+    processes = config.processes or os.cpu_count() or 1
+    chunksize = max(1, config.users // (processes * 4))
+    # Forked workers inherit the configured settings and hashers.
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        return list(pool.map(
+            make_password,
+            itertools.repeat(config.password, config.users),
+            chunksize=chunksize,
+        ))
+
+
+def create_users(config, hashes):
+    users = User.objects.bulk_create(
+        (
+            User(username=f'{config.prefix}{i}', password=password)
+            for i, password in enumerate(hashes)
+        ),
+        batch_size=config.batch_size,
+    )
+    return [user.id for user in users]
+
+
+def create_chats(config, user_ids, rng):
+    """
+    Create chats between distinct pairs of users, favouring the more
+    active users. Return `(chat_id, user_a, user_b)` tuples.
+    """
+    possible = len(user_ids) * (len(user_ids) - 1) // 2
+    count = min(config.chats, possible)
+    activity = _cumulative_weights(len(user_ids), 0.8, rng)
+    pairs = set()
+    while len(pairs) < count:
+        a = _pick(rng, activity)
+        b = _pick(rng, activity)
+        if a == b:
+            b = rng.randrange(len(user_ids))
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    pairs = sorted(pairs)
+
+    chats = PersonalChatRoom.objects.bulk_create(
+        [PersonalChatRoom() for _ in pairs], batch_size=config.batch_size)
+    Through = PersonalChatRoom.participants.through
+    Through.objects.bulk_create(
+        (
+            Through(personalchatroom_id=chat.id, user_id=user_ids[index])
+            for chat, pair in zip(chats, pairs)
+            for index in pair
+        ),
+        batch_size=config.batch_size,
+    )
+    return [
+        (chat.id, user_ids[a], user_ids[b])
+        for chat, (a, b) in zip(chats, pairs)
+    ]
+
+
+def messages_per_chat(total, chats, rng):
+    """Split the messages over the chats with a heavy-tailed distribution."""
+    weights = [rng.paretovariate(1.2) for _ in range(chats)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for index in rng.sample(range(chats), min(chats, total - sum(counts))):
+        counts[index] += 1
+    return counts
+
+
+def message_content(rng):
+    """Return a chat-like message text of log-normal length."""
+    length = min(MAX_CONTENT_LENGTH, max(1, int(rng.lognormvariate(3.4, 0.9))))
+    words = []
+    size = -1
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+def generate_messages(chat, count, start, end, rng):
+    """
+    Yield the rows of a chat's messages in time order: bursts of
+    replies seconds apart, separated by pauses of hours.
+    """
+    chat_id, user_a, user_b = chat
+    gaps = [
+        rng.expovariate(1 / 20) if rng.random() < 0.9
+        else rng.expovariate(1 / 21600)
+        for _ in range(count)
+    ]
+    span = (end - start).total_seconds()
+    total = sum(gaps)
+    if total > span:
+        gaps = [gap * span / total for gap in gaps]
+        total = span
+    moment = start + timedelta(seconds=rng.random() * (span - total))
+    sender = rng.choice((user_a, user_b))
+    for gap in gaps:
+        moment = min(moment + timedelta(seconds=gap), end)
+        if rng.random() < 0.6:
+            sender = user_b if sender == user_a else user_a
+        yield chat_id, sender, message_content(rng), moment
+
+
+def _copy_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for chat_id, sender_id, content, timestamp in rows:
+        writer.writerow((chat_id, sender_id, content, timestamp.isoformat(), 1, False))
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f'COPY {Message._meta.db_table} ({", ".join(MESSAGE_COLUMNS)}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+
+def _create_rows(rows):
+    Message.objects.bulk_create(
+        Message(chat_id=chat_id, sender_id=sender_id, content=content,
+                timestamp=timestamp)
+        for chat_id, sender_id, content, timestamp in rows
+    )
+
+
+def create_messages(config, chats, rng):
+    """
+    Insert the messages of the `days` before `until` (default now) in
+    batches, with COPY on PostgreSQL, merging the chats in timestamp
+    order. Return the number of rows written.
+    """
+    if not chats:
+        return 0
+    end = datetime.fromisoformat(config.until) if config.until else datetime.now()
+    start = end - timedelta(days=config.days)
+    write = _copy_rows if connection.vendor == 'postgresql' else _create_rows
+
+    rows = heapq.merge(
+        *(
+            generate_messages(chat, count, start, end, rng)
+            for chat, count in zip(
+                chats, messages_per_chat(config.messages, len(chats), rng))
+            if count
+        ),
+        key=lambda row: row[3],
+    )
+    written = 0
+    while True:
+        batch = list(itertools.islice(rows, config.batch_size))
+        if not batch:
+            break
+        write(batch)
+        written += len(batch)
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Message._meta.db_table}')
+    return written
+
+
+def seed(config):
+    """Create the dataset and return the counts and timings."""
+    rng = random.Random(config.seed)
+    timings = {}
+    started = perf_counter()
+
+    phase = perf_counter()
+    hashes = hash_passwords(config)
+    timings['hash_seconds'] = perf_counter() - phase
+
+    phase = perf_counter()
+    user_ids = create_users(config, hashes)
+    timings['users_seconds'] = perf_counter() - phase
+
+    phase = perf_counter()
+    chats = create_chats(config, user_ids, rng)
+    timings['chats_seconds'] = perf_counter() - phase
+
+    phase = perf_counter()
+    messages = create_messages(config, chats, rng)
+    timings['messages_seconds'] = perf_counter() - phase
+
+    timings['total_seconds'] = perf_counter() - started
+    return {
+        'config': {**asdict(config), 'password': None},
+        'users': len(user_ids),
+        'chats': len(chats),
+        'messages': messages,
+        **{key: round(value, 3) for key, value in timings.items()},
+        'messages_per_second': round(
+            messages / timings['messages_seconds'], 1)
+        if timings['messages_seconds'] else None,
+    }
+
+
+def delete_seeded(prefix):
+    """Remove users with the seed prefix and their chats."""
+    chats = PersonalChatRoom.objects.filter(
+        participants__username__startswith=prefix).values('id')
+    PersonalChatRoom.objects.filter(id__in=chats).delete()
+    User.objects.filter(username__startswith=prefix).delete()
@@ -0,0 +1,155 @@
+"""
+Sharded sub-groups for large public rooms.
+
+A public room starts as the single group `chat_<room>`. Once its
+occupancy reaches `CHAT_SHARD_THRESHOLD`, new connections join one of
+`CHAT_SHARD_COUNT` shard groups `chat_<room>.s<n>` picked by a hash of
+their channel name, and connections already in the room move to their
+shard on their next heartbeat. The room goes back to the single group
+when occupancy drops below half the threshold.
+
+Broadcasts go to the room group and, while any shard is in use, to
+every shard group, in parallel, so the fan-out of a hot room is spread
+over the Redis nodes the shard groups hash to. Occupancy is the sum of
+the live members of the groups, which makes `user_count` a count of the
+whole room across shards and workers. Each worker refreshes its view of
+a room at most every `CHAT_SHARD_REFRESH` seconds.
+"""
+import time
+import zlib
+
+from django.conf import settings
+
+from rooms.heartbeat import heartbeat_interval
+from rooms.redis_groups import RedisGroups
+
+
+def shard_threshold():
+    return getattr(settings, 'CHAT_SHARD_THRESHOLD', 1000)
+
+
+def shard_count():
+    return getattr(settings, 'CHAT_SHARD_COUNT', 8)
+
+
+def refresh_seconds():
+    return getattr(settings, 'CHAT_SHARD_REFRESH', 1.0)
+
+
+def shard_groups(group):
+    """Return the names of the shard groups of a room group."""
+    return [f'{group}.s{index}' for index in range(shard_count())]
+
+
+def shard_group(group, channel_name):
+    """Return the shard group a channel belongs to."""
+    index = zlib.crc32(channel_name.encode()) % shard_count()
+    return f'{group}.s{index}'
+
+
+# Shortest time a member counts as live without refreshing, in seconds.
+LIVE_MARGIN = 10
+
+
+def live_window(layer):
+    """
+    Return the seconds since a member last refreshed its membership for
+    which it counts as live. Live connections refresh it on every
+    heartbeat, so members of dead connections and workers drop out of
+    the counts after two missed heartbeats, with a margin for busy
+    workers, rather than the layer's `group_expiry`.
+    """
+    interval = heartbeat_interval()
+    if interval:
+        return min(layer.group_expiry, max(2 * interval, LIVE_MARGIN))
+    return layer.group_expiry
+
+
+async def group_sizes(layer, groups):
+    """
+    Return the number of live members of each group, or None if the
+    channel layer can't tell, in which case callers fall back to the
+    per-process count.
+    """
+    if hasattr(layer, 'groups'):
+        cutoff = time.time() - live_window(layer)
+        return [
+            sum(1 for joined in layer.groups.get(group, {}).values()
+                if joined >= cutoff)
+            for group in groups
+        ]
+    if not RedisGroups.supports(layer):
+        return None
+    cutoff = int(time.time() - live_window(layer))
+    return await RedisGroups(layer).sizes(groups, cutoff)
+
+
+class RoomView:
+    """
+    A worker's view of the occupancy and groups of one public room.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self.occupancy = 0
+        self.sharded = False
+        self.targets = [group]
+        self.checked_at = None
+
+    def stale(self):
+        return (self.checked_at is None
+                or time.monotonic() - self.checked_at >= refresh_seconds())
+
+    async def refresh(self, layer, fallback=0):
+        """
+        Read the group sizes of the room. `fallback` is the occupancy
+        used when the channel layer can't report group sizes.
+        """
+        shards = shard_groups(self.group)
+        sizes = await group_sizes(layer, [self.group] + shards)
+        self.checked_at = time.monotonic()
+        if sizes is None:
+            self.occupancy = fallback
+            self.sharded = False
+            self.targets = [self.group]
+            return self
+
+        self.occupancy = sum(sizes)
+        in_shards = sum(sizes[1:])
+        threshold = shard_threshold()
+        self.sharded = self.occupancy >= threshold or (
+            in_shards > 0 and self.occupancy >= threshold // 2)
+        # Joiners of a sharded room go to shard groups that may have been
+        # empty at this refresh, so every shard gets broadcasts while any
+        # is in use. The room group always does, for members who haven't
+        # moved yet.
+        if self.sharded or in_shards:
+            self.targets = [self.group] + shards
+        else:
+            self.targets = [self.group]
+        return self
+
+    def member_group(self, channel_name):
+        """Return the group a connection of this room should be in."""
+        if self.sharded:
+            return shard_group(self.group, channel_name)
+        return self.group
+
+
+class RoomViews:
+    """Per-worker registry of room views."""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def get(self, group):
+        view = self.rooms.get(group)
+        if view is None:
+            view = self.rooms[group] = RoomView(group)
+        return view
+
+    def forget(self, group):
+        self.rooms.pop(group, None)
+
+
+room_views = RoomViews()
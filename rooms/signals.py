@@ -0,0 +1,31 @@
+"""
+Signal handlers keeping cached chat data in sync with the messages.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rooms.attachments import delete_file
+from rooms.history import invalidate_history
+from rooms.models import Attachment, Message
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    """
+    Retire the cached history of a chat when one of its messages is
+    edited. New messages land in the uncached tail chunk.
+    """
+    if not created:
+        invalidate_history(instance.chat_id)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    """Retire the cached history of a chat when a message is deleted."""
+    invalidate_history(instance.chat_id)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, using, **kwargs):
+    """Remove the stored file of a deleted attachment after the commit."""
+    delete_file(instance, using)
@@ -0,0 +1,160 @@
+"""
+Cold start profile of the ASGI entry points.
+
+`import_profile` imports an entry point in a fresh interpreter under
+`python -X importtime` and reports where the import time goes, per
+module and per top-level package. The modules of the server, Daphne by
+default, are imported first and reported apart: a worker pays for them
+whichever application it serves.
+
+`first_websocket` starts Daphne with an entry point and measures the
+time from spawning it to the first accepted WebSocket handshake, which
+is what an autoscaled worker makes its first users wait.
+"""
+import base64
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+PRELOAD = ('daphne.server',)
+
+
+@dataclass
+class ImportRecord:
+    """Import time of one module, in microseconds."""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output):
+    """Return the import records of `python -X importtime` stderr output."""
+    records = []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append(ImportRecord(
+                module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def _environment(settings_module=None):
+    env = os.environ.copy()
+    # Let every entry point pick its own settings unless told otherwise.
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    if settings_module:
+        env['DJANGO_SETTINGS_MODULE'] = settings_module
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+    return env
+
+
+def import_profile(module, preload=PRELOAD, settings_module=None, top=20):
+    """
+    Import `module` after `preload` in a fresh interpreter and return a
+    summary of its import time: totals in milliseconds, the slowest
+    modules by own time and the time per top-level package.
+    """
+    script = '; '.join(
+        [f'import {name}' for name in preload]
+        + ['print("--", file=__import__("sys").stderr)', f'import {module}'])
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        env=_environment(settings_module), capture_output=True, text=True,
+        cwd=settings.BASE_DIR)
+    wall = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+
+    preloaded, _, imported = result.stderr.partition('--\n')
+    preloaded = parse_importtime(preloaded)
+    records = parse_importtime(imported)
+    packages = {}
+    for record in records:
+        package = record.module.split('.')[0]
+        packages[package] = packages.get(package, 0) + record.self_us
+    slowest = sorted(records, key=lambda record: record.self_us, reverse=True)
+    return {
+        'module': module,
+        'wall_ms': round(wall * 1000, 1),
+        'preload_ms': round(sum(r.self_us for r in preloaded) / 1000, 1),
+        'import_ms': round(sum(r.self_us for r in records) / 1000, 1),
+        'modules': len(records),
+        'slowest': [
+            {
+                'module': record.module,
+                'self_ms': round(record.self_us / 1000, 2),
+                'cumulative_ms': round(record.cumulative_us / 1000, 2),
+            }
+            for record in slowest[:top]
+        ],
+        'packages': {
+            package: round(self_us / 1000, 1)
+            for package, self_us in sorted(
+                packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def websocket_handshake(port, path, timeout=1.0):
+    """Return whether a WebSocket handshake on `path` is accepted."""
+    key = base64.b64encode(os.urandom(16)).decode()
+    request = (
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: localhost:{port}\r\n'
+        f'Origin: http://localhost:{port}\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {key}\r\n'
+        'Sec-WebSocket-Version: 13\r\n\r\n'
+    )
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(request.encode())
+        return sock.recv(64).startswith(b'HTTP/1.1 101')
+
+
+def first_websocket(application, path='/ws/chat/startup/', settings_module=None,
+                    timeout=30.0):
+    """
+    Start Daphne with `application` and return the seconds until it
+    accepts its first WebSocket on `path`.
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), application],
+        env=_environment(settings_module), cwd=settings.BASE_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f'Daphne exited:\n{server.stderr.read()}')
+            try:
+                if websocket_handshake(port, path):
+                    return time.perf_counter() - started
+            except OSError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f'No WebSocket accepted within {timeout} seconds.')
+    finally:
+        server.terminate()
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            server.kill()
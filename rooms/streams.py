@@ -0,0 +1,160 @@
+"""
+Durable message delivery through Redis Streams.
+
+With `CHAT_STREAMS['enabled']` set, chat events are appended to a
+capped stream per room group, `chat-stream:<group>`, and the channel
+layer only carries a `stream_notify` wake-up. Every connection reads the
+entries after its own offset, so a lost notification, an expired
+channel or a restarted worker delays messages instead of dropping them:
+the next notification, the next heartbeat or a reconnect with
+`?offset=<entry id>` picks them up. Delivery is at-least-once and
+clients drop duplicates by message id.
+
+Reads of the same range by the connections of one worker are shared, so
+a broadcast costs one read per worker rather than one per connection.
+Every append renews the stream's `ttl`, so the streams of rooms that
+fell silent are dropped from Redis.
+
+The Redis clients of an event loop are shared by its consumers and
+closed when the last one that holds them lets them go.
+"""
+import asyncio
+import json
+import re
+import weakref
+
+from django.conf import settings
+
+import redis.asyncio as aioredis
+
+DEFAULTS = {
+    'enabled': False,
+    'url': 'redis://redis:6379/0',
+    'maxlen': 1000,
+    'read_count': 200,
+    'ttl': 24 * 60 * 60,
+}
+OFFSET_RE = re.compile(r'^\d+-\d+$')
+START = '0-0'
+
+_clients = weakref.WeakKeyDictionary()
+_holders = weakref.WeakKeyDictionary()
+_reads = weakref.WeakKeyDictionary()
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_STREAMS', {})}
+
+
+def enabled():
+    return bool(config()['enabled'])
+
+
+def stream_key(group):
+    return f'chat-stream:{group}'
+
+
+def parse_offset(value):
+    """Return a valid stream entry id, or None."""
+    if value and OFFSET_RE.match(value):
+        return value
+    return None
+
+
+def offset_tuple(offset):
+    milliseconds, sequence = offset.split('-')
+    return int(milliseconds), int(sequence)
+
+
+def hold_clients():
+    """
+    Keep the Redis clients of the running event loop open until the
+    matching `release_clients()`.
+    """
+    loop = asyncio.get_running_loop()
+    _holders[loop] = _holders.get(loop, 0) + 1
+
+
+async def release_clients():
+    """Close the running event loop's clients once nothing holds them."""
+    loop = asyncio.get_running_loop()
+    holders = _holders.pop(loop, 0) - 1
+    if holders > 0:
+        _holders[loop] = holders
+        return
+    for client in _clients.pop(loop, {}).values():
+        await client.aclose()
+
+
+def loop_client(url):
+    """
+    Return the Redis client of the running event loop for a server
+    URL. Connections can't be shared between loops.
+    """
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(url)
+    if client is None:
+        client = clients[url] = aioredis.Redis.from_url(url)
+    return client
+
+
+def get_client():
+    """Return the Redis client of the streams for the running event loop."""
+    return loop_client(config()['url'])
+
+
+async def publish(group, event):
+    """Append an event to the stream of a group and return its offset."""
+    options = config()
+    key = stream_key(group)
+    pipeline = get_client().pipeline(transaction=False)
+    pipeline.xadd(
+        key,
+        {'event': json.dumps(event)},
+        maxlen=options['maxlen'],
+        approximate=True,
+    )
+    pipeline.expire(key, options['ttl'])
+    offset, _ = await pipeline.execute()
+    return offset.decode()
+
+
+async def last_offset(group):
+    """Return the offset of the latest entry of a group's stream."""
+    entries = await get_client().xrevrange(stream_key(group), count=1)
+    return entries[0][0].decode() if entries else START
+
+
+async def is_retained(group, offset):
+    """
+    Return False if entries after `offset` may already have been
+    trimmed from the capped stream.
+    """
+    entries = await get_client().xrange(stream_key(group), count=1)
+    if not entries:
+        return True
+    return offset_tuple(entries[0][0].decode()) <= offset_tuple(offset)
+
+
+async def _read(group, offset, count):
+    entries = await get_client().xrange(
+        stream_key(group), min=f'({offset}', max='+', count=count)
+    return [
+        (entry_id.decode(), json.loads(fields[b'event']))
+        for entry_id, fields in entries
+    ]
+
+
+async def read_after(group, offset):
+    """
+    Return up to `read_count` `(offset, event)` pairs following an
+    offset. Concurrent reads of the same range share one request.
+    """
+    count = config()['read_count']
+    reads = _reads.setdefault(asyncio.get_running_loop(), {})
+    key = (group, offset, count)
+    task = reads.get(key)
+    if task is None:
+        task = reads[key] = asyncio.ensure_future(_read(group, offset, count))
+        task.add_done_callback(lambda _: reads.pop(key, None))
+    return await asyncio.shield(task)
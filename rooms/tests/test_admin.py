@@ -0,0 +1,114 @@
+"""
+Tests for the admin of personal chats and messages.
+"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rooms.admin import MessageAdmin, estimated_count
+from rooms.models import Message, PersonalChatRoom
+
+User = get_user_model()
+
+
+class MessageAdminTest(TestCase):
+    """
+    Test the keyset paged, estimated change lists.
+    """
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser(
+            username='adminuser', password='testpassword1')
+        self.user = User.objects.create_user(
+            username='adminuser2', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.staff, self.user)
+        self.client.force_login(self.staff)
+        self.url = reverse('admin:rooms_message_changelist')
+        self.start = datetime(2026, 1, 1)
+
+    def _messages(self, count, sender=None):
+        return [
+            Message.objects.create(
+                chat=self.chat, sender=sender or self.user, content=f'message {i}',
+                timestamp=self.start + timedelta(days=i))
+            for i in range(count)
+        ]
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self._messages(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self._messages(8, sender=self.staff)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+    def test_keyset_pages(self):
+        messages = self._messages(5)
+
+        with mock.patch.object(MessageAdmin, 'list_per_page', 2):
+            first = self.client.get(self.url)
+            second = self.client.get(self.url + first.context['cl'].next_url)
+            last = self.client.get(
+                self.url + f'?before={messages[1].id}')
+
+        self.assertEqual(
+            [m.id for m in first.context['cl'].result_list],
+            [messages[4].id, messages[3].id])
+        self.assertEqual(first.context['cl'].next_url, f'?before={messages[3].id}')
+        self.assertEqual(
+            [m.id for m in second.context['cl'].result_list],
+            [messages[2].id, messages[1].id])
+        self.assertContains(second, 'Older')
+        self.assertEqual(
+            [m.id for m in last.context['cl'].result_list], [messages[0].id])
+        self.assertIsNone(last.context['cl'].next_url)
+        self.assertEqual(last.context['cl'].result_count, 5)
+
+    def test_date_range_filter(self):
+        messages = self._messages(5)
+
+        response = self.client.get(
+            self.url + '?timestamp__gte=2026-01-02&timestamp__lt=2026-01-04')
+
+        self.assertEqual(
+            [m.id for m in response.context['cl'].result_list],
+            [messages[2].id, messages[1].id])
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_count_is_estimated_on_large_tables(self):
+        self._messages(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE rooms_message')
+
+        self.assertEqual(estimated_count(Message.objects.all()), 3)
+        estimate = estimated_count(Message.objects.all(), exact_below=0)
+        self.assertIsInstance(estimate, int)
+        self.assertGreater(estimate, 0)
+
+    def test_chat_list(self):
+        response = self.client.get(reverse('admin:rooms_personalchatroom_changelist'))
+
+        self.assertContains(response, 'adminuser2')
+
+    def test_staff_need_permissions(self):
+        staff = User.objects.create_user(
+            username='adminuser3', password='testpassword3', is_staff=True)
+        self.client.force_login(staff)
+        users_url = reverse('admin:authentication_user_changelist')
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(users_url).status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_message'))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(users_url).status_code, 403)
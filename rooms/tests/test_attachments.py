@@ -0,0 +1,256 @@
+"""
+Test chunked attachment uploads and downloads.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path, reverse
+
+from rooms import attachments
+from rooms.consumers import PersonalChatConsumer
+from rooms.models import Attachment, Message, PersonalChatRoom
+
+User = get_user_model()
+
+
+class ParseRangeTest(SimpleTestCase):
+    """
+    Test parsing Range headers.
+    """
+
+    def test_ranges(self):
+        self.assertEqual(attachments.parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(attachments.parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(attachments.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(attachments.parse_range('bytes=50-500', 100), (50, 99))
+        self.assertIsNone(attachments.parse_range(None, 100))
+        self.assertIsNone(attachments.parse_range('bytes=0-1,5-6', 100))
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            attachments.parse_range('bytes=100-', 100)
+
+
+class AttachmentTestMixin:
+    """
+    Store attachments in a temporary directory with small chunks.
+    """
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        overridden = override_settings(CHAT_ATTACHMENTS={
+            'root': root,
+            'chunk_size': 4,
+            'max_size': 64,
+            'quota': 100,
+        })
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.user = User.objects.create_user(
+            username='uploader', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='receiver', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+
+
+class UploadTest(AttachmentTestMixin, TestCase):
+    """
+    Test uploading files through the personal chat consumer.
+    """
+    data = b'hello attachments'
+
+    async def _connect(self):
+        application = URLRouter([
+            path("ws/chat/<int:chat_id>", PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}")
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _send_from(self, communicator, upload_id, offset, stop=None):
+        """Send chunks from an offset, until `stop` or the file's end."""
+        while offset < (stop or len(self.data)):
+            await communicator.send_to(bytes_data=attachments.HEADER.pack(
+                upload_id, offset) + self.data[offset:offset + 4])
+            frame = await communicator.receive_json_from()
+            if frame.get('type') != 'upload_progress':
+                return frame
+            offset = frame['offset']
+        return None
+
+    async def test_upload_and_resume(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({
+            'type': 'upload_start',
+            'name': 'notes.txt',
+            'size': len(self.data),
+            'content_type': 'text/plain',
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+            'message': 'see attached',
+        })
+        ready = await communicator.receive_json_from()
+        self.assertEqual(ready['type'], 'upload_ready')
+        self.assertEqual((ready['offset'], ready['chunk_size']), (0, 4))
+        upload_id = ready['upload_id']
+
+        await self._send_from(communicator, upload_id, 0, stop=8)
+        await communicator.disconnect()
+
+        communicator = await self._connect()
+        await communicator.send_json_to(
+            {'type': 'upload_start', 'upload_id': upload_id})
+        ready = await communicator.receive_json_from()
+        self.assertEqual(ready['offset'], 8)
+
+        message = await self._send_from(communicator, upload_id, 8)
+        self.assertEqual(message['message'], 'see attached')
+        self.assertEqual(message['attachment']['name'], 'notes.txt')
+        self.assertEqual(message['attachment']['id'], upload_id)
+        await communicator.disconnect()
+
+        attachment = await Attachment.objects.aget(id=upload_id)
+        self.assertTrue(attachment.completed)
+        with open(attachments.storage_path(attachment), 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertTrue(await Message.objects.filter(
+            attachment=attachment).aexists())
+
+    async def test_wrong_offset_is_rejected(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({
+            'type': 'upload_start', 'name': 'a.bin', 'size': 8})
+        upload_id = (await communicator.receive_json_from())['upload_id']
+
+        await communicator.send_to(
+            bytes_data=attachments.HEADER.pack(upload_id, 4) + b'abcd')
+        error = await communicator.receive_json_from()
+
+        self.assertEqual(error['type'], 'upload_error')
+        self.assertEqual(error['offset'], 0)
+        await communicator.disconnect()
+
+    async def test_checksum_mismatch_deletes_upload(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({
+            'type': 'upload_start', 'name': 'a.bin', 'size': 4,
+            'sha256': '0' * 64})
+        upload_id = (await communicator.receive_json_from())['upload_id']
+
+        await communicator.send_to(
+            bytes_data=attachments.HEADER.pack(upload_id, 0) + b'abcd')
+        error = await communicator.receive_json_from()
+
+        self.assertEqual(error['error'], 'Checksum mismatch')
+        self.assertFalse(await Attachment.objects.filter(id=upload_id).aexists())
+        await communicator.disconnect()
+
+    async def test_write_failure_releases_upload(self):
+        communicator = await self._connect()
+        await communicator.send_json_to({
+            'type': 'upload_start', 'name': 'a.bin', 'size': 8})
+        upload_id = (await communicator.receive_json_from())['upload_id']
+
+        with mock.patch('rooms.attachments.os.pwrite',
+                        side_effect=OSError(28, 'No space left on device')):
+            await communicator.send_to(
+                bytes_data=attachments.HEADER.pack(upload_id, 0) + b'abcd')
+            error = await communicator.receive_json_from()
+
+        self.assertEqual(error['type'], 'upload_error')
+        self.assertNotIn('offset', error)
+        self.assertFalse(await Attachment.objects.filter(id=upload_id).aexists())
+        await communicator.disconnect()
+
+    async def test_quota(self):
+        communicator = await self._connect()
+        for size, expected in ((64, 'upload_ready'), (64, 'upload_error')):
+            await communicator.send_json_to({
+                'type': 'upload_start', 'name': 'a.bin', 'size': size})
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['type'], expected)
+
+        self.assertEqual(frame['error'], 'Attachment quota exceeded')
+        await communicator.disconnect()
+
+
+class DownloadTest(AttachmentTestMixin, TestCase):
+    """
+    Test downloading attachments with and without ranges.
+    """
+    data = bytes(range(40))
+
+    def setUp(self):
+        super().setUp()
+        self.attachment = Attachment.objects.create(
+            chat=self.chat, uploader=self.user, name='data.bin',
+            content_type='application/octet-stream', size=len(self.data),
+            sha256=hashlib.sha256(self.data).hexdigest(), completed=True)
+        path = attachments.storage_path(self.attachment)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(self.data)
+        self.url = reverse('attachment', args=[self.attachment.id])
+
+    def test_full_download(self):
+        self.client.force_login(self.user2)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], '40')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range_download(self):
+        self.client.force_login(self.user2)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/40')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=40-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_non_participant_gets_404(self):
+        outsider = User.objects.create_user(
+            username='outsider', password='testpassword3')
+        self.client.force_login(outsider)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_deleting_removes_file(self):
+        path = attachments.storage_path(self.attachment)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.attachment.delete()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_rolled_back_deletion_keeps_file(self):
+        path = attachments.storage_path(self.attachment)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.attachment.delete()
+                raise DatabaseError
+
+        self.assertEqual(callbacks, [])
+        self.assertTrue(os.path.exists(path))
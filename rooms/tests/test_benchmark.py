@@ -0,0 +1,37 @@
+"""
+Tests for the WebSocket load benchmark.
+"""
+from django.test import TransactionTestCase
+
+from rooms.benchmark import BenchmarkConfig, prepare_and_run
+from rooms.models import PersonalChatRoom
+
+
+class BenchmarkRunTest(TransactionTestCase):
+    """
+    Test a small benchmark run against the in-memory channel layer.
+    """
+    # Reads outside transactions may go to a configured read replica.
+    databases = '__all__'
+
+    async def test_small_run(self):
+        """
+        Test that messages are delivered in public rooms and personal
+        chats and that the fixtures are cleaned up.
+        """
+        config = BenchmarkConfig(
+            public_clients=6,
+            rooms=2,
+            personal_chats=1,
+            rate=5,
+            duration=0.5,
+            drain=0.5,
+        )
+        results = await prepare_and_run(config)
+
+        self.assertEqual(results['connected'], 8)
+        self.assertGreater(results['messages_sent'], 0)
+        self.assertGreater(results['latency']['public']['count'], 0)
+        self.assertGreater(results['latency']['personal']['count'], 0)
+        self.assertIsNotNone(results['latency']['all']['p99_ms'])
+        self.assertEqual(await PersonalChatRoom.objects.acount(), 0)
@@ -0,0 +1,179 @@
+"""
+Tests for conditional GET on the chat pages.
+"""
+from unittest import mock
+
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rooms.models import (
+    PersonalChatRoom,
+    Message,
+)
+from rooms.views import page_version
+
+User = get_user_model()
+
+
+class PersonalChatConditionalTest(TestCase):
+    """
+    Test ETag and Last-Modified handling of the personal chat page.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            password='testpassword1'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            password='testpassword2'
+        )
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+        self.message = Message.objects.create(
+            chat=self.chat,
+            sender=self.user,
+            content='hello',
+            timestamp=timezone.now(),
+        )
+        self.url = reverse('personal-chat', kwargs={'chat_id': self.chat.id})
+        self.client.force_login(self.user)
+
+    def test_validators_are_sent(self):
+        """
+        Test that the page carries an ETag, Last-Modified and asks
+        browsers to revalidate.
+        """
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        self.assertIn('private', response.headers['Cache-Control'])
+
+    def test_not_modified_skips_messages(self):
+        """
+        Test that a matching If-None-Match gets a 304 without querying
+        the message list.
+        """
+        etag = self.client.get(self.url).headers['ETag']
+
+        # Session, user and participant lookups plus the latest message
+        # id; no history rendering.
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_non_participant_gets_404(self):
+        """
+        Test that users outside the chat and missing chats get a 404.
+        """
+        User.objects.create_user(username='testuser3', password='testpassword3')
+        self.client.login(username='testuser3', password='testpassword3')
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        missing = reverse('personal-chat', kwargs={'chat_id': self.chat.id + 1})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_deleted_latest_message_is_skipped(self):
+        """
+        Test that the validators come from the latest live message.
+        """
+        etag = self.client.get(self.url).headers['ETag']
+        Message.objects.create(
+            chat=self.chat,
+            sender=self.user2,
+            content='gone',
+            timestamp=timezone.now(),
+            deleted=True,
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_message_changes_etag(self):
+        """
+        Test that a new message makes the old ETag stale.
+        """
+        etag = self.client.get(self.url).headers['ETag']
+        Message.objects.create(
+            chat=self.chat,
+            sender=self.user2,
+            content='new',
+            timestamp=timezone.now(),
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'new', response.content)
+
+    def test_edit_changes_etag(self):
+        """
+        Test that editing a message makes the old ETag stale.
+        """
+        etag = self.client.get(self.url).headers['ETag']
+        self.message.content = 'edited'
+        self.message.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        """
+        Test that each participant gets their own validator.
+        """
+        etag = self.client.get(self.url).headers['ETag']
+        self.client.force_login(self.user2)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class PublicRoomConditionalTest(TestCase):
+    """
+    Test ETag handling of the public room page.
+    """
+
+    def test_not_modified(self):
+        """
+        Test that the public room page revalidates by room name.
+        """
+        url = reverse('room', kwargs={'room_name': 'lobby'})
+        etag = self.client.get(url).headers['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        other = self.client.get(reverse('room', kwargs={'room_name': 'other'}))
+        self.assertNotEqual(other.headers['ETag'], etag)
+
+    def test_asset_deploy_changes_etag(self):
+        """
+        Test that a new manifest name of a page asset makes the old ETag
+        stale.
+        """
+        url = reverse('room', kwargs={'room_name': 'lobby'})
+        etag = self.client.get(url).headers['ETag']
+        self.addCleanup(page_version.cache_clear)
+        page_version.cache_clear()
+
+        with mock.patch(
+            'rooms.views.staticfiles_storage.url',
+            return_value='/static/css/base-room-style.0123abcd.css',
+        ):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
@@ -1,7 +1,7 @@
 """
 Test for websocket consumers.
 """
-from asgiref.sync import SyncToAsync
+from asgiref.sync import SyncToAsync, async_to_sync
 
 import time
 
@@ -10,8 +10,9 @@ import json
 from channels.testing import WebsocketCommunicator
 from channels.routing import URLRouter
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import path
 
@@ -19,6 +20,7 @@ from rooms.consumers import (
     PersonalChatConsumer,
     PublicRoomConsumer,
 )
+from chat import metrics
 from rooms.models import (
     PersonalChatRoom,
     Message
@@ -26,12 +28,22 @@ from rooms.models import (
 
 User = get_user_model()
 
+ISOLATED_LAYER = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
 
+
+@override_settings(CHANNEL_LAYERS=ISOLATED_LAYER)
 class PublicRoomTest(TestCase):
     """
-    Test the behavior of the consumer for the public room.
+    Test the behavior of the consumer for the public room. The user
+    count comes from the channel layer groups, so the tests run on a
+    layer of their own, emptied before each test.
     """
 
+    def setUp(self):
+        async_to_sync(get_channel_layer().flush)()
+
     async def _set_communicator(self):
         """
         Configure the app for routing.
@@ -78,12 +90,18 @@ class PublicRoomTest(TestCase):
         await communicator2.receive_from()
 
         response = await communicator2.receive_json_from()
-        self.assertEqual(response, data)
+        self.assertEqual(response['message'], data['message'])
+        self.assertEqual(response['username'], data['username'])
+        self.assertIn('trace_id', response)
 
         await communicator.receive_json_from()
         await communicator.receive_json_from()
         response2 = await communicator.receive_json_from()
-        self.assertEqual(response2, data)
+        self.assertEqual(response2['message'], data['message'])
+        self.assertEqual(response2['username'], data['username'])
+
+        await communicator.disconnect()
+        await communicator2.disconnect()
 
     async def test_disconnect_and_user_count(self):
         """
@@ -202,3 +220,49 @@ class PersonalChatTest(TestCase):
 
         await communicator.disconnect()
         await communicator2.disconnect()
+
+    async def test_message_trace_and_ack(self):
+        """
+        Test that messages carry server trace fields, use the server
+        receive time and that client acks are measured.
+        """
+        communicator, _ = await self._set_communicator(
+            self.user, self.chat.id
+        )
+        communicator2, _ = await self._set_communicator(
+            self.user2, self.chat.id
+        )
+        before = time.time() * 1000
+        await communicator.send_json_to({
+            'message': 'traced',
+            'timestamp': 0,
+        })
+
+        response = await communicator2.receive_json_from(10)
+        await communicator.receive_json_from(10)
+
+        self.assertEqual(len(response['trace_id']), 32)
+        self.assertGreaterEqual(response['received_at'], before)
+        self.assertGreaterEqual(
+            response['broadcast_at'], response['received_at'])
+
+        message = await Message.objects.aget(content='traced')
+        self.assertGreater(message.timestamp.year, 1970)
+
+        await communicator2.send_json_to({
+            'type': 'ack',
+            'trace_id': response['trace_id'],
+        })
+        await communicator2.send_json_to({
+            'type': 'ack',
+            'trace_id': 'unknown',
+        })
+        await communicator2.receive_nothing()
+
+        self.assertIn(
+            'chat_delivery_seconds_count{kind="personal"',
+            metrics.REGISTRY.render(),
+        )
+
+        await communicator.disconnect()
+        await communicator2.disconnect()
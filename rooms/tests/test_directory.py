@@ -0,0 +1,164 @@
+"""
+Tests for the public room directory. Needs the Redis server of the
+channel layer.
+"""
+from unittest import mock
+
+import redis
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+
+from rooms import directory, streams
+from rooms.consumers import DirectoryConsumer, PublicRoomConsumer
+
+DIRECTORY = {
+    'url': 'redis://redis:6379/3',
+    'prefix': 'test-directory',
+    'interval': 0.05,
+    'top': 2,
+    'worker_ttl': 30,
+}
+
+
+@override_settings(CHAT_DIRECTORY=DIRECTORY)
+class DirectoryTest(TestCase):
+    """
+    Test the occupancy index and the snapshot of the top rooms.
+    """
+
+    def setUp(self):
+        self.redis = redis.Redis.from_url(DIRECTORY['url'])
+        self.redis.flushdb()
+
+    async def test_deltas_update_the_index(self):
+        worker = directory.Directory()
+        for room in ('a', 'a', 'a', 'b', 'c'):
+            worker.joined(room)
+        worker.left('a')
+        await worker.flush()
+        await worker.refresh()
+
+        self.assertEqual(worker.rooms, [
+            {'room': 'a', 'users': 2}, {'room': 'c', 'users': 1}])
+
+        worker.left('a')
+        worker.left('a')
+        worker.left('c')
+        await worker.flush()
+        await worker.refresh()
+
+        self.assertEqual(worker.rooms, [{'room': 'b', 'users': 1}])
+        self.assertEqual(self.redis.zrange('test-directory', 0, -1), [b'b'])
+
+    async def test_dead_worker_is_reaped(self):
+        dead = directory.Directory()
+        dead.joined('a')
+        dead.joined('a')
+        await dead.flush()
+        self.redis.delete(directory.worker_keys(dead.worker_id)[2])
+
+        live = directory.Directory()
+        live.joined('a')
+        await live.flush()
+        await live.refresh()
+
+        self.assertEqual(live.rooms, [{'room': 'a', 'users': 1}])
+        self.assertFalse(self.redis.exists(directory.worker_keys(dead.worker_id)[1]))
+
+    async def test_reaped_worker_writes_its_counts_again(self):
+        """Test that a worker cut off for too long recovers its counts."""
+        worker = directory.Directory()
+        worker.joined('a')
+        worker.joined('a')
+        await worker.flush()
+        self.redis.delete(directory.worker_keys(worker.worker_id)[2])
+        await directory.Directory().reap(streams.loop_client(DIRECTORY['url']))
+        self.assertEqual(self.redis.zrange('test-directory', 0, -1), [])
+
+        worker.joined('b')
+        await worker.flush()
+        await worker.refresh()
+
+        self.assertEqual(worker.rooms, [
+            {'room': 'a', 'users': 2}, {'room': 'b', 'users': 1}])
+        await worker.flush()
+        await worker.refresh()
+        self.assertEqual(worker.rooms, [
+            {'room': 'a', 'users': 2}, {'room': 'b', 'users': 1}])
+
+    @override_settings(CHAT_DIRECTORY={**DIRECTORY, 'interval': 60})
+    def test_top_is_served_from_memory(self):
+        self.redis.zadd('test-directory', {'a': 3, 'b': 5, 'c': 1})
+        worker = directory.Directory()
+
+        self.assertEqual(worker.top(1), [{'room': 'b', 'users': 5}])
+        self.redis.zadd('test-directory', {'d': 10})
+        self.assertEqual(worker.top(), [
+            {'room': 'b', 'users': 5}, {'room': 'a', 'users': 3}])
+
+    def test_view(self):
+        self.redis.zadd('test-directory', {'a': 3, 'b': 5})
+
+        with mock.patch.object(directory, 'room_directory', directory.Directory()):
+            response = self.client.get(reverse('room-directory') + '?limit=1')
+
+        self.assertEqual(response.json(), {'rooms': [{'room': 'b', 'users': 5}]})
+
+    def test_view_serves_last_snapshot_without_redis(self):
+        self.redis.zadd('test-directory', {'a': 3})
+        worker = directory.Directory()
+        worker.top()
+        worker.refreshed_at = None
+        client = mock.Mock(zrevrange=mock.Mock(side_effect=redis.ConnectionError))
+
+        with mock.patch.object(directory, 'room_directory', worker), \
+                mock.patch.object(directory, '_sync_client', return_value=client):
+            response = self.client.get(reverse('room-directory'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'rooms': [{'room': 'a', 'users': 3}]})
+
+
+@override_settings(CHAT_DIRECTORY=DIRECTORY)
+class DirectoryConsumerTest(TestCase):
+    """
+    Test the directory feed as public room connections come and go.
+    """
+
+    def setUp(self):
+        redis.Redis.from_url(DIRECTORY['url']).flushdb()
+        patcher = mock.patch.object(
+            directory, 'room_directory', directory.Directory())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _connect(self, url):
+        application = URLRouter([
+            path('ws/rooms/', DirectoryConsumer.as_asgi()),
+            path('ws/chat/<str:room_name>/', PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(application, url)
+        communicator.scope['user'] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_feed_follows_occupancy(self):
+        feed = await self._connect('/ws/rooms/')
+        self.assertEqual(await feed.receive_json_from(), {'type': 'directory', 'rooms': []})
+
+        room = await self._connect('/ws/chat/directoryroom/')
+        self.assertEqual(await feed.receive_json_from(), {
+            'type': 'directory',
+            'rooms': [{'room': 'directoryroom', 'users': 1}],
+        })
+
+        await room.disconnect()
+        self.assertEqual(
+            await feed.receive_json_from(), {'type': 'directory', 'rooms': []})
+
+        await feed.disconnect()
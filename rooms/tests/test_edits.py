@@ -0,0 +1,188 @@
+"""
+Tests for editing and deleting personal chat messages.
+"""
+from datetime import datetime, timedelta
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import path
+
+from rooms import edits
+from rooms.consumers import PersonalChatConsumer
+from rooms.history import render_history
+from rooms.models import Attachment, Message, PersonalChatRoom
+
+User = get_user_model()
+
+
+class EditTest(TestCase):
+    """
+    Test edits and tombstones in the database and the history.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='edituser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='edituser2', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+        self.message = Message.objects.create(
+            chat=self.chat, sender=self.user, content='original',
+            timestamp=datetime.now())
+
+    def test_edit(self):
+        render_history(self.chat, self.user)
+
+        message = edits.edit_message(
+            self.user, self.chat.id, self.message.id, 'edited', version=1)
+
+        self.assertEqual(message.version, 2)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.content, 'edited')
+        self.assertIsNotNone(self.message.changed)
+        history = render_history(self.chat, self.user)
+        self.assertIn('edited', history)
+        self.assertIn('data-message-version="2"', history)
+        self.assertEqual(edits.change_frame(message), {
+            'type': 'edit',
+            'id': self.message.id,
+            'version': 2,
+            'changed': edits.to_ms(self.message.changed),
+            'message': 'edited',
+        })
+
+    def test_delete_leaves_a_tombstone(self):
+        attachment = Attachment.objects.create(
+            chat=self.chat, uploader=self.user, name='a.txt',
+            content_type='text/plain', size=1, completed=True)
+        self.message.attachment = attachment
+        self.message.save()
+
+        message = edits.delete_message(self.user, self.chat.id, self.message.id)
+
+        self.message.refresh_from_db()
+        self.assertTrue(self.message.deleted)
+        self.assertEqual(self.message.content, '')
+        self.assertEqual(self.message.version, 2)
+        self.assertFalse(Attachment.objects.filter(id=attachment.id).exists())
+        self.assertNotIn('data-message-id', render_history(self.chat, self.user))
+        self.assertEqual(edits.change_frame(message)['type'], 'delete')
+        self.assertNotIn('message', edits.change_frame(message))
+
+    def test_refused_changes(self):
+        edits.edit_message(self.user, self.chat.id, self.message.id, 'first')
+
+        with self.assertRaisesMessage(edits.EditError, 'Message changed'):
+            edits.edit_message(self.user, self.chat.id, self.message.id, 'x', version=1)
+        with self.assertRaisesMessage(edits.EditError, 'Unknown message'):
+            edits.edit_message(self.user2, self.chat.id, self.message.id, 'x')
+        with self.assertRaisesMessage(edits.EditError, 'Empty message'):
+            edits.edit_message(self.user, self.chat.id, self.message.id, ' ')
+        edits.delete_message(self.user, self.chat.id, self.message.id)
+        with self.assertRaisesMessage(edits.EditError, 'Unknown message'):
+            edits.delete_message(self.user, self.chat.id, self.message.id)
+
+    def test_partial_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s',
+                [Message._meta.db_table])
+            indexes = dict(cursor.fetchall())
+
+        self.assertIn('WHERE (NOT deleted)', indexes['message_live_idx'])
+        self.assertIn('WHERE (changed IS NOT NULL)', indexes['message_changed_idx'])
+
+
+class EditConsumerTest(TestCase):
+    """
+    Test change frames sent to the connections of a chat.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='editconsumer1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='editconsumer2', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+        self.messages = [
+            Message.objects.create(
+                chat=self.chat, sender=self.user, content=f'message {i}',
+                timestamp=datetime.now())
+            for i in range(3)
+        ]
+
+    async def _connect(self, user, query=''):
+        application = URLRouter([
+            path("ws/chat/<int:chat_id>", PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}{query}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_changes_are_broadcast(self):
+        communicator = await self._connect(self.user)
+        other = await self._connect(self.user2)
+        message_id = self.messages[0].id
+
+        await communicator.send_json_to(
+            {'type': 'edit', 'id': message_id, 'message': 'new', 'version': 1})
+        edit = await other.receive_json_from()
+        await communicator.send_json_to(
+            {'type': 'delete', 'id': message_id, 'version': 2})
+        await communicator.receive_json_from()
+        delete = await communicator.receive_json_from()
+
+        self.assertEqual(
+            {key: edit[key] for key in ('type', 'id', 'version', 'message')},
+            {'type': 'edit', 'id': message_id, 'version': 2, 'message': 'new'})
+        self.assertEqual(
+            {key: delete[key] for key in ('type', 'id', 'version')},
+            {'type': 'delete', 'id': message_id, 'version': 3})
+
+        await communicator.disconnect()
+        await other.disconnect()
+
+    async def test_refused_change(self):
+        communicator = await self._connect(self.user2)
+
+        await communicator.send_json_to(
+            {'type': 'edit', 'id': self.messages[0].id, 'message': 'mine now'})
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response['type'], 'change_error')
+        self.assertEqual(response['error'], 'Unknown message')
+
+        await communicator.disconnect()
+
+    async def test_resume_sends_missed_changes(self):
+        since = edits.to_ms(datetime.now() - timedelta(seconds=1))
+        first, second, third = self.messages
+        await Message.objects.filter(id=first.id).aupdate(
+            content='', deleted=True, version=2, changed=datetime.now())
+        await Message.objects.filter(id=second.id).aupdate(
+            content='edited', version=3, changed=datetime.now())
+        await Message.objects.filter(id=third.id).aupdate(
+            content='', deleted=True, version=2, changed=datetime.now())
+
+        communicator = await self._connect(
+            self.user2, f'?last_seen={second.id}&changed_since={since}')
+        response = await communicator.receive_json_from()
+
+        self.assertTrue(response['complete'])
+        # The deleted message after last_seen is skipped, not resumed.
+        self.assertEqual(response['messages'], [])
+        self.assertEqual(
+            [(change['type'], change['id'], change['version'])
+             for change in response['changes']],
+            [('delete', first.id, 2), ('edit', second.id, 3)])
+
+        await communicator.disconnect()
@@ -0,0 +1,116 @@
+"""
+Tests for the consumer heartbeat and the group sweeper.
+"""
+import time
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from chat import metrics
+from rooms.consumers import PublicRoomConsumer
+from rooms.heartbeat import GroupSweeper, IDLE_CLOSE_CODE
+
+
+@override_settings(CHAT_HEARTBEAT_INTERVAL=0.05, CHAT_IDLE_TIMEOUT=0.3)
+class HeartbeatTest(SimpleTestCase):
+    """
+    Test pings, keep-alive through pongs and reaping idle connections.
+    """
+
+    async def _connect(self, room):
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{room}/")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        return communicator
+
+    async def test_ping_and_pong(self):
+        """
+        Test that the server pings and that pongs keep the connection
+        open past the idle timeout.
+        """
+        communicator = await self._connect('heartbeat')
+
+        for _ in range(10):
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame, {'type': 'ping'})
+            await communicator.send_json_to({'type': 'pong'})
+
+        await communicator.disconnect()
+
+    async def test_idle_connection_is_reaped(self):
+        """
+        Test that a silent client is closed and counted as reaped.
+        """
+        reaped = metrics.CONNECTIONS_REAPED.labels('PublicRoomConsumer')
+        before = reaped.value
+        communicator = await self._connect('idle')
+
+        while True:
+            output = await communicator.receive_output(timeout=2)
+            if output['type'] == 'websocket.close':
+                break
+
+        self.assertEqual(output['code'], IDLE_CLOSE_CODE)
+        self.assertEqual(reaped.value, before + 1)
+        await communicator.disconnect()
+
+
+class GroupSweeperTest(SimpleTestCase):
+    """
+    Test removing stale members from the channel layer groups.
+    """
+
+    async def test_sweep_in_memory(self):
+        """
+        Test that only members older than the group expiry are removed.
+        """
+        layer = InMemoryChannelLayer(group_expiry=60)
+        await layer.group_add('chat_room', 'specific.live')
+        await layer.group_add('chat_room', 'specific.dead')
+        await layer.group_add('chat_other', 'specific.gone')
+        layer.groups['chat_room']['specific.dead'] = time.time() - 120
+        layer.groups['chat_other']['specific.gone'] = time.time() - 120
+
+        removed = await GroupSweeper(layer).sweep()
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(list(layer.groups), ['chat_room'])
+        self.assertEqual(list(layer.groups['chat_room']), ['specific.live'])
+
+    async def test_sweep_redis(self):
+        """
+        Test that stale members are removed from the Redis groups.
+        """
+        layer = get_channel_layer()
+        await layer.group_add('chat_sweep', 'specific.live')
+        await layer.group_add('chat_sweep', 'specific.dead')
+        key = layer._group_key('chat_sweep')
+        connection = layer.connection(layer.consistent_hash('chat_sweep'))
+        await connection.zadd(
+            key, {'specific.dead': time.time() - 2 * layer.group_expiry})
+
+        try:
+            removed = await GroupSweeper(layer).sweep()
+            members = await connection.zrange(key, 0, -1)
+        finally:
+            await layer.group_discard('chat_sweep', 'specific.live')
+
+        self.assertGreaterEqual(removed, 1)
+        self.assertEqual(members, [b'specific.live'])
+
+    async def test_unchecked_redis_version_fails(self):
+        """
+        Test that sweeping refuses channels_redis versions whose Redis
+        layout wasn't checked.
+        """
+        with mock.patch('channels_redis.__version__', '5.0.0'):
+            with self.assertRaises(NotImplementedError):
+                await GroupSweeper(get_channel_layer()).sweep()
@@ -0,0 +1,163 @@
+"""
+Tests for the cached chat history rendering.
+"""
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rooms.history import _sealed_key, history_version, render_history
+from rooms.models import (
+    PersonalChatRoom,
+    Message,
+)
+
+User = get_user_model()
+
+
+@override_settings(CHAT_HISTORY_CHUNK_SIZE=2, CHAT_HISTORY_SEAL_SECONDS=0)
+class RenderHistoryTest(TestCase):
+    """
+    Test rendering history chunks and their invalidation.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            password='testpassword1'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            password='testpassword2'
+        )
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+
+    def _message(self, content, sender=None):
+        return Message.objects.create(
+            chat=self.chat,
+            sender=sender or self.user,
+            content=content,
+            timestamp=timezone.now(),
+        )
+
+    def test_renders_newest_first(self):
+        """
+        Test that every message is rendered, newest first, with the
+        class of the viewer's own messages.
+        """
+        for number in range(5):
+            self._message(f'message-{number}')
+        self._message('reply', sender=self.user2)
+
+        history = render_history(self.chat, self.user)
+
+        positions = [history.index(f'message-{n}') for n in range(5)]
+        self.assertEqual(positions, sorted(positions, reverse=True))
+        self.assertLess(history.index('reply'), positions[-1])
+        self.assertEqual(history.count('my-message'), 5)
+        self.assertEqual(history.count('other-message'), 1)
+
+    def test_sealed_chunks_are_cached(self):
+        """
+        Test that only the tail chunk is re-rendered on later views.
+        """
+        for number in range(6):
+            self._message(f'message-{number}')
+        render_history(self.chat, self.user)
+
+        with self.assertNumQueries(1):
+            history = render_history(self.chat, self.user)
+
+        self.assertIn('message-0', history)
+        self.assertIn('message-5', history)
+
+    def test_new_message_in_tail(self):
+        """
+        Test that a new message shows up without invalidation.
+        """
+        for number in range(3):
+            self._message(f'message-{number}')
+        render_history(self.chat, self.user)
+
+        self._message('latest')
+
+        self.assertIn('latest', render_history(self.chat, self.user))
+
+    def test_edit_and_delete_invalidate(self):
+        """
+        Test that editing or deleting a message in a sealed chunk
+        retires the cached chunks of the chat.
+        """
+        first = self._message('original')
+        for number in range(4):
+            self._message(f'message-{number}')
+        render_history(self.chat, self.user)
+
+        first.content = 'edited'
+        first.save()
+        history = render_history(self.chat, self.user)
+        self.assertIn('edited', history)
+        self.assertNotIn('original', history)
+
+        first.delete()
+        self.assertNotIn('edited', render_history(self.chat, self.user))
+
+    @override_settings(CHAT_HISTORY_SEAL_SECONDS=60)
+    def test_recent_chunks_stay_open(self):
+        """
+        Test that a message committing after messages with higher ids
+        shows up while its chunk is recent.
+        """
+        other = PersonalChatRoom.objects.create()
+        for number in range(2):
+            self._message(f'message-{number}')
+        late = self._message('late')
+        for number in range(2, 6):
+            self._message(f'message-{number}')
+        # Hide the message as if its transaction was still open.
+        Message.objects.filter(id=late.id).update(chat=other)
+        render_history(self.chat, self.user)
+
+        Message.objects.filter(id=late.id).update(chat=self.chat)
+
+        self.assertIn('late', render_history(self.chat, self.user))
+
+    def test_chunks_count_the_chat_messages(self):
+        """
+        Test that chunks hold a fixed number of the chat's messages
+        however many messages of other chats come between them.
+        """
+        other = PersonalChatRoom.objects.create()
+        for number in range(5):
+            self._message(f'message-{number}')
+            for _ in range(3):
+                Message.objects.create(
+                    chat=other, sender=self.user2, content='elsewhere',
+                    timestamp=timezone.now())
+        render_history(self.chat, self.user)
+
+        sealed = cache.get(_sealed_key(self.chat.id, history_version(self.chat.id)))
+        self.assertEqual(len(sealed), 2)
+        for first_id, last_id in sealed:
+            self.assertEqual(
+                Message.objects.filter(
+                    chat=self.chat, id__gte=first_id, id__lte=last_id).count(), 2)
+
+    def test_only_open_chunks_are_read(self):
+        """
+        Test that later views only read the messages past the sealed
+        chunks.
+        """
+        for number in range(6):
+            self._message(f'message-{number}')
+        render_history(self.chat, self.user)
+        first = Message.objects.filter(chat=self.chat).order_by('id').first()
+        # Invisible to the sealed chunks, which are not read again.
+        Message.objects.filter(id=first.id).update(content='changed')
+
+        history = render_history(self.chat, self.user)
+
+        self.assertIn('message-0', history)
+        self.assertNotIn('changed', history)
@@ -0,0 +1,99 @@
+"""
+Tests for the per-user notifications of new messages.
+"""
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from rooms import notifications
+from rooms.consumers import NotificationConsumer, PersonalChatConsumer
+from rooms.models import Attachment, PersonalChatRoom
+
+User = get_user_model()
+
+
+class NoticeFrameTest(TestCase):
+    """
+    Test the compact notices of new messages.
+    """
+
+    @override_settings(CHAT_NOTICE_PREVIEW=5)
+    def test_preview_is_truncated(self):
+        self.assertEqual(
+            notifications.notice_frame(3, 7, 'alice', 'hello world'),
+            {'type': 'notice', 'chat': 3, 'id': 7, 'sender': 'alice',
+             'preview': 'hello…'})
+        self.assertEqual(
+            notifications.notice_frame(3, 7, 'alice', 'hello')['preview'], 'hello')
+
+    def test_attachment_is_named(self):
+        user = User.objects.create_user(username='noticeuser', password='testpassword1')
+        chat = PersonalChatRoom.objects.create()
+        attachment = Attachment(
+            chat=chat, uploader=user, name='photo.png',
+            content_type='image/png', size=1)
+
+        frame = notifications.notice_frame(chat.id, 1, 'alice', '', attachment)
+
+        self.assertEqual(frame['attachment'], 'photo.png')
+        self.assertEqual(frame['preview'], '')
+
+
+class NotificationConsumerTest(TestCase):
+    """
+    Test the delivery of notices to every device of the participants.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='notifyuser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='notifyuser2', password='testpassword2')
+        self.outsider = User.objects.create_user(
+            username='notifyuser3', password='testpassword3')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+
+    async def _connect(self, user, url='/ws/notifications/'):
+        application = URLRouter([
+            path('ws/notifications/', NotificationConsumer.as_asgi()),
+            path('ws/chat/<int:chat_id>', PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(application, url)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_anonymous_connection_is_refused(self):
+        _, connected = await self._connect(AnonymousUser())
+
+        self.assertFalse(connected)
+
+    async def test_notices_reach_every_device(self):
+        phone, _ = await self._connect(self.user2)
+        laptop, _ = await self._connect(self.user2)
+        sender_device, _ = await self._connect(self.user)
+        outsider, _ = await self._connect(self.outsider)
+        chat, _ = await self._connect(self.user, f'/ws/chat/{self.chat.id}')
+
+        await chat.send_json_to({'message': 'hello there'})
+        message = await chat.receive_json_from()
+
+        expected = {
+            'type': 'notice',
+            'chat': self.chat.id,
+            'id': message['id'],
+            'sender': 'notifyuser1',
+            'preview': 'hello there',
+        }
+        self.assertEqual(await phone.receive_json_from(), expected)
+        self.assertEqual(await laptop.receive_json_from(), expected)
+        self.assertEqual(await sender_device.receive_json_from(), expected)
+        self.assertTrue(await outsider.receive_nothing())
+
+        for communicator in (phone, laptop, sender_device, outsider, chat):
+            await communicator.disconnect()
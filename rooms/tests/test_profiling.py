@@ -0,0 +1,88 @@
+"""
+Tests for the consumer handler profiling.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from channels.testing import WebsocketCommunicator
+from channels.routing import URLRouter
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from chat import metrics
+from rooms.consumers import PublicRoomConsumer
+from rooms.profiling import profiler
+
+
+class HandlerProfilerTest(SimpleTestCase):
+    """
+    Test switching the profiler at runtime and the recorded traces.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.flag_file = os.path.join(directory, 'profiling.flag')
+        self.settings_override = override_settings(CHAT_PROFILING={
+            'flag_file': self.flag_file,
+            'poll_seconds': 0,
+            'sample_rate': 1.0,
+            'slow_ms': 0,
+        })
+        self.settings_override.enable()
+        profiler.refresh()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        profiler.refresh()
+
+    async def _connect(self):
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, "/ws/chat/profiled/")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        return communicator
+
+    def test_disabled_without_flag_file(self):
+        """
+        Test that profiling is off until the flag file exists.
+        """
+        self.assertFalse(profiler.is_enabled())
+
+        call_command('chat_profiling', 'on', '--slow-ms', '5', stdout=StringIO())
+
+        self.assertTrue(profiler.is_enabled())
+        self.assertEqual(profiler.options['slow_ms'], 5)
+
+        call_command('chat_profiling', 'off', stdout=StringIO())
+
+        self.assertFalse(profiler.is_enabled())
+
+    async def test_slow_events_are_traced(self):
+        """
+        Test that handler timings are recorded and slow calls are logged
+        with their sampled profile.
+        """
+        with open(self.flag_file, 'w', encoding='utf-8') as file:
+            file.write('')
+
+        with self.assertLogs('rooms.profiling', level='INFO') as logs:
+            communicator = await self._connect()
+            await communicator.disconnect()
+
+        traces = [json.loads(record.getMessage()) for record in logs.records]
+        handlers = {trace['handler'] for trace in traces}
+        self.assertIn('connect', handlers)
+        self.assertIn('user_count', handlers)
+        self.assertTrue(any('profile' in trace for trace in traces))
+        self.assertIn(
+            'chat_handler_seconds_count{consumer="PublicRoomConsumer",'
+            'handler="connect"}',
+            metrics.REGISTRY.render(),
+        )
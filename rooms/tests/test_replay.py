@@ -0,0 +1,171 @@
+"""
+Test resuming connections from the last seen message.
+"""
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from rooms import replay
+from rooms.consumers import PersonalChatConsumer, PublicRoomConsumer
+from rooms.models import Message, PersonalChatRoom
+
+User = get_user_model()
+
+
+class ReplayBufferTest(SimpleTestCase):
+    """
+    Test the per-worker buffer of public room frames.
+    """
+
+    def test_since_returns_frames_after_last_seen(self):
+        buffer = replay.ReplayBuffer(size=10, max_rooms=10)
+        for message_id in 'abc':
+            buffer.add('room', message_id, {'id': message_id})
+
+        frames, complete = buffer.since('room', 'a')
+
+        self.assertEqual(frames, [{'id': 'b'}, {'id': 'c'}])
+        self.assertTrue(complete)
+        self.assertEqual(buffer.since('room', 'c'), ([], True))
+
+    def test_duplicate_frames_are_ignored(self):
+        buffer = replay.ReplayBuffer(size=10, max_rooms=10)
+        buffer.add('room', 'a', {'id': 'a'})
+        buffer.add('room', 'a', {'id': 'a'})
+
+        self.assertEqual(len(buffer.rooms['room']), 1)
+
+    def test_unknown_last_seen_is_incomplete(self):
+        buffer = replay.ReplayBuffer(size=2, max_rooms=10)
+        for message_id in 'abc':
+            buffer.add('room', message_id, {'id': message_id})
+
+        frames, complete = buffer.since('room', 'a')
+
+        self.assertEqual(frames, [{'id': 'b'}, {'id': 'c'}])
+        self.assertFalse(complete)
+        self.assertEqual(buffer.since('other', 'a'), ([], False))
+
+    def test_least_recent_room_is_evicted(self):
+        buffer = replay.ReplayBuffer(size=2, max_rooms=2)
+        buffer.add('one', 'a', {})
+        buffer.add('two', 'b', {})
+        buffer.add('one', 'c', {})
+        buffer.add('three', 'd', {})
+
+        self.assertEqual(list(buffer.rooms), ['one', 'three'])
+
+
+class PublicRoomResumeTest(TestCase):
+    """
+    Test resuming a public room connection from the replay buffer.
+    """
+
+    def setUp(self):
+        replay.replay_buffer.rooms.clear()
+
+    async def _connect(self, query=''):
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/resume/{query}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_resume_sends_missed_frames(self):
+        communicator = await self._connect()
+        await communicator.receive_json_from()
+        for text in ('one', 'two', 'three'):
+            await communicator.send_json_to(
+                {'message': text, 'username': 'someone'})
+        first = await communicator.receive_json_from()
+        await communicator.receive_json_from()
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        communicator = await self._connect(f"?last_seen={first['id']}")
+        # The user count is broadcast through the layer and may arrive
+        # on either side of the resume frame.
+        frames = [
+            await communicator.receive_json_from(),
+            await communicator.receive_json_from(),
+        ]
+        response = next(frame for frame in frames if 'type' in frame)
+
+        self.assertEqual(response['type'], 'resume')
+        self.assertTrue(response['complete'])
+        self.assertEqual(
+            [frame['message'] for frame in response['messages']],
+            ['two', 'three'])
+
+        await communicator.disconnect()
+
+
+class PersonalChatResumeTest(TestCase):
+    """
+    Test resuming a personal chat connection from the database.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='resumeuser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='resumeuser2', password='testpassword2')
+        self.outsider = User.objects.create_user(
+            username='resumeuser3', password='testpassword3')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+        self.messages = [
+            Message.objects.create(
+                chat=self.chat,
+                sender=self.user2,
+                content=f'message {i}',
+                timestamp=timezone.now(),
+            )
+            for i in range(5)
+        ]
+
+    async def _connect(self, user, last_seen, accepted=True):
+        application = URLRouter([
+            path("ws/chat/<int:chat_id>", PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}?last_seen={last_seen}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertEqual(connected, accepted)
+        return communicator
+
+    async def test_resume_sends_missed_messages(self):
+        communicator = await self._connect(self.user, self.messages[1].id)
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response['type'], 'resume')
+        self.assertTrue(response['complete'])
+        self.assertEqual(
+            [message['id'] for message in response['messages']],
+            [message.id for message in self.messages[2:]])
+        self.assertEqual(response['messages'][0]['sender'], 'resumeuser2')
+
+        await communicator.disconnect()
+
+    @override_settings(CHAT_RESUME_LIMIT=2)
+    async def test_resume_is_capped(self):
+        communicator = await self._connect(self.user, self.messages[0].id)
+        response = await communicator.receive_json_from()
+
+        self.assertFalse(response['complete'])
+        self.assertEqual(
+            [message['id'] for message in response['messages']],
+            [message.id for message in self.messages[1:3]])
+
+        await communicator.disconnect()
+
+    async def test_non_participant_is_refused(self):
+        await self._connect(self.outsider, 0, accepted=False)
@@ -0,0 +1,129 @@
+"""
+Tests for message retention.
+"""
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from rooms import retention
+from rooms.models import Attachment, Message, PersonalChatRoom, RetentionProgress
+
+User = get_user_model()
+
+
+@override_settings(CHAT_RETENTION={'days': 30, 'pause': 0})
+class RetentionTest(TestCase):
+    """
+    Test deleting expired messages in batches.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='retentionuser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='retentionuser2', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.short_chat = PersonalChatRoom.objects.create(retention_days=7)
+        self.long_chat = PersonalChatRoom.objects.create(retention_days=365)
+        for chat in (self.chat, self.short_chat, self.long_chat):
+            chat.participants.add(self.user, self.user2)
+
+    def _message(self, chat, days_ago, **kwargs):
+        return Message.objects.create(
+            chat=chat, sender=self.user, content=f'{days_ago} days ago',
+            timestamp=datetime.now() - timedelta(days=days_ago), **kwargs)
+
+    def test_policies(self):
+        old = self._message(self.chat, 40)
+        recent = self._message(self.chat, 10)
+        short_old = self._message(self.short_chat, 10)
+        short_recent = self._message(self.short_chat, 1)
+        long_kept = self._message(self.long_chat, 40)
+
+        progress = retention.prune(batch_size=2)
+
+        self.assertIsNotNone(progress.finished)
+        self.assertEqual(progress.deleted, 2)
+        remaining = set(Message.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {recent.id, short_recent.id, long_kept.id})
+        self.assertNotIn(old.id, remaining)
+        self.assertNotIn(short_old.id, remaining)
+
+    def test_deletes_attachments_and_invalidates_history_once_per_chat(self):
+        attachment = Attachment.objects.create(
+            chat=self.chat, uploader=self.user, name='a.txt',
+            content_type='text/plain', size=1, completed=True)
+        self._message(self.chat, 40, attachment=attachment)
+        self._message(self.chat, 41)
+
+        with mock.patch.object(retention, 'invalidate_history') as invalidate:
+            retention.prune()
+
+        invalidate.assert_called_once_with(self.chat.id)
+        self.assertFalse(Attachment.objects.filter(id=attachment.id).exists())
+
+    def test_interrupted_pass_is_continued(self):
+        messages = [self._message(self.chat, 40) for _ in range(5)]
+
+        progress = retention.prune(batch_size=2, max_batches=1)
+
+        self.assertIsNone(progress.finished)
+        self.assertEqual(progress.last_id, messages[1].id)
+        self.assertEqual(Message.objects.count(), 3)
+
+        newer = self._message(self.chat, 50)
+        progress = retention.prune(batch_size=2)
+
+        self.assertIsNotNone(progress.finished)
+        self.assertEqual(progress.deleted, 5)
+        self.assertEqual(RetentionProgress.objects.count(), 1)
+        # Messages added during a pass are left to the next pass.
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [newer.id])
+
+    def test_pass_skips_recent_messages(self):
+        """Test that windows start at expired messages and end the pass early."""
+        recent = [self._message(self.chat, 1) for _ in range(3)]
+        old = self._message(self.chat, 40)
+        newest = [self._message(self.chat, 1) for _ in range(3)]
+        windows = []
+
+        with mock.patch.object(retention.time, 'sleep') as sleep:
+            progress = retention.prune(
+                batch_size=2, pause=1,
+                report=lambda progress, result: windows.append(result.deleted))
+
+        self.assertEqual(windows, [1])
+        sleep.assert_called_once_with(1)
+        self.assertEqual(progress.last_id, newest[-1].id)
+        self.assertFalse(Message.objects.filter(id=old.id).exists())
+        self.assertEqual(Message.objects.count(), len(recent) + len(newest))
+
+    @override_settings(CHAT_RETENTION={'days': None, 'pause': 0})
+    def test_no_policy_keeps_everything(self):
+        self._message(self.chat, 4000)
+
+        progress = retention.prune()
+
+        self.assertIsNotNone(progress.finished)
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_command(self):
+        self._message(self.chat, 40)
+        self._message(self.chat, 1)
+
+        stdout = StringIO()
+        call_command('prune_messages', '--dry-run', stdout=stdout)
+        self.assertIn('1 messages are past their retention.', stdout.getvalue())
+
+        stdout = StringIO()
+        call_command('prune_messages', '--days', '0', stdout=stdout)
+        self.assertEqual(Message.objects.count(), 2)
+
+        stdout = StringIO()
+        call_command('prune_messages', stdout=stdout)
+        self.assertIn('Finished retention pass: deleted 1 messages', stdout.getvalue())
+        self.assertEqual(Message.objects.count(), 1)
@@ -0,0 +1,102 @@
+"""
+Tests for the seed_chat_data command.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from rooms.models import Message, PersonalChatRoom
+from rooms.seeding import SeedConfig, hash_passwords, messages_per_chat
+
+User = get_user_model()
+
+
+class DistributionTest(SimpleTestCase):
+    """
+    Test the dataset distributions.
+    """
+
+    def test_messages_per_chat_adds_up(self):
+        counts = messages_per_chat(1000, 50, random.Random(1))
+
+        self.assertEqual(sum(counts), 1000)
+        self.assertGreater(max(counts), 1000 / 50)
+
+    def test_pool_hashes_have_their_own_salt(self):
+        config = SeedConfig(users=3, hash_mode='pool', processes=2)
+
+        hashes = hash_passwords(config)
+
+        self.assertEqual(len(set(hashes)), 3)
+
+
+class SeedChatDataTest(TestCase):
+    """
+    Test seeding users, chats and messages.
+    """
+
+    def _seed(self, *args):
+        stdout = StringIO()
+        call_command(
+            'seed_chat_data',
+            '--users', '10',
+            '--chats', '8',
+            '--messages', '300',
+            '--days', '2',
+            '--until', '2024-06-01T12:00:00',
+            '--prefix', 'seedtest',
+            *args,
+            stdout=stdout,
+        )
+        return json.loads(stdout.getvalue())
+
+    def test_seed(self):
+        report = self._seed()
+
+        self.assertEqual(report['users'], 10)
+        self.assertEqual(report['chats'], 8)
+        self.assertEqual(report['messages'], 300)
+        self.assertIn('total_seconds', report)
+        self.assertEqual(
+            User.objects.filter(username__startswith='seedtest').count(), 10)
+        self.assertEqual(Message.objects.count(), 300)
+
+        # Ids follow the timestamps across chats, like live traffic.
+        timestamps = list(
+            Message.objects.order_by('id').values_list('timestamp', flat=True))
+        self.assertEqual(timestamps, sorted(timestamps))
+
+        user = User.objects.get(username='seedtest0')
+        self.assertTrue(user.check_password('seed-password'))
+
+        end = datetime(2024, 6, 1, 12)
+        for chat in PersonalChatRoom.objects.all():
+            participants = set(chat.participants.values_list('id', flat=True))
+            self.assertEqual(len(participants), 2)
+            messages = list(
+                Message.objects.filter(chat=chat).order_by('id')
+                .values_list('sender_id', 'timestamp'))
+            self.assertEqual(
+                [timestamp for _, timestamp in messages],
+                sorted(timestamp for _, timestamp in messages))
+            for sender_id, timestamp in messages:
+                self.assertIn(sender_id, participants)
+                self.assertLessEqual(timestamp, end)
+                self.assertGreaterEqual(timestamp, end - timedelta(days=2))
+
+    def test_same_seed_same_data(self):
+        self._seed()
+        first = list(Message.objects.order_by('id').values_list(
+            'content', 'timestamp'))
+
+        self._seed('--reset')
+        second = list(Message.objects.order_by('id').values_list(
+            'content', 'timestamp'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(PersonalChatRoom.objects.count(), 8)
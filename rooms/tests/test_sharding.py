@@ -0,0 +1,147 @@
+"""
+Tests for sharded public room groups.
+"""
+import asyncio
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from rooms import sharding
+from rooms.redis_groups import RedisGroups
+from rooms.consumers import PublicRoomConsumer
+
+
+@override_settings(CHAT_SHARD_THRESHOLD=4, CHAT_SHARD_COUNT=4)
+class RoomViewTest(SimpleTestCase):
+    """
+    Test the sharding decision and broadcast targets of a room.
+    """
+
+    def test_shard_group_is_stable(self):
+        group = sharding.shard_group('chat_big', 'specific.abc!def')
+
+        self.assertEqual(group, sharding.shard_group('chat_big', 'specific.abc!def'))
+        self.assertIn(group, sharding.shard_groups('chat_big'))
+
+    async def test_room_is_sharded_past_threshold(self):
+        layer = InMemoryChannelLayer()
+        view = sharding.RoomView('chat_big')
+        for index in range(3):
+            await layer.group_add('chat_big', f'specific.{index}')
+
+        await view.refresh(layer)
+        self.assertEqual(view.occupancy, 3)
+        self.assertFalse(view.sharded)
+        self.assertEqual(view.targets, ['chat_big'])
+
+        await layer.group_add('chat_big.s1', 'specific.3')
+        await view.refresh(layer)
+        self.assertEqual(view.occupancy, 4)
+        self.assertTrue(view.sharded)
+        self.assertEqual(
+            view.targets, ['chat_big'] + sharding.shard_groups('chat_big'))
+        self.assertIn(view.member_group('specific.9'), sharding.shard_groups('chat_big'))
+
+    async def test_room_stays_sharded_above_half_threshold(self):
+        layer = InMemoryChannelLayer()
+        view = sharding.RoomView('chat_big')
+        await layer.group_add('chat_big.s0', 'specific.0')
+        await layer.group_add('chat_big.s2', 'specific.1')
+
+        await view.refresh(layer)
+        self.assertTrue(view.sharded)
+
+        await layer.group_discard('chat_big.s2', 'specific.1')
+        await view.refresh(layer)
+        self.assertFalse(view.sharded)
+        self.assertEqual(
+            view.targets, ['chat_big'] + sharding.shard_groups('chat_big'))
+
+        await layer.group_discard('chat_big.s0', 'specific.0')
+        await view.refresh(layer)
+        self.assertEqual(view.targets, ['chat_big'])
+
+    async def test_unknown_layer_falls_back(self):
+        view = await sharding.RoomView('chat_big').refresh(object(), fallback=7)
+
+        self.assertEqual(view.occupancy, 7)
+        self.assertEqual(view.targets, ['chat_big'])
+
+
+@override_settings(
+    CHAT_SHARD_THRESHOLD=2,
+    CHAT_SHARD_COUNT=4,
+    CHAT_SHARD_REFRESH=0,
+    CHAT_HEARTBEAT_INTERVAL=0.05,
+    CHAT_IDLE_TIMEOUT=60,
+)
+class ShardedRoomTest(SimpleTestCase):
+    """
+    Test broadcasting in a sharded room through the channel layer.
+    """
+
+    async def _connect(self):
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(application, "/ws/chat/sharded/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _receive(self, communicator, key):
+        while True:
+            frame = await communicator.receive_json_from()
+            if key in frame:
+                return frame
+
+    async def test_broadcast_reaches_all_shards(self):
+        layer = get_channel_layer()
+        await layer.flush()
+        communicators = [await self._connect() for _ in range(3)]
+
+        # Every shard gets broadcasts, so the last member may also see
+        # the count sent as the second one joined.
+        count = await self._receive(communicators[2], 'user_count')
+        if count['user_count'] == 2:
+            count = await self._receive(communicators[2], 'user_count')
+        self.assertEqual(count['user_count'], 3)
+
+        # Members who joined before the room was sharded move to their
+        # shard on the next heartbeat.
+        await asyncio.sleep(0.3)
+        groups = ['chat_sharded'] + sharding.shard_groups('chat_sharded')
+        sizes = await sharding.group_sizes(layer, groups)
+        self.assertEqual(sizes[0], 0)
+        self.assertEqual(sum(sizes), 3)
+
+        await communicators[0].send_json_to(
+            {'message': 'to everyone', 'username': 'someone'})
+        for communicator in communicators:
+            frame = await self._receive(communicator, 'message')
+            self.assertEqual(frame['message'], 'to everyone')
+
+        for communicator in communicators:
+            await communicator.disconnect()
+
+    def test_redis_layer_version_is_checked(self):
+        layer = get_channel_layer()
+
+        self.assertTrue(RedisGroups.supports(layer))
+        with mock.patch('channels_redis.__version__', '5.0.0'):
+            self.assertFalse(RedisGroups.supports(layer))
+        self.assertFalse(RedisGroups.supports(InMemoryChannelLayer()))
+
+    @override_settings(CHAT_HEARTBEAT_INTERVAL=25)
+    async def test_stale_members_are_not_counted(self):
+        layer = InMemoryChannelLayer(group_expiry=100)
+        await layer.group_add('chat_stale', 'specific.live')
+        await layer.group_add('chat_stale', 'specific.dead')
+        layer.groups['chat_stale']['specific.dead'] -= 60
+
+        self.assertEqual(await sharding.group_sizes(layer, ['chat_stale']), [1])
@@ -0,0 +1,77 @@
+"""
+Tests for the ASGI entry points and their cold start profile.
+"""
+import subprocess
+import sys
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from rooms import startup
+
+SAMPLE = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     encodings.idna
+import time:       300 |        420 |   socket
+import time:      1000 |       1420 | chat.asgi
+'''
+
+
+def loaded_modules(module):
+    """Return the modules loaded by importing `module` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, '-c', f'import sys, {module}; print(" ".join(sys.modules))'],
+        env=startup._environment(), capture_output=True, text=True,
+        cwd=settings.BASE_DIR, check=True)
+    return set(result.stdout.split())
+
+
+class EntryPointTest(SimpleTestCase):
+    """
+    Test that the entry points import on their own, as under Daphne.
+    """
+
+    def test_asgi_sets_up_django_first(self):
+        self.assertIn('rooms.consumers', loaded_modules('chat.asgi'))
+
+    def test_realtime_worker_is_slim(self):
+        modules = loaded_modules('chat.realtime_asgi')
+
+        self.assertIn('rooms.consumers', modules)
+        for module in ('django.contrib.admin', 'django.contrib.messages',
+                       'django.contrib.staticfiles', 'rooms.views'):
+            self.assertNotIn(module, modules)
+
+
+class StartupProfileTest(SimpleTestCase):
+    """
+    Test the import time profile and the time to first WebSocket.
+    """
+
+    def test_parse_importtime(self):
+        records = startup.parse_importtime(SAMPLE)
+
+        self.assertEqual(
+            [(r.module, r.self_us, r.cumulative_us, r.depth) for r in records],
+            [('encodings.idna', 120, 120, 2), ('socket', 300, 420, 1),
+             ('chat.asgi', 1000, 1420, 0)])
+
+    def test_preloaded_modules_are_reported_apart(self):
+        result = startup.import_profile('json', preload=('socket',), top=3)
+
+        self.assertEqual(result['module'], 'json')
+        self.assertGreater(result['preload_ms'], 0)
+        self.assertNotIn('socket', [s['module'] for s in result['slowest']])
+        self.assertIn('json', result['packages'])
+        self.assertLessEqual(len(result['slowest']), 3)
+
+    def test_command_reports_first_websocket(self):
+        stdout = StringIO()
+
+        call_command(
+            'profile_startup', 'chat.realtime_asgi', '--first-websocket', '1',
+            '--top', '5', stdout=stdout)
+
+        self.assertIn('"first_websocket_ms"', stdout.getvalue())
+        self.assertIn('"module": "chat.realtime_asgi"', stdout.getvalue())
@@ -0,0 +1,222 @@
+"""
+Test durable delivery through Redis Streams. Needs the Redis server
+of the channel layer.
+"""
+import asyncio
+import functools
+
+import redis
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from rooms import streams
+from rooms.consumers import PersonalChatConsumer, PublicRoomConsumer
+from rooms.models import PersonalChatRoom
+
+User = get_user_model()
+
+STREAMS = {
+    'enabled': True,
+    'url': 'redis://redis:6379/2',
+    'maxlen': 1000,
+    'read_count': 2,
+    'ttl': 60,
+}
+
+
+def holding_clients(test):
+    """Run an async test holding the stream clients, as consumers do."""
+    @functools.wraps(test)
+    async def wrapper(self):
+        streams.hold_clients()
+        try:
+            await test(self)
+        finally:
+            await streams.release_clients()
+    return wrapper
+
+
+@override_settings(CHAT_STREAMS=STREAMS)
+class StreamsTest(TestCase):
+    """
+    Test appending to and reading from room streams.
+    """
+
+    def setUp(self):
+        redis.Redis.from_url(STREAMS['url']).flushdb()
+
+    @holding_clients
+    async def test_read_after_offset(self):
+        self.assertEqual(await streams.last_offset('room'), streams.START)
+        first = await streams.publish('room', {'type': 'chat_message', 'n': 1})
+        second = await streams.publish('room', {'type': 'chat_message', 'n': 2})
+
+        self.assertEqual(await streams.last_offset('room'), second)
+        self.assertEqual(
+            await streams.read_after('room', first),
+            [(second, {'type': 'chat_message', 'n': 2})])
+        self.assertEqual(await streams.read_after('room', second), [])
+        self.assertTrue(await streams.is_retained('room', first))
+
+    @holding_clients
+    async def test_trimmed_offset_is_not_retained(self):
+        await streams.publish('room', {'type': 'chat_message'})
+        await streams.get_client().xtrim(streams.stream_key('room'), maxlen=0)
+        await streams.publish('room', {'type': 'chat_message'})
+
+        self.assertFalse(await streams.is_retained('room', '1-0'))
+
+    @holding_clients
+    async def test_streams_expire(self):
+        await streams.publish('room', {'type': 'chat_message'})
+
+        ttl = await streams.get_client().ttl(streams.stream_key('room'))
+        self.assertTrue(0 < ttl <= 60)
+
+    async def test_clients_are_closed_when_released(self):
+        loop = asyncio.get_running_loop()
+        streams.hold_clients()
+        streams.hold_clients()
+        client = streams.get_client()
+        await client.ping()
+
+        await streams.release_clients()
+        self.assertIs(streams.get_client(), client)
+        await streams.release_clients()
+
+        self.assertNotIn(loop, streams._clients)
+        self.assertIsNot(streams.get_client(), client)
+        await streams.release_clients()
+
+    def test_parse_offset(self):
+        self.assertEqual(streams.parse_offset('1700000000000-3'), '1700000000000-3')
+        self.assertIsNone(streams.parse_offset('$'))
+        self.assertIsNone(streams.parse_offset(None))
+
+
+@override_settings(CHAT_STREAMS=STREAMS)
+class PublicRoomStreamTest(TestCase):
+    """
+    Test public room delivery and resume through the room stream.
+    """
+
+    def setUp(self):
+        redis.Redis.from_url(STREAMS['url']).flushdb()
+
+    async def _connect(self, query=''):
+        application = URLRouter([
+            path("ws/chat/<str:room_name>/", PublicRoomConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/streamed/{query}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _messages(self, communicator, count):
+        messages = []
+        while len(messages) < count:
+            frame = await communicator.receive_json_from()
+            if 'message' in frame:
+                messages.append(frame)
+        return messages
+
+    async def test_messages_carry_offsets_and_resume(self):
+        communicator = await self._connect()
+        for text in ('one', 'two', 'three'):
+            await communicator.send_json_to(
+                {'message': text, 'username': 'someone'})
+        frames = await self._messages(communicator, 3)
+
+        self.assertEqual(
+            [frame['message'] for frame in frames], ['one', 'two', 'three'])
+        self.assertEqual(
+            len({frame['offset'] for frame in frames}), 3)
+        await communicator.disconnect()
+
+        communicator = await self._connect(f"?offset={frames[0]['offset']}")
+        resumed = await self._messages(communicator, 2)
+
+        self.assertEqual(
+            [frame['message'] for frame in resumed], ['two', 'three'])
+        self.assertEqual(resumed[-1]['offset'], frames[-1]['offset'])
+        await communicator.disconnect()
+
+    async def test_lost_notification_is_caught_up(self):
+        communicator = await self._connect()
+        await communicator.receive_json_from()
+        await streams.publish('chat_streamed', {
+            'type': 'chat_message',
+            'message': 'unannounced',
+            'username': 'someone',
+            'trace_id': 'a' * 32,
+            'received_at': 0,
+            'broadcast_at': 0,
+        })
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_json_to(
+            {'message': 'announced', 'username': 'someone'})
+        frames = await self._messages(communicator, 2)
+
+        self.assertEqual(
+            [frame['message'] for frame in frames], ['unannounced', 'announced'])
+        await communicator.disconnect()
+
+
+@override_settings(CHAT_STREAMS=STREAMS)
+class PersonalChatStreamTest(TestCase):
+    """
+    Test personal chat delivery through the chat stream.
+    """
+
+    def setUp(self):
+        redis.Redis.from_url(STREAMS['url']).flushdb()
+        self.user = User.objects.create_user(
+            username='streamuser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='streamuser2', password='testpassword2')
+        self.outsider = User.objects.create_user(
+            username='streamuser3', password='testpassword3')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+
+    async def _connect(self, user, query='', accepted=True):
+        application = URLRouter([
+            path("ws/chat/<int:chat_id>", PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}{query}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertEqual(connected, accepted)
+        return communicator
+
+    async def test_trimmed_offset_resumes_incomplete(self):
+        communicator = await self._connect(self.user)
+        await communicator.send_json_to({'message': 'hello'})
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame['message'], 'hello')
+        await communicator.disconnect()
+
+        communicator = await self._connect(self.user2, '?offset=0-1')
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'resume')
+        self.assertFalse(response['complete'])
+        resumed = await communicator.receive_json_from()
+        self.assertEqual(resumed['id'], frame['id'])
+        await communicator.disconnect()
+
+    async def test_non_participant_cannot_read_the_stream(self):
+        communicator = await self._connect(self.user)
+        await communicator.send_json_to({'message': 'private'})
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        await self._connect(self.outsider, '?offset=0-0', accepted=False)
+        await self._connect(AnonymousUser(), '?offset=0-0', accepted=False)
@@ -0,0 +1,199 @@
+"""
+Test the typing indicators.
+"""
+import asyncio
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path
+
+from chat import metrics
+from rooms.consumers import PersonalChatConsumer
+from rooms.models import Message, PersonalChatRoom
+from rooms.typing_indicators import (
+    WORKER_ID,
+    RoomTypers,
+    TypingIndicators,
+    TypingThrottle,
+    room_typers,
+)
+
+User = get_user_model()
+
+
+class TypingThrottleTest(SimpleTestCase):
+    """
+    Test the per-connection throttle of typing frames.
+    """
+
+    def test_starts_are_throttled(self):
+        throttle = TypingThrottle(interval=3)
+
+        self.assertTrue(throttle.start(now=10))
+        self.assertFalse(throttle.start(now=11))
+        self.assertTrue(throttle.start(now=13))
+
+    def test_stop_only_after_start(self):
+        throttle = TypingThrottle(interval=3)
+
+        self.assertFalse(throttle.stop())
+        throttle.start(now=10)
+        self.assertTrue(throttle.stop())
+        self.assertFalse(throttle.stop())
+        self.assertFalse(throttle.start(now=11))
+
+
+class RoomTypersTest(SimpleTestCase):
+    """
+    Test merging the typers of a room on one worker into periodic events.
+    """
+
+    async def test_typers_are_merged_and_expire(self):
+        events = []
+
+        async def send(event):
+            events.append(event)
+
+        typers = RoomTypers('room', send, interval=0.01, timeout=0.05)
+        typers.update('bob', True)
+        typers.update('alice', True)
+        await asyncio.sleep(0.2)
+
+        # The list is renewed until the typers expire.
+        self.assertEqual(events[0]['users'], ['alice', 'bob'])
+        self.assertEqual(events[-1]['users'], [])
+        self.assertEqual(events[0]['worker'], WORKER_ID)
+        self.assertIsNone(typers.task)
+
+    async def test_unchanged_list_is_not_resent(self):
+        events = []
+
+        async def send(event):
+            events.append(event['users'])
+
+        typers = RoomTypers('room', send, interval=0.01, timeout=10)
+        typers.update('bob', True)
+        await asyncio.sleep(0.05)
+        typers.update('bob', False)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(events, [['bob'], []])
+
+    async def test_one_task_per_room(self):
+        async def send(event):
+            pass
+
+        first = room_typers('room', send)
+        first.update('bob', True)
+        room_typers('room', send).update('alice', True)
+
+        self.assertIs(room_typers('room'), first)
+        self.assertIsNone(room_typers('other'))
+        first.task.cancel()
+
+
+class TypingIndicatorsTest(SimpleTestCase):
+    """
+    Test merging the typers of the workers for one connection.
+    """
+
+    async def test_workers_are_merged(self):
+        frames = []
+
+        async def send(users):
+            frames.append(users)
+
+        indicators = TypingIndicators(send)
+        expires = time.time() + 10
+        await indicators.update('a', ['bob'], expires)
+        await indicators.update('b', ['alice', 'me'], expires, exclude='me')
+        await indicators.update('b', ['alice', 'me'], expires, exclude='me')
+        await indicators.remove('bob', exclude='me')
+        await indicators.update('b', [], expires)
+
+        self.assertEqual(frames, [['bob'], ['alice', 'bob'], ['alice'], []])
+
+    async def test_silent_worker_expires(self):
+        frames = []
+
+        async def send(users):
+            frames.append(users)
+
+        indicators = TypingIndicators(send)
+        await indicators.update('a', ['bob'], time.time() - 1)
+
+        self.assertEqual(frames, [])
+
+
+@override_settings(CHAT_TYPING_INTERVAL=0.01, CHAT_TYPING_TIMEOUT=5)
+class TypingConsumerTest(TestCase):
+    """
+    Test typing frames going through the personal chat consumer.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='typinguser1', password='testpassword1')
+        self.user2 = User.objects.create_user(
+            username='typinguser2', password='testpassword2')
+        self.chat = PersonalChatRoom.objects.create()
+        self.chat.participants.add(self.user, self.user2)
+
+    async def _connect(self, user):
+        application = URLRouter([
+            path("ws/chat/<int:chat_id>", PersonalChatConsumer.as_asgi()),
+        ])
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_typing_is_throttled_merged_and_not_stored(self):
+        communicator = await self._connect(self.user)
+        communicator2 = await self._connect(self.user2)
+        throttled = metrics.TYPING_EVENTS.labels(
+            'PersonalChatConsumer', 'throttled')
+        before = throttled.value
+
+        for _ in range(3):
+            await communicator.send_json_to({'type': 'typing'})
+
+        response = await communicator2.receive_json_from()
+        self.assertEqual(response, {'type': 'typing', 'users': ['typinguser1']})
+        self.assertTrue(await communicator2.receive_nothing(0.1))
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        self.assertEqual(throttled.value - before, 2)
+
+        await communicator.send_json_to({'type': 'typing', 'active': False})
+        response = await communicator2.receive_json_from()
+        self.assertEqual(response['users'], [])
+
+        self.assertFalse(await Message.objects.filter(chat=self.chat).aexists())
+
+        await communicator.disconnect()
+        await communicator2.disconnect()
+
+    async def test_message_clears_typer(self):
+        communicator = await self._connect(self.user)
+        communicator2 = await self._connect(self.user2)
+
+        await communicator.send_json_to({'type': 'typing'})
+        response = await communicator2.receive_json_from()
+        self.assertEqual(response['users'], ['typinguser1'])
+
+        await communicator.send_json_to({'message': 'done typing'})
+        frames = [
+            await communicator2.receive_json_from(),
+            await communicator2.receive_json_from(),
+        ]
+        self.assertEqual(frames[0]['message'], 'done typing')
+        self.assertEqual(frames[1], {'type': 'typing', 'users': []})
+
+        await communicator.disconnect()
+        await communicator2.disconnect()
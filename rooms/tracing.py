@@ -0,0 +1,93 @@
+"""
+End-to-end latency tracing for chat messages.
+
+Every message gets a trace id and the server time it was received at.
+The time it was handed to the channel layer is added when it is
+broadcast, and each recipient consumer records the fan-out latency when
+the event reaches it. Clients may answer with an ack frame echoing the
+trace id, which records the full receive-to-delivery latency. Times in
+frames are epoch milliseconds.
+"""
+import functools
+import socket
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+from chat import metrics
+
+MAX_PENDING_ACKS = 256
+
+
+@functools.lru_cache(maxsize=None)
+def node_name():
+    """Name of this node in the latency metrics."""
+    return getattr(settings, 'CHAT_NODE_NAME', None) or socket.gethostname()
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def start_trace():
+    """
+    Return the trace fields of a message received from a client.
+    """
+    return {
+        'trace_id': uuid.uuid4().hex,
+        'received_at': now_ms(),
+    }
+
+
+def mark_broadcast(trace):
+    """Add the broadcast time to the trace fields and return them."""
+    trace['broadcast_at'] = now_ms()
+    return trace
+
+
+def frame_fields(event):
+    """Return the trace fields of a group event to forward to clients."""
+    return {
+        'trace_id': event['trace_id'],
+        'received_at': event['received_at'],
+        'broadcast_at': event['broadcast_at'],
+    }
+
+
+class AckTracker:
+    """
+    Remember the traces recently sent on one connection so that acks
+    are measured against server times rather than client-sent values.
+    Latencies are labelled with the kind of room, not the room itself,
+    which would add histogram series for every chat.
+    """
+
+    def __init__(self, kind, maxlen=MAX_PENDING_ACKS):
+        self.kind = kind
+        self.maxlen = maxlen
+        self.pending = OrderedDict()
+
+    def delivered(self, event):
+        """
+        Record the fan-out latency of an event reaching this connection
+        and remember it until the client acks it.
+        """
+        metrics.FANOUT_SECONDS.labels(self.kind, node_name()).observe(
+            max(0.0, now_ms() - event['broadcast_at']) / 1000)
+        self.pending[event['trace_id']] = event['received_at']
+        if len(self.pending) > self.maxlen:
+            self.pending.popitem(last=False)
+
+    def acknowledge(self, trace_id):
+        """
+        Record the latency from server receipt to the client ack. Unknown
+        or repeated trace ids are ignored. Return the latency in seconds.
+        """
+        received_at = self.pending.pop(trace_id, None)
+        if received_at is None:
+            return None
+        latency = max(0.0, now_ms() - received_at) / 1000
+        metrics.DELIVERY_SECONDS.labels(self.kind, node_name()).observe(latency)
+        return latency
@@ -0,0 +1,199 @@
+"""
+Throttled, non-persistent typing indicators.
+
+Clients send `{"type": "typing"}` while the user types and
+`{"type": "typing", "active": false}` when they stop. Each connection
+may announce a start at most once per `CHAT_TYPING_THROTTLE` seconds;
+extra starts are dropped before they go any further.
+
+Each worker keeps the typers of its connections per room in
+`RoomTypers`. A single task per room sends the room's typers on this
+worker to the room group as one `typing_update` event, at most every
+`CHAT_TYPING_INTERVAL` seconds and only when the list changed, or to
+renew it. Receiving connections merge the lists of the workers and send
+a `{"type": "typing", "users": [...]}` frame when the merged list
+changes. A typer that isn't refreshed disappears after
+`CHAT_TYPING_TIMEOUT` seconds, and so does the list of a worker that
+stopped renewing it. Nothing is written to the database.
+"""
+import asyncio
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+
+
+def throttle_seconds():
+    return getattr(settings, 'CHAT_TYPING_THROTTLE', 3)
+
+
+def flush_interval():
+    return getattr(settings, 'CHAT_TYPING_INTERVAL', 1)
+
+
+def typing_timeout():
+    return getattr(settings, 'CHAT_TYPING_TIMEOUT', 5)
+
+
+def typing_frame(users):
+    return {'type': 'typing', 'users': users}
+
+
+class TypingThrottle:
+    """
+    Decide which typing frames of one connection are broadcast.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = throttle_seconds() if interval is None else interval
+        self.last_start = None
+        self.active = False
+
+    def start(self, now=None):
+        """Return True if a start should be broadcast now."""
+        now = time.monotonic() if now is None else now
+        if self.last_start is not None and now - self.last_start < self.interval:
+            return False
+        self.last_start = now
+        self.active = True
+        return True
+
+    def stop(self):
+        """
+        Return True if a stop should be broadcast, that is if the last
+        broadcast start wasn't stopped yet. The start throttle still
+        applies after a stop, so toggling can't bypass it.
+        """
+        if not self.active:
+            return False
+        self.active = False
+        return True
+
+
+class RoomTypers:
+    """
+    Typers of one room on this worker, sent to the room through
+    `send(event)` as one merged event per interval.
+    """
+
+    def __init__(self, group, send, interval=None, timeout=None):
+        self.group = group
+        self.send = send
+        self.interval = flush_interval() if interval is None else interval
+        self.timeout = typing_timeout() if timeout is None else timeout
+        self.typers = {}
+        self.sent = []
+        self.sent_at = None
+        self.task = None
+
+    def update(self, name, active):
+        """Record that a user started or stopped typing."""
+        if active:
+            self.typers[name] = time.monotonic() + self.timeout
+        elif self.typers.pop(name, None) is None:
+            return
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def current(self):
+        """Drop expired typers and return the names of the others."""
+        now = time.monotonic()
+        for name, expires in list(self.typers.items()):
+            if expires <= now:
+                del self.typers[name]
+        return sorted(self.typers)
+
+    def due(self, users):
+        if users != self.sent:
+            return True
+        # Renew the list before receivers let it expire.
+        return bool(users) and time.monotonic() - self.sent_at >= self.timeout / 2
+
+    async def run(self):
+        """
+        Send the typers every interval while anyone is typing and stop
+        once an empty list has been sent.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                users = self.current()
+                if self.due(users):
+                    self.sent, self.sent_at = users, time.monotonic()
+                    await self.send({
+                        'type': 'typing_update',
+                        'worker': WORKER_ID,
+                        'users': users,
+                        'expires': time.time() + self.timeout,
+                    })
+                if not self.typers:
+                    return
+        finally:
+            if self.task is asyncio.current_task():
+                self.task = None
+            if not self.typers:
+                rooms = _rooms.get(asyncio.get_running_loop(), {})
+                if rooms.get(self.group) is self:
+                    del rooms[self.group]
+
+
+WORKER_ID = uuid.uuid4().hex
+_rooms = weakref.WeakKeyDictionary()
+
+
+def room_typers(group, send=None):
+    """
+    Return this worker's typers of a room group. Without `send`, return
+    None rather than start tracking the room.
+    """
+    rooms = _rooms.setdefault(asyncio.get_running_loop(), {})
+    typers = rooms.get(group)
+    if typers is None and send is not None:
+        typers = rooms[group] = RoomTypers(group, send)
+    return typers
+
+
+class TypingIndicators:
+    """
+    Typers of a room as seen by one connection: the lists of the
+    workers, merged and delivered through `send(users)` on changes.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.workers = {}
+        self.sent = []
+
+    def current(self, exclude=None):
+        """Drop expired worker lists and return the merged typers."""
+        now = time.time()
+        users = set()
+        for worker, (names, expires) in list(self.workers.items()):
+            if expires <= now:
+                del self.workers[worker]
+            else:
+                users.update(names)
+        users.discard(exclude)
+        return sorted(users)
+
+    async def update(self, worker, users, expires, exclude=None):
+        """Record a worker's typers, `exclude` being the viewer's name."""
+        if users:
+            self.workers[worker] = (users, expires)
+        else:
+            self.workers.pop(worker, None)
+        await self.publish(exclude)
+
+    async def remove(self, name, exclude=None):
+        """Forget a typer, e.g. one whose message just arrived."""
+        for worker, (names, expires) in list(self.workers.items()):
+            if name in names:
+                self.workers[worker] = ([n for n in names if n != name], expires)
+        await self.publish(exclude)
+
+    async def publish(self, exclude=None):
+        users = self.current(exclude)
+        if users != self.sent:
+            self.sent = users
+            await self.send(users)
@@ -4,13 +4,17 @@ Urls for public chat room and personal chat room.
 from django.urls import path
 
 from rooms.views import (
+    AttachmentView,
     Index,
     PublicRoomView,
     PersonalChatView,
+    RoomDirectoryView,
 )
 
 urlpatterns = [
     path('', Index.as_view(), name='index'),
+    path('rooms/', RoomDirectoryView.as_view(), name='room-directory'),
     path('chat/<int:chat_id>/', PersonalChatView.as_view(), name='personal-chat'),
     path('chat/<str:room_name>/', PublicRoomView.as_view(), name='room'),
+    path('attachments/<int:attachment_id>/', AttachmentView.as_view(), name='attachment'),
 ]
@@ -2,15 +2,28 @@
 Views for lobby, public and personal chat rooms.
 """
 
+import hashlib
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.shortcuts import render, redirect
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from django.contrib.auth import get_user_model
-from django.http import Http404
-
-from rooms.models import (
-    Message,
-    PersonalChatRoom,
+from django.http import Http404, JsonResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from authentication.search import find_user
+from rooms import directory, edits
+from rooms.attachments import file_response
+from rooms.history import (
+    history_version,
+    latest_message,
+    render_history,
 )
+from rooms.models import Attachment, PersonalChatRoom
 
 User = get_user_model()
 
@@ -23,13 +36,15 @@ class Index(TemplateView):
 
     def post(self, request):
         """
-        Verify if friend exists. If have an existing chat with friend, enter the chat.
-        else, raise error 404.
+        Verify if friend exists, ignoring case. If have an existing chat with
+        friend, enter the chat. else, raise error 404.
         """
         friend = request.POST.get('friend')
 
         try:
-            other_user = User.objects.get(username=friend)
+            other_user = find_user(friend)
+            if other_user is None:
+                raise User.DoesNotExist
             chat = PersonalChatRoom.objects.filter(
                 participants=request.user
             ).filter(
@@ -51,11 +66,67 @@ class Index(TemplateView):
             return render(request, self.template_name, {'error': 'User does not exist'})
 
 
-class PublicRoomView(TemplateView):
+@lru_cache(maxsize=None)
+def page_version(template_name, static_assets):
+    """
+    Return a digest of a page's template source and of the manifest
+    names of its static assets. Both only change with a deploy, so the
+    digest is computed once per process.
+    """
+    digest = hashlib.sha256(
+        get_template(template_name).template.source.encode())
+    for name in static_assets:
+        digest.update(staticfiles_storage.url(name).encode())
+    return digest.hexdigest()[:16]
+
+
+class ConditionalPageMixin:
+    """
+    Answer GET requests with 304 when the client's validators still
+    match, without building the page. Views provide the validators with
+    `get_validators`, which must be cheaper than rendering, and list the
+    static files the page links in `static_assets` so a deploy that
+    changes the page or its assets invalidates old copies.
+    """
+    static_assets = ()
+
+    def get_validators(self, **kwargs):
+        """
+        Return `(etag_parts, last_modified)` where last_modified is an
+        epoch timestamp or None.
+        """
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        parts, last_modified = self.get_validators(**kwargs)
+        version = page_version(self.template_name, self.static_assets)
+        key = ':'.join(str(p) for p in (version, *parts))
+        etag = quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class PublicRoomView(ConditionalPageMixin, TemplateView):
     """
     View for the public room.
     """
     template_name = 'chat/public-room.html'
+    static_assets = ('css/base-room-style.css',)
+
+    def get_validators(self, room_name):
+        """
+        The public room page only depends on the room name.
+        """
+        return ('public', room_name), None
 
     def get_context_data(self, room_name):
         context = {
@@ -64,37 +135,57 @@ class PublicRoomView(TemplateView):
         return context
 
 
-class PersonalChatView(TemplateView):
+class PersonalChatView(ConditionalPageMixin, TemplateView):
     """
     View for personal chat.
     """
     template_name = 'chat/personal-chat.html'
+    static_assets = ('css/base-room-style.css',)
 
     def dispatch(self, request, *args, **kwargs):
         """
-        ]Validate if the user is authenticated and if the user 
+        Validate if the user is authenticated and if the user
         is one of the chat participants.
         """
 
         if not request.user.is_authenticated:
             raise Http404()
 
-        chat = PersonalChatRoom.objects.get(id=kwargs['chat_id'])
-        participants = [p.username for p in chat.participants.all()]
-
-        if not request.user.username in participants:
+        is_participant = PersonalChatRoom.participants.through.objects.filter(
+            personalchatroom_id=kwargs['chat_id'],
+            user_id=request.user.id,
+        ).exists()
+        if not is_participant:
             raise Http404()
 
         return super().dispatch(request, *args, **kwargs)
 
+    def get_validators(self, chat_id):
+        """
+        Derive the validators from the latest message, the history
+        version (changed by edits and deletes) and the viewer.
+        """
+        latest_id, latest_timestamp = latest_message(chat_id)
+        version = history_version(chat_id)
+
+        last_modified = version / 1e9
+        if latest_timestamp is not None:
+            last_modified = max(
+                last_modified,
+                latest_timestamp.replace(tzinfo=timezone.utc).timestamp(),
+            )
+        return (
+            ('personal', chat_id, latest_id, version, self.request.user.id),
+            int(last_modified),
+        )
+
     def get_context_data(self, chat_id, **kwargs):
         """
-        Retrieve the chat messages and send the context.
+        Retrieve the rendered chat history and send the context.
         """
         context = super().get_context_data(**kwargs)
 
         chat = PersonalChatRoom.objects.get(id=chat_id)
-        messages = Message.objects.filter(chat=chat)
         participants = chat.participants.all()
 
         friend = next((
@@ -102,11 +193,47 @@ class PersonalChatView(TemplateView):
             if p.username != self.request.user.username
         )
         )
+        # Changes made while the history renders are resumed too.
+        changed_since = edits.to_ms(datetime.now()) - edits.CHANGE_MARGIN_MS
         context.update({
             'chat': chat,
-            'messages': messages,
+            'history': render_history(chat, self.request.user),
+            'changed_since': changed_since,
             'chat_id': chat_id,
             'friend': friend,
         })
 
         return context
+
+
+class AttachmentView(View):
+    """
+    Download of a personal chat attachment, for the chat participants.
+    """
+
+    def get(self, request, attachment_id):
+        if not request.user.is_authenticated:
+            raise Http404()
+
+        attachment = Attachment.objects.filter(
+            id=attachment_id,
+            completed=True,
+            chat__participants=request.user,
+        ).first()
+        if attachment is None:
+            raise Http404()
+
+        return file_response(request, attachment)
+
+
+class RoomDirectoryView(View):
+    """
+    The most occupied public rooms, from the worker's directory
+    snapshot. `limit` caps the number of rooms listed.
+    """
+
+    def get(self, request):
+        limit = directory.config()['top']
+        if request.GET.get('limit', '').isdigit():
+            limit = min(int(request.GET['limit']), limit)
+        return JsonResponse({'rooms': directory.room_directory.top(limit)})